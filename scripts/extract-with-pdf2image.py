@@ -5,71 +5,219 @@ This should work better than pdfjs-dist for rendering
 """
 import sys
 import os
+import argparse
 from pathlib import Path
 
+# Shared extractor helpers live in scripts/utilities
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'utilities'))
+
 try:
     from pdf2image import convert_from_path
     from PIL import Image
     import pytesseract
+    import fitz  # PyMuPDF, for the blank-page pre-filter
+    import numpy  # used by the shared page_ocr helpers
 
     # Configure Tesseract path for Windows
     pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 except ImportError as e:
     print(f"[ERROR] Missing dependencies: {e}")
     print("\nInstall with:")
-    print("   pip install pdf2image Pillow pytesseract")
+    print("   pip install pdf2image Pillow pytesseract pymupdf numpy")
     print("\nAlso need poppler:")
     print("   Download from: https://github.com/oschwartz10612/poppler-windows/releases/")
     print("   Extract and add to PATH")
     sys.exit(1)
 
-def extract_with_ocr(pdf_path, start_page=1, end_page=None, output_file="extracted-ocr.txt"):
-    """Extract text using pdf2image + Tesseract OCR"""
+from extraction_metrics import add_metrics_args, metrics, metrics_from_args
+from ocr_cache import OcrCache, add_cache_args, cache_from_args
+from ocr_engine import get_engine
+from page_ocr import (
+    ADAPTIVE_KEY, ADAPTIVE_ZOOMS, AdaptiveStats,
+    adaptive_decision, adaptive_ocr, blank_page_reason
+)
+
+POPPLER_PATH = r'C:\Users\vihaa\poppler\poppler-24.08.0\Library\bin'
+OCR_DPI = 200  # Good balance of quality and speed
+OCR_CONFIG = '--psm 6'
+# Adaptive ladder for poppler renders: its top rung is OCR_DPI, so no page
+# costs more than in the fixed-DPI mode
+ADAPTIVE_PAGE_ZOOMS = ADAPTIVE_ZOOMS[:-1] + (OCR_DPI / 72,)
+
+def missing_page_runs(pages, max_len):
+    """Group sorted page numbers into contiguous (first, last) runs of at most max_len pages"""
+    runs = []
+    for page in pages:
+        if runs and runs[-1][1] == page - 1 and runs[-1][1] - runs[-1][0] + 1 < max_len:
+            runs[-1][1] = page
+        else:
+            runs.append([page, page])
+    return runs
+
+def page_range(pdf_path, start_page=1, end_page=None):
+    """(start_page, end_page) with end_page defaulted and clamped to the PDF's last page, as poppler did"""
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    return start_page, page_count if end_page is None else min(end_page, page_count)
+
+def adaptive_page_ocr(pdf_path, page, image):
+    """
+    Adaptive-resolution OCR of one page rendered at the lowest adaptive zoom
+    Higher zooms are rendered through poppler only if the page needs them
+    Returns (text, info) as page_ocr.adaptive_ocr does
+    """
+    renders = {ADAPTIVE_ZOOMS[0]: image}
+
+    def render(zoom, clip):
+        full = renders.get(zoom)
+        if full is None:
+            with metrics.span('render'):
+                full = renders[zoom] = convert_from_path(
+                    pdf_path,
+                    first_page=page,
+                    last_page=page,
+                    dpi=round(72 * zoom),
+                    fmt='png',
+                    poppler_path=POPPLER_PATH
+                )[0]
+        if clip is None:
+            return full
+        width, height = full.size
+        x0, y0, x1, y1 = (round(v * zoom) for v in clip)
+        return full.crop((max(0, x0), max(0, y0), min(width, x1), min(height, y1)))
+
+    try:
+        text, info = adaptive_ocr(render, zooms=ADAPTIVE_PAGE_ZOOMS, config=OCR_CONFIG)
+    finally:
+        for zoom, full in renders.items():
+            if full is not image:
+                full.close()
+
+    scale = OCR_DPI / (72 * ADAPTIVE_ZOOMS[0])
+    info['fixed_pixels'] = int(image.size[0] * scale) * int(image.size[1] * scale)
+    return text, info
+
+def extract_with_ocr(pdf_path, start_page=1, end_page=None, output_file="extracted-ocr.txt", cache=None, window=1,
+                     adaptive=False, skip_blank=True):
+    """
+    Extract text using pdf2image + Tesseract OCR
+    Pages are rendered `window` at a time and appended to output_file as soon
+    as they are OCRed, so memory stays flat regardless of page count
+    adaptive: render at low DPI first and re-render only low-confidence pages/lines
+    skip_blank: never render or OCR pages the blank-page pre-filter rejects
+    """
     print(f"\nExtracting from: {Path(pdf_path).name}")
     print("="*70)
-    print(f"Method: pdf2image (poppler) + Tesseract OCR")
+    print(f"Method: pdf2image (poppler) + Tesseract OCR ({get_engine().name})")
     print(f"Pages: {start_page} to {end_page or 'end'}\n")
 
+    if cache is None:
+        cache = OcrCache(enabled=False)
+    render_key = f"pdf2image {ADAPTIVE_KEY} max_dpi={OCR_DPI}" if adaptive else f"pdf2image dpi={OCR_DPI}"
+    render_dpi = round(72 * ADAPTIVE_ZOOMS[0]) if adaptive else OCR_DPI
+    adaptive_stats = AdaptiveStats()
+
     try:
-        # Convert PDF pages to images
-        print("Converting PDF to images...")
-        poppler_path = r'C:\Users\vihaa\poppler\poppler-24.08.0\Library\bin'
-        images = convert_from_path(
-            pdf_path,
-            first_page=start_page,
-            last_page=end_page,
-            dpi=200,  # Good balance of quality and speed
-            fmt='png',
-            poppler_path=poppler_path
-        )
-        print(f"[OK] Converted {len(images)} pages to images\n")
-
-        all_text = []
-        for i, image in enumerate(images, start=start_page):
-            print(f"[Page {i}] Running OCR...")
-
-            # Run Tesseract OCR
-            text = pytesseract.image_to_string(image, config='--psm 6')
-
-            char_count = len(text.strip())
-            if char_count > 0:
-                print(f"  [OK] Extracted {char_count} characters")
-                all_text.append(f"\n\n--- Page {i} ---\n\n{text}")
-            else:
-                print(f"  [BLANK] No text found")
-
-        # Save results
-        result = ''.join(all_text)
+        start_page, end_page = page_range(pdf_path, start_page, end_page)
+
+        # Blank/no-text pages are found from the PDF itself, before poppler renders anything
+        blank_pages = set()
+        if skip_blank:
+            with fitz.open(pdf_path) as doc:
+                for i in range(start_page, end_page + 1):
+                    reason = blank_page_reason(doc[i - 1])
+                    if reason:
+                        print(f"[BLANK] Page {i}: skipped before OCR ({reason})")
+                        blank_pages.add(i)
+
+        # Look up every page first so only uncached pages get rendered
+        texts = {i: "" for i in blank_pages}
+        keys = {}
+        for i in range(start_page, end_page + 1):
+            if i in blank_pages:
+                continue
+            keys[i] = cache.key(pdf_path, i - 1, render_key, OCR_CONFIG) if cache.enabled else None
+            cached = cache.get(keys[i])
+            if cached is not None:
+                texts[i] = cached
+
+        missing = [i for i in range(start_page, end_page + 1) if i not in texts]
+        runs = {first: last for first, last in missing_page_runs(missing, max(1, window))}
+        print(f"[CACHE] {len(texts) - len(blank_pages)} pages cached, {len(missing)} to OCR\n")
+
+        total_chars = 0
+        preview = ""
         with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(result)
+            i = start_page
+            while i <= end_page:
+                if i in texts:
+                    page_texts = [(i, texts.pop(i))]
+                    next_page = i + 1
+                else:
+                    # Convert only this window of pages to images
+                    last = runs[i]
+                    next_page = last + 1
+                    with metrics.span('render'):
+                        images = convert_from_path(
+                            pdf_path,
+                            first_page=i,
+                            last_page=last,
+                            dpi=render_dpi,
+                            fmt='png',
+                            poppler_path=POPPLER_PATH
+                        )
+
+                    page_texts = []
+                    for offset in range(len(images)):
+                        print(f"[Page {i + offset}] Running OCR...")
+                        metrics.begin_page(pdf_path, i + offset - 1)
+
+                        # Run Tesseract OCR, then free the image before the next page
+                        if adaptive:
+                            text, info = adaptive_page_ocr(pdf_path, i + offset, images[offset])
+                            print(f"  OCR at {adaptive_decision(info)}")
+                            adaptive_stats.add(info)
+                        else:
+                            text = get_engine().image_to_string(images[offset], config=OCR_CONFIG)
+                        images[offset].close()
+                        images[offset] = None
+
+                        if text:
+                            cache.put(keys[i + offset], text)
+                        page_texts.append((i + offset, text))
+                    metrics.end_page()
+                    del images
+
+                for page, text in page_texts:
+                    char_count = len(text.strip())
+                    if char_count > 0:
+                        print(f"  [OK] Page {page}: extracted {char_count} characters")
+                        chunk = f"\n\n--- Page {page} ---\n\n{text}"
+                        with metrics.span('write'):
+                            f.write(chunk)
+                        total_chars += len(chunk)
+                        if len(preview) < 500:
+                            preview += chunk[:500 - len(preview)]
+                    elif page not in blank_pages:
+                        print(f"  [BLANK] Page {page}: no text found")
+
+                # Make each page visible on disk as soon as it is done
+                with metrics.span('write'):
+                    f.flush()
+                i = next_page
+        metrics.add_bytes(os.path.getsize(output_file))
 
         print(f"\n[SUCCESS] Saved to: {output_file}")
-        print(f"[STATS] Total characters: {len(result)}")
+        print(f"[STATS] Total characters: {total_chars}")
+        print(f"[STATS] Skipped as blank before rendering: {len(blank_pages)}")
+        print(f"[STATS] {cache.summary()}")
+        if adaptive:
+            print(f"[STATS] {adaptive_stats.summary(f'{OCR_DPI} DPI')}")
 
-        if result:
+        if preview:
             print(f"\n[PREVIEW] First 500 characters:")
             print("-"*70)
-            print(result[:500])
+            print(preview)
             print("-"*70)
         else:
             print("\n[WARNING] No text extracted - all pages are blank or images")
@@ -79,19 +227,32 @@ def extract_with_ocr(pdf_path, start_page=1, end_page=None, output_file="extract
         sys.exit(1)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("USAGE: python extract-with-pdf2image.py <PDF> [START] [END] [OUTPUT]")
-        print("\nExample:")
-        print('  python extract-with-pdf2image.py "document.pdf" 1 10 output.txt')
-        sys.exit(1)
-
-    pdf_path = sys.argv[1]
-    start = int(sys.argv[2]) if len(sys.argv) > 2 else 1
-    end = int(sys.argv[3]) if len(sys.argv) > 3 else None
-    output = sys.argv[4] if len(sys.argv) > 4 else "extracted-ocr.txt"
+    parser = argparse.ArgumentParser(
+        description="Extract text from a PDF with pdf2image + Tesseract OCR",
+        epilog='Example: python extract-with-pdf2image.py "document.pdf" 1 10 output.txt'
+    )
+    parser.add_argument('pdf', help="PDF to extract")
+    parser.add_argument('start', nargs='?', type=int, default=1, help="First page (1-based)")
+    parser.add_argument('end', nargs='?', type=int, default=None, help="Last page (default: end)")
+    parser.add_argument('output', nargs='?', default="extracted-ocr.txt", help="Output text file")
+    parser.add_argument('--window', type=int, default=1,
+                        help="Pages rendered per poppler call; memory grows with this (default: 1)")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="Render at low DPI first; re-render only pages/lines Tesseract is unsure of")
+    parser.add_argument('--keep-blank', action='store_true',
+                        help="Render and OCR every page, without the blank/no-text page pre-filter")
+    add_cache_args(parser)
+    add_metrics_args(parser)
+    args = parser.parse_args()
 
-    if not os.path.exists(pdf_path):
-        print(f"[ERROR] File not found: {pdf_path}")
+    if not os.path.exists(args.pdf):
+        print(f"[ERROR] File not found: {args.pdf}")
         sys.exit(1)
 
-    extract_with_ocr(pdf_path, start, end, output)
+    cache = cache_from_args(args)
+    metrics_from_args(args, 'extract_with_ocr')
+    with metrics.pdf(args.pdf):
+        extract_with_ocr(args.pdf, args.start, args.end, args.output, cache, args.window, args.adaptive,
+                         not args.keep_blank)
+    cache.close()
+    metrics.finish()
@@ -1,11 +1,19 @@
 #!/usr/bin/env python3
 """
 Alternative PDF extraction using Python libraries
+
+With --ocr-fallback this becomes a hybrid extractor: each page's text layer
+is read first and scored, and only pages that fail the score are rendered
+and OCRed (needs pymupdf + Tesseract).
 """
 import sys
 import os
+import argparse
 from pathlib import Path
 
+# Shared extractor helpers live in scripts/utilities
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'utilities'))
+
 try:
     import PyPDF2
     from PIL import Image
@@ -15,11 +23,35 @@ except ImportError:
     print("   pip install PyPDF2 Pillow pytesseract")
     sys.exit(1)
 
-def extract_text_pypdf2(pdf_path, start_page=1, end_page=None):
-    """Extract text directly from PDF if possible"""
+from extraction_metrics import add_metrics_args, metrics, metrics_from_args
+from ocr_cache import add_cache_args, cache_from_args
+
+def extract_text_pypdf2(pdf_path, start_page=1, end_page=None, ocr_fallback=False, cache=None):
+    """
+    Extract text directly from PDF if possible
+    ocr_fallback: OCR pages whose text layer is missing or fails the quality score
+    cache: optional OcrCache for the OCR fallback
+    """
     print(f"\nExtracting text from: {Path(pdf_path).name}")
     print("="*70)
 
+    if ocr_fallback:
+        try:
+            import fitz  # PyMuPDF
+            from page_ocr import (
+                OCR_CONFIG_KEY, OCR_RENDER_KEY, blank_page_reason,
+                extract_text_from_page, extract_text_hybrid, text_layer_quality
+            )
+        except ImportError as e:
+            print(f"[ERROR] OCR fallback needs: {e}")
+            print("   pip install pymupdf")
+            sys.exit(1)
+        fitz_doc = fitz.open(pdf_path)
+
+    text_pages = 0
+    ocr_pages = 0
+    blank_pages = 0
+
     with open(pdf_path, 'rb') as file:
         reader = PyPDF2.PdfReader(file)
         num_pages = len(reader.pages)
@@ -30,34 +62,80 @@ def extract_text_pypdf2(pdf_path, start_page=1, end_page=None):
 
         all_text = []
         for i in range(start_page - 1, end):
+            metrics.begin_page(pdf_path, i)
             page = reader.pages[i]
-            text = page.extract_text()
+            with metrics.span('text'):
+                text = page.extract_text()
+
+            if ocr_fallback:
+                fitz_page = fitz_doc[i]
+
+                # Don't render and OCR a page that is blank or has no text to find
+                if not text_layer_quality(text)['usable']:
+                    reason = blank_page_reason(fitz_page)
+                    if reason:
+                        blank_pages += 1
+                        print(f"[BLANK] Page {i+1}: skipped before OCR ({reason})")
+                        continue
+
+                if cache is not None:
+                    ocr = lambda: cache.get_or_compute(
+                        pdf_path, i, OCR_RENDER_KEY, OCR_CONFIG_KEY,
+                        lambda: extract_text_from_page(fitz_page)
+                    )
+                else:
+                    ocr = lambda: extract_text_from_page(fitz_page)
+
+                text, source = extract_text_hybrid(fitz_page, text_layer=text, ocr=ocr)
+                if source == 'ocr':
+                    ocr_pages += 1
+                    print(f"[OCR] Page {i+1}: text layer unusable, {len(text.strip())} characters from OCR")
+                else:
+                    text_pages += 1
 
             if text.strip():
                 print(f"[OK] Page {i+1}: {len(text)} characters")
                 all_text.append(f"\n\n--- Page {i+1} ---\n\n{text}")
             else:
                 print(f"[BLANK] Page {i+1}: No text (likely scanned image)")
+        metrics.end_page()
 
-        return ''.join(all_text)
+    if ocr_fallback:
+        fitz_doc.close()
+        print(f"\n[STATS] Text layer pages: {text_pages}, OCR pages: {ocr_pages}, skipped as blank: {blank_pages}")
+
+    return ''.join(all_text)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("USAGE: python extract-with-python.py <PDF> [START] [END] [OUTPUT]")
-        print("NOTE: Extracts text directly from PDF (no OCR, only works if PDF has text layer)")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Extract text directly from a PDF text layer",
+        epilog="NOTE: Without --ocr-fallback this does no OCR and only works if the PDF has a text layer"
+    )
+    parser.add_argument('pdf', help="PDF to extract")
+    parser.add_argument('start', nargs='?', type=int, default=1, help="First page (1-based)")
+    parser.add_argument('end', nargs='?', type=int, default=None, help="Last page (default: end)")
+    parser.add_argument('output', nargs='?', default="extracted-python.txt", help="Output text file")
+    parser.add_argument('--ocr-fallback', action='store_true',
+                        help="OCR only the pages whose text layer is missing or unusable")
+    add_cache_args(parser)
+    add_metrics_args(parser)
+    args = parser.parse_args()
+
+    cache = cache_from_args(args) if args.ocr_fallback else None
+    metrics_from_args(args, 'extract_text_pypdf2')
 
-    pdf_path = sys.argv[1]
-    start = int(sys.argv[2]) if len(sys.argv) > 2 else 1
-    end = int(sys.argv[3]) if len(sys.argv) > 3 else None
-    output = sys.argv[4] if len(sys.argv) > 4 else "extracted-python.txt"
+    with metrics.pdf(args.pdf):
+        text = extract_text_pypdf2(args.pdf, args.start, args.end, args.ocr_fallback, cache)
 
-    text = extract_text_pypdf2(pdf_path, start, end)
+    if cache is not None:
+        print(f"[STATS] {cache.summary()}")
+        cache.close()
 
-    with open(output, 'w', encoding='utf-8') as f:
+    with metrics.span('write'), open(args.output, 'w', encoding='utf-8') as f:
         f.write(text)
+    metrics.add_bytes(os.path.getsize(args.output))
 
-    print(f"\nSaved to: {output}")
+    print(f"\nSaved to: {args.output}")
     print(f"Total characters: {len(text)}")
 
     if text:
@@ -67,4 +145,6 @@ if __name__ == "__main__":
         print("-"*70)
     else:
         print("\n[WARNING] No text extracted - PDF is likely scanned images")
-        print("[INFO] Need OCR to extract text from scanned images")
+        print("[INFO] Need OCR to extract text from scanned images (try --ocr-fallback)")
+
+    metrics.finish()
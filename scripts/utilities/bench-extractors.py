@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Extraction benchmark on a synthetic PDF corpus
+
+Builds a deterministic corpus with PyMuPDF and runs each extractor entry
+point over it, reporting throughput, per-page latency (p50/p95) and peak
+RSS as JSON, so an optimization can be compared against a saved baseline.
+
+Corpus (same bytes on every run for the same --contests):
+    moems-text.pdf      MOEMS-style packet, one question per page, with a
+                        text layer; vector and raster diagrams; blank pages
+    moems-scanned.pdf   the same pages as image-only scans (no text layer)
+
+Targets:
+    extract_text_pypdf2     extract-with-python.py, text layer only
+    extract_with_ocr        extract-with-pdf2image.py, poppler + Tesseract
+    moems_ocr               extract-moems-complete-ocr.py process_moems_pdf
+    moems_diagrams          extract-diagrams-universal.py process_moems_pdf
+    crop_diagram_smart      extract-diagrams-universal.py, every page, auto-detect
+
+Each (target, document) runs in a fresh process, so peak RSS is its own.
+Per-page latency is the time between the per-page lines each script already
+prints ([OK] Page / [1A] Page / Extracting ...), or per call for
+crop_diagram_smart. Targets whose OCR engine or poppler is not installed
+are reported as skipped.
+
+Usage:
+    python bench-extractors.py [--contests 5] [--repeat 3] [--targets moems_ocr,crop_diagram_smart]
+                               [--corpus bench-corpus] [--output bench-results.json]
+
+Requirements:
+    pip install pymupdf pillow numpy
+    (plus each target's own requirements: PyPDF2, pdf2image + poppler, Tesseract)
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image, ImageDraw
+
+from extraction_metrics import peak_rss_mb, percentile
+from script_loader import load_script
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+UTILITIES_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.dirname(UTILITIES_DIR)
+
+CORPUS_SEED = 2024
+PAGE_SIZE = (612, 792)        # US Letter, in points
+SCAN_DPI = 150                # Resolution of the image-only pages
+BENCH_EXAM_YEAR = '2019'
+RESULTS_VERSION = 1
+
+# Question lines a packet page is built from
+QUESTION_STEMS = [
+    "Choose any number between {a} and {b}. Add {c}. Subtract your original number. What is the result?",
+    "The sum of three consecutive natural numbers is {c} more than the greatest of them. Find the greatest.",
+    "A rectangle has perimeter {b} cm and length {a} cm. What is its area, in sq cm?",
+    "Amy has {a} marbles and Tara has {c}. How many must Amy give Tara so they have the same number?",
+    "How many {a}-digit numbers have digits whose product is {b}?",
+    "An ant walks around the figure shown, touching each labeled point in order. Which point is touched {c}th?",
+]
+
+# ============================================================================
+# SYNTHETIC CORPUS
+# ============================================================================
+
+def raster_diagram(rng, size=(360, 240)):
+    """PNG bytes of a drawing with shading and labels, placed as an image"""
+    image = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(image)
+    for _ in range(4):
+        x0, y0 = rng.randrange(10, size[0] - 120), rng.randrange(10, size[1] - 90)
+        shade = rng.randrange(120, 220)
+        draw.rectangle([x0, y0, x0 + rng.randrange(40, 110), y0 + rng.randrange(30, 80)],
+                       fill=(shade, shade, 255), outline='black', width=2)
+    for label in 'ABCD':
+        draw.text((rng.randrange(5, size[0] - 20), rng.randrange(5, size[1] - 20)), label, fill='black')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def vector_diagram(page, rng, area):
+    """Line drawing (grid, circle, polygon) drawn as vector paths inside area"""
+    x0, y0, x1, y1 = area
+    cell = 24
+    for x in np.arange(x0, x1 - cell + 1, cell):
+        for y in np.arange(y0, y0 + 3 * cell, cell):
+            page.draw_rect(fitz.Rect(x, y, x + cell, y + cell), color=(0, 0, 0), width=0.8)
+    center = fitz.Point(rng.uniform(x0 + 60, x1 - 60), y1 - 50)
+    page.draw_circle(center, 40, color=(0, 0, 0), width=1.2)
+    points = [fitz.Point(rng.uniform(x0, x1), rng.uniform(y0 + 80, y1)) for _ in range(4)]
+    page.draw_polyline(points + points[:1], color=(0, 0, 0), width=1)
+
+def question_page(doc, rng, page_num, diagram):
+    """One MOEMS question page: header, question text, optional diagram and options"""
+    page = doc.new_page(width=PAGE_SIZE[0], height=PAGE_SIZE[1])
+    contest, letter = page_num // 5 + 1, 'ABCDE'[page_num % 5]
+    page.insert_text((72, 60), "Mathematical Olympiads for Elementary and Middle Schools", fontsize=10)
+    page.insert_text((72, 76), f"Division E  Contest {contest}  Page {page_num + 1}", fontsize=10)
+
+    stem = rng.choice(QUESTION_STEMS).format(a=rng.randrange(2, 60), b=rng.randrange(60, 400),
+                                             c=rng.randrange(3, 30))
+    text = f"{contest}{letter}  Time: {rng.randrange(3, 8)} minutes\n\n{stem}"
+    page.insert_textbox(fitz.Rect(72, 100, 540, 220), text, fontsize=12)
+
+    area = (90, 240, 520, 470)
+    if diagram == 'vector':
+        vector_diagram(page, rng, area)
+    elif diagram == 'raster':
+        page.insert_image(fitz.Rect(*area), stream=raster_diagram(rng))
+
+    if rng.random() < 0.5:
+        options = '   '.join(f"({choice}) {rng.randrange(1, 200)}" for choice in 'ABCDE')
+        page.insert_text((72, 520), options, fontsize=12)
+    page.insert_text((72, 740), "Copyright (c) Mathematical Olympiads for Elementary and Middle Schools",
+                     fontsize=8)
+
+def page_kinds(total_pages):
+    """Diagram kind per page: a deterministic mix of vector, raster, none and blank"""
+    kinds = []
+    for page_num in range(total_pages):
+        if page_num % 11 == 10:
+            kinds.append('blank')
+        else:
+            kinds.append(('vector', 'raster', None)[page_num % 3])
+    return kinds
+
+def save_deterministic(doc, path):
+    # No dates or random IDs, so the same corpus hashes the same
+    doc.set_metadata({})
+    doc.save(path, garbage=3, deflate=True, no_new_id=True)
+
+def build_corpus(directory, contests=5):
+    """
+    Write the corpus PDFs into directory
+    Returns [{name, path, pages, text_layer, sha256}]
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(CORPUS_SEED)
+    total_pages = contests * 5
+
+    text_doc = fitz.open()
+    for page_num, kind in enumerate(page_kinds(total_pages)):
+        if kind == 'blank':
+            text_doc.new_page(width=PAGE_SIZE[0], height=PAGE_SIZE[1])
+        else:
+            question_page(text_doc, rng, page_num, kind)
+
+    scanned_doc = fitz.open()
+    for page in text_doc:
+        pix = page.get_pixmap(dpi=SCAN_DPI, colorspace=fitz.csGRAY)
+        scan = scanned_doc.new_page(width=page.rect.width, height=page.rect.height)
+        scan.insert_image(scan.rect, stream=pix.tobytes('png'))
+
+    documents = []
+    for name, doc, text_layer in (('moems-text.pdf', text_doc, True), ('moems-scanned.pdf', scanned_doc, False)):
+        path = os.path.join(directory, name)
+        save_deterministic(doc, path)
+        doc.close()
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        documents.append({'name': name, 'path': path, 'pages': total_pages,
+                          'text_layer': text_layer, 'sha256': digest})
+    return documents
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+
+class PageClock(io.TextIOBase):
+    """
+    Stand-in stdout that timestamps the per-page lines a script prints
+    pattern: regex of the line that marks a page
+    mode: 'end' if the line is printed when a page is done, 'start' if when it begins
+    """
+
+    def __init__(self, pattern=None, mode='end'):
+        self.pattern = re.compile(pattern) if pattern else None
+        self.mode = mode
+        self.marks = []
+        self._partial = ''
+
+    def write(self, text):
+        now = time.perf_counter()
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        if self.pattern is not None:
+            for line in lines:
+                if self.pattern.search(line):
+                    self.marks.append(now)
+        return len(text)
+
+    def mark(self):
+        self.marks.append(time.perf_counter())
+
+    def latencies(self, start, end):
+        """Seconds per page between the marks, excluding setup before the first page / after the last"""
+        if not self.marks:
+            return []
+        bounds = [start] + self.marks + [end]
+        gaps = [b - a for a, b in zip(bounds, bounds[1:])]
+        return gaps[1:] if self.mode == 'start' else gaps[:-1]
+
+# ============================================================================
+# TARGETS
+# ============================================================================
+
+class Unavailable(Exception):
+    """A target's dependencies (OCR engine, poppler) are not installed"""
+
+def load_target(path, name):
+    """Import a hyphenated extractor script as a module, quietly"""
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return load_script(path, name)
+    except SystemExit:
+        # The scripts print what is missing and exit at import time
+        raise Unavailable(f"{os.path.basename(path)}: missing dependencies")
+
+def require_ocr():
+    """Point pytesseract at a local tesseract if the scripts' Windows path doesn't exist, then try it"""
+    import pytesseract
+    from ocr_engine import get_engine
+
+    if not os.path.exists(pytesseract.pytesseract.tesseract_cmd):
+        pytesseract.pytesseract.tesseract_cmd = shutil.which('tesseract') or 'tesseract'
+    try:
+        get_engine().image_to_string(Image.new('L', (64, 32), 255))
+    except Exception as e:
+        raise Unavailable(f"OCR engine not available: {e}")
+
+def text_layer_target(work_dir):
+    module = load_target(os.path.join(SCRIPTS_DIR, 'extract-with-python.py'), 'extract_with_python')
+    return r'^\[(OK|BLANK)\] Page \d+', 'end', lambda pdf_path, clock: module.extract_text_pypdf2(pdf_path)
+
+def pdf2image_target(work_dir):
+    module = load_target(os.path.join(SCRIPTS_DIR, 'extract-with-pdf2image.py'), 'extract_with_pdf2image')
+    require_ocr()
+    if not os.path.isdir(module.POPPLER_PATH):
+        module.POPPLER_PATH = None   # poppler from PATH
+    if shutil.which('pdftoppm', path=module.POPPLER_PATH) is None:
+        raise Unavailable("poppler (pdftoppm) not found")
+    output_file = os.path.join(work_dir, 'extracted-ocr.txt')
+
+    def run(pdf_path, clock):
+        try:
+            module.extract_with_ocr(pdf_path, output_file=output_file)
+        except SystemExit:
+            raise RuntimeError("extract_with_ocr failed (see its [ERROR] line)")
+    return r'^\s*\[(OK|BLANK)\] Page \d+', 'end', run
+
+def moems_ocr_target(work_dir):
+    module = load_target(os.path.join(UTILITIES_DIR, 'extract-moems-complete-ocr.py'), 'extract_moems_complete_ocr')
+    require_ocr()
+    module.IMAGE_DIR = os.path.join(work_dir, 'images')
+    return (r'^\s*\[\d+[A-E]\] Page \d+/', 'start',
+            lambda pdf_path, clock: module.process_moems_pdf(pdf_path, BENCH_EXAM_YEAR))
+
+def moems_diagrams_target(work_dir):
+    module = load_target(os.path.join(UTILITIES_DIR, 'extract-diagrams-universal.py'), 'extract_diagrams_universal')
+    module.OUTPUT_DIR = work_dir
+    return (r'^\s*(SKIP|Extracting) ', 'end',
+            lambda pdf_path, clock: module.process_moems_pdf(pdf_path, BENCH_EXAM_YEAR))
+
+def crop_target(work_dir):
+    module = load_target(os.path.join(UTILITIES_DIR, 'extract-diagrams-universal.py'), 'extract_diagrams_universal')
+
+    def run(pdf_path, clock):
+        with fitz.open(pdf_path) as doc:
+            analysis_cache = module.PageAnalysisCache(doc)
+            for page_num in range(doc.page_count):
+                output_path = os.path.join(work_dir, f"crop-{page_num + 1}.png")
+                module.crop_diagram_smart(doc, page_num, output_path, preset='MOEMS', auto_detect=True,
+                                          analysis_cache=analysis_cache)
+                clock.mark()
+    return None, 'end', run
+
+TARGETS = {
+    'extract_text_pypdf2': text_layer_target,
+    'extract_with_ocr': pdf2image_target,
+    'moems_ocr': moems_ocr_target,
+    'moems_diagrams': moems_diagrams_target,
+    'crop_diagram_smart': crop_target,
+}
+
+def run_target(target, document, repeat):
+    """Benchmark one target on one document (runs in a fresh process)"""
+    result = {'target': target, 'document': document['name']}
+    with tempfile.TemporaryDirectory(prefix='bench-') as work_dir:
+        try:
+            pattern, mode, run = TARGETS[target](work_dir)
+        except Unavailable as e:
+            result.update(status='skipped', reason=str(e))
+            return result
+        result['baseline_rss_mb'] = peak_rss_mb()
+
+        walls = []
+        latencies = []
+        pages = 0
+        for _ in range(repeat):
+            clock = PageClock(pattern, mode)
+            start = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(clock):
+                    run(document['path'], clock)
+            except Exception as e:
+                result.update(status='error', reason=f"{type(e).__name__}: {e}")
+                return result
+            end = time.perf_counter()
+            walls.append(end - start)
+            run_latencies = clock.latencies(start, end)
+            latencies.extend(run_latencies)
+            pages = len(run_latencies)
+
+    wall = sorted(walls)[len(walls) // 2]
+    result.update(
+        status='ok',
+        runs=repeat,
+        pages=pages,
+        wall_seconds=round(wall, 4),
+        pages_per_second=round(pages / wall, 2) if wall else None,
+        latency_ms={
+            'p50': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+            'p95': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+            'max': round(max(latencies) * 1000, 2) if latencies else None,
+        },
+        peak_rss_mb=peak_rss_mb()
+    )
+    return result
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def environment():
+    from ocr_engine import get_engine
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pymupdf': fitz.VersionBind,
+        'ocr_engine': get_engine().name,
+    }
+
+def print_table(results):
+    print(f"\n{'target':<22} {'document':<18} {'pages/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'peak MB':>8}")
+    print("-" * 76)
+    for result in results:
+        if result['status'] != 'ok':
+            print(f"{result['target']:<22} {result['document']:<18} {result['status'].upper()}: {result['reason']}")
+            continue
+        latency = result['latency_ms']
+        print(f"{result['target']:<22} {result['document']:<18} {result['pages_per_second'] or 0:>8.1f} "
+              f"{latency['p50'] or 0:>8.1f} {latency['p95'] or 0:>8.1f} {result['peak_rss_mb'] or 0:>8.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PDF extractors on a synthetic corpus")
+    parser.add_argument('--contests', type=int, default=5, help="Contests per packet, 5 pages each (default: 5)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per target and document (default: 3)")
+    parser.add_argument('--targets', default=','.join(TARGETS),
+                        help=f"Comma-separated subset of: {', '.join(TARGETS)}")
+    parser.add_argument('--corpus', default='bench-corpus', help="Directory the corpus is written to")
+    parser.add_argument('--output', default='bench-results.json', help="JSON results file")
+    args = parser.parse_args()
+
+    targets = [name.strip() for name in args.targets.split(',') if name.strip()]
+    unknown = [name for name in targets if name not in TARGETS]
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(unknown)}")
+
+    documents = build_corpus(args.corpus, args.contests)
+    print(f"Corpus: {', '.join(d['name'] for d in documents)} ({documents[0]['pages']} pages each) in {args.corpus}")
+
+    results = []
+    spawn = multiprocessing.get_context('spawn')
+    for target in targets:
+        for document in documents:
+            print(f"[RUN] {target} on {document['name']}...")
+            # A new process per run: peak RSS is the run's own, and no state carries over
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+                results.append(executor.submit(run_target, target, document, args.repeat).result())
+
+    report = {
+        'version': RESULTS_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'corpus': {'seed': CORPUS_SEED, 'contests': args.contests, 'documents': documents},
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print_table(results)
+    print(f"\nResults saved to: {args.output}")
+
+if __name__ == "__main__":
+    main()
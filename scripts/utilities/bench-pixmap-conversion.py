@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: pixmap -> OCR input conversion
+
+Compares, per page, the old extract_text_from_page path
+    pix.tobytes("png") -> Image.open(BytesIO(...)) -> load()
+with the zero-copy path used now
+    pixmap_to_image(pix)   (Image.frombuffer over pix.samples)
+
+OCR itself is not run - it is the same for both paths. Allocations are the
+peak Python-heap bytes seen by tracemalloc (the PNG bytes object shows up
+there; PIL's decoded pixel buffer does not, so the real saving is larger).
+
+Usage:
+    python bench-pixmap-conversion.py <PDF> [--zoom 3.0] [--pages N] [--repeat 3]
+"""
+
+import argparse
+import io
+import statistics
+import time
+import tracemalloc
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from ocr_engine import pixmap_to_image
+
+def png_roundtrip(pix):
+    img = Image.open(io.BytesIO(pix.tobytes("png")))
+    img.load()
+    return img
+
+def zero_copy(pix):
+    img = pixmap_to_image(pix)
+    img.load()
+    return img
+
+def measure(convert, pix, repeat):
+    """Best-of-N milliseconds and peak traced bytes for one conversion"""
+    times = []
+    peak = 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        img = convert(pix)
+        times.append((time.perf_counter() - start) * 1000)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del img
+    return min(times), peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pixmap -> PIL conversion paths")
+    parser.add_argument('pdf')
+    parser.add_argument('--zoom', type=float, default=3.0)
+    parser.add_argument('--pages', type=int, default=10, help="Pages to measure (default: 10)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per page; best time is kept")
+    args = parser.parse_args()
+
+    doc = fitz.open(args.pdf)
+    mat = fitz.Matrix(args.zoom, args.zoom)
+    results = {'png': [], 'zero-copy': []}
+
+    print(f"{'page':>5} {'size':>11} {'png ms':>8} {'png KB':>8} {'zc ms':>7} {'zc KB':>7}")
+    for page_num in range(min(args.pages, doc.page_count)):
+        pix = doc[page_num].get_pixmap(matrix=mat)
+        png = measure(png_roundtrip, pix, args.repeat)
+        zc = measure(zero_copy, pix, args.repeat)
+        results['png'].append(png)
+        results['zero-copy'].append(zc)
+        print(f"{page_num + 1:>5} {pix.width:>5}x{pix.height:<5} "
+              f"{png[0]:>8.1f} {png[1] // 1024:>8} {zc[0]:>7.2f} {zc[1] // 1024:>7}")
+
+    doc.close()
+    if not results['png']:
+        return
+
+    png_ms = statistics.median(t for t, _ in results['png'])
+    zc_ms = statistics.median(t for t, _ in results['zero-copy'])
+    png_kb = statistics.median(b for _, b in results['png']) / 1024
+    zc_kb = statistics.median(b for _, b in results['zero-copy']) / 1024
+    print("-" * 52)
+    print(f"Median per page: PNG round trip {png_ms:.1f} ms / {png_kb:.0f} KB, "
+          f"zero-copy {zc_ms:.2f} ms / {zc_kb:.0f} KB")
+    print(f"Saved: {png_ms - zc_ms:.1f} ms and {png_kb - zc_kb:.0f} KB of Python allocations per page")
+
+if __name__ == "__main__":
+    main()
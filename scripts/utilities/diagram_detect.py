@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+In-memory diagram detection for PDF pages
+
+Instead of rendering a high-zoom crop, saving it and checking the file size,
+the page's diagram band is rendered once at low resolution in grayscale and
+analysed with NumPy:
+    - text blocks from the PDF text layer are masked out
+    - remaining dark pixels ("ink") are pooled onto a coarse grid
+    - connected ink regions are labelled and filtered by size
+The union of the surviving regions is returned as a tight crop box in page
+coordinates, or None when the band holds no real diagram.
+
+Requirements:
+    pip install pymupdf numpy
+"""
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from extraction_metrics import metrics
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Band searched for diagrams, as fractions of the page (left, top, right, bottom)
+# MOEMS layout: question text top 20%, diagram middle, answer space bottom 35%
+DIAGRAM_SEARCH_BAND = (0.05, 0.20, 0.95, 0.65)
+
+DETECT_ZOOM = 1.0        # 72 DPI is plenty to find ink
+INK_THRESHOLD = 160      # Gray levels below this count as ink
+CELL_SIZE = 4            # Pixels per grid cell when pooling ink
+MIN_REGION_CELLS = 12    # Smaller regions are specks/noise
+MIN_REGION_SIZE = 20     # Points; thinner regions are rules or stray text lines
+CROP_PADDING = 6         # Points added around the detected diagram
+
+# ============================================================================
+# ARRAY HELPERS
+# ============================================================================
+
+def pixmap_gray_array(pix):
+    """(height, width) uint8 view of a single-channel pixmap's samples (no copy)"""
+    data = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    return data[:, :pix.width]
+
+def pool_cells(mask, cell):
+    """True for each cell x cell block of `mask` that contains any True pixel"""
+    h, w = mask.shape
+    rows, cols = -(-h // cell), -(-w // cell)
+    padded = np.zeros((rows * cell, cols * cell), dtype=bool)
+    padded[:h, :w] = mask
+    return padded.reshape(rows, cell, cols, cell).any(axis=(1, 3))
+
+def label_regions(grid):
+    """
+    8-connected component labels for a boolean grid
+    Vectorized label propagation: every cell repeatedly takes the max label
+    of its neighbours until nothing changes
+    """
+    labels = np.where(grid, np.arange(1, grid.size + 1).reshape(grid.shape), 0)
+    while True:
+        padded = np.pad(labels, 1)
+        h, w = labels.shape
+        neighbours = np.max(
+            [padded[dy:dy + h, dx:dx + w] for dy in range(3) for dx in range(3)],
+            axis=0
+        )
+        updated = np.where(grid, neighbours, 0)
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+# ============================================================================
+# DETECTION
+# ============================================================================
+
+def find_diagram_bbox(gray, origin, scale, text_rects=()):
+    """
+    Find the diagram in a grayscale raster
+    gray: (h, w) uint8 array covering the page area that starts at `origin`
+    origin: (x, y) page coordinates of gray[0, 0]
+    scale: pixels per page point
+    text_rects: page-coordinate rects of text blocks to ignore
+    Returns a fitz.Rect in page coordinates, or None
+    """
+    ink = gray < INK_THRESHOLD
+    ox, oy = origin
+
+    if text_rects:
+        ink = ink.copy()
+        for rect in text_rects:
+            x0 = max(0, int((rect[0] - ox) * scale))
+            y0 = max(0, int((rect[1] - oy) * scale))
+            # Clamp at 0 too: a rect above or left of the raster (the page header)
+            # would otherwise give a negative bound, counted from the far edge
+            x1 = max(0, int(np.ceil((rect[2] - ox) * scale)))
+            y1 = max(0, int(np.ceil((rect[3] - oy) * scale)))
+            ink[y0:y1, x0:x1] = False
+
+    if not ink.any():
+        return None
+
+    labels = label_regions(pool_cells(ink, CELL_SIZE))
+    ids, counts = np.unique(labels[labels > 0], return_counts=True)
+
+    cell_points = CELL_SIZE / scale
+    bbox = None
+    for region_id, count in zip(ids, counts):
+        if count < MIN_REGION_CELLS:
+            continue
+        rows, cols = np.nonzero(labels == region_id)
+        x0 = ox + cols.min() * cell_points
+        y0 = oy + rows.min() * cell_points
+        x1 = ox + (cols.max() + 1) * cell_points
+        y1 = oy + (rows.max() + 1) * cell_points
+        if x1 - x0 < MIN_REGION_SIZE or y1 - y0 < MIN_REGION_SIZE:
+            continue
+        region = fitz.Rect(x0, y0, x1, y1)
+        bbox = region if bbox is None else bbox | region
+
+    return bbox
+
+def text_block_rects(page):
+    """Rects of the page's text blocks (empty for scanned pages)"""
+    return [fitz.Rect(block[:4]) for block in page.get_text("blocks") if block[6] == 0]
+
+def detect_diagram_bbox(page, band=DIAGRAM_SEARCH_BAND):
+    """
+    Low-resolution in-memory diagram detection for one page
+    Returns a padded fitz.Rect to crop at high zoom, or None if there is no diagram
+    """
+    page_rect = page.rect
+    search = fitz.Rect(
+        page_rect.width * band[0],
+        page_rect.height * band[1],
+        page_rect.width * band[2],
+        page_rect.height * band[3]
+    )
+
+    with metrics.span('render'):
+        pix = page.get_pixmap(matrix=fitz.Matrix(DETECT_ZOOM, DETECT_ZOOM), clip=search, colorspace=fitz.csGRAY)
+    origin = (pix.x / DETECT_ZOOM, pix.y / DETECT_ZOOM)
+    bbox = find_diagram_bbox(pixmap_gray_array(pix), origin, DETECT_ZOOM, text_block_rects(page))
+    if bbox is None:
+        return None
+
+    bbox = fitz.Rect(bbox.x0 - CROP_PADDING, bbox.y0 - CROP_PADDING, bbox.x1 + CROP_PADDING, bbox.y1 + CROP_PADDING)
+    return bbox & search
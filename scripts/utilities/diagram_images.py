@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Size-optimized diagram image output
+
+A raw 3x RGB PNG of a black-and-white line drawing is several times larger
+than it needs to be. For each diagram this writes:
+    <name>.png          full size; grayscale or palette-quantized for line
+                        drawings, RGB only for photo-like crops (the fallback,
+                        and the URL already stored in imageUrl)
+    <name>.webp         full size WebP
+    <name>-480w.webp    narrower WebP variants for a responsive srcset
+    <name>-960w.webp    (only widths, and files, smaller than the full image)
+and returns their dimensions and byte sizes for the extraction output.
+With an ImageStore (image_store.py), a crop with the same pixels as a
+diagram already in the directory is not written; the metadata returned is
+that diagram's, so the question points at its URL.
+
+Usage:
+    from diagram_images import save_diagram_images
+    meta = save_diagram_images(pil_image, output_path, manifest, artifact_id, store)
+    meta['url']   # imageUrl to store for the question
+
+Requirements:
+    pip install pillow numpy
+"""
+
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+from extraction_metrics import metrics, timed
+from image_store import dhash_hex, pixel_hash
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+RESPONSIVE_WIDTHS = (480, 960)   # srcset widths, in pixels
+WEBP_QUALITY = 82                # Lossy WebP, photo-like crops only; drawings are lossless
+GRAY_TOLERANCE = 10              # Max R/G/B spread (0-255) for a pixel to count as gray
+GRAY_LEVELS = 16                 # Palette size for grayscale line drawings
+DRAWING_COLORS = 64              # Palette size for colored line drawings
+DRAWING_WHITE_RATIO = 0.5        # Mostly white background means a drawing, not a photo
+CLASSIFY_SIZE = 512               # Classify on a thumbnail no larger than this
+IMAGE_URL_PREFIX = '/images/questions/'
+
+# ============================================================================
+# ENCODING
+# ============================================================================
+
+def classify(image):
+    """'gray', 'drawing' (colored, mostly white) or 'photo'"""
+    factor = max(1, max(image.size) // CLASSIFY_SIZE)
+    rgb = np.asarray(image.convert('RGB').reduce(factor))
+    # Per-channel planes: much faster than reducing over the short last axis
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    lowest = np.minimum(np.minimum(r, g), b)
+    spread = np.maximum(np.maximum(r, g), b) - lowest
+    if (spread <= GRAY_TOLERANCE).mean() > 0.999:
+        return 'gray'
+    if (lowest >= 240).mean() >= DRAWING_WHITE_RATIO:
+        return 'drawing'
+    return 'photo'
+
+def reduce_colors(image, kind):
+    """Smallest lossless-looking PNG mode for the image kind"""
+    if kind == 'gray':
+        return image.convert('L').quantize(colors=GRAY_LEVELS, dither=Image.Dither.NONE)
+    if kind == 'drawing':
+        return image.convert('RGB').quantize(colors=DRAWING_COLORS, method=Image.Quantize.FASTOCTREE,
+                                             dither=Image.Dither.NONE)
+    return image.convert('RGB')
+
+def png_bytes(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+def webp_bytes(image, kind, reduced=None):
+    """
+    Lossless WebP of the color-reduced drawing (smaller than lossy for flat art), lossy for photos
+    reduced: reduce_colors(image, kind), if the caller already has it
+    """
+    buffer = io.BytesIO()
+    if kind == 'photo':
+        image.convert('RGB').save(buffer, format='WEBP', quality=WEBP_QUALITY, method=6)
+    else:
+        if reduced is None:
+            reduced = reduce_colors(image, kind)
+        # method 4: same lossless size as 6 on these drawings, in less time
+        reduced.convert('RGB').save(buffer, format='WEBP', lossless=True, method=4)
+    return buffer.getvalue()
+
+def variant_path(output_path, width=None):
+    root, _ = os.path.splitext(output_path)
+    return f"{root}-{width}w.webp" if width else f"{root}.webp"
+
+@timed('encode')
+def encode_diagram_images(image, output_path):
+    """
+    Encode every output file for one diagram (CPU only, no disk access)
+    Returns (files, meta): files is a list of (artifact suffix, path, bytes);
+    meta describes them for the extraction output
+    """
+    width, height = image.size
+    kind = classify(image)
+
+    reduced = reduce_colors(image, kind)
+    png = png_bytes(reduced)
+    webp = webp_bytes(image, kind, reduced)
+    files = [('', output_path, png), ('@webp', variant_path(output_path), webp)]
+    meta = {
+        'url': IMAGE_URL_PREFIX + os.path.basename(output_path),
+        'width': width,
+        'height': height,
+        'format': kind,
+        'bytes': len(png),
+        'dhash': dhash_hex(image),
+        'pixels': pixel_hash(image),
+        'webp': {'url': IMAGE_URL_PREFIX + os.path.basename(variant_path(output_path)), 'bytes': len(webp)},
+        'srcset': []
+    }
+
+    for target in RESPONSIVE_WIDTHS:
+        if target >= width:
+            continue
+        scaled = image.resize((target, max(1, round(height * target / width))), Image.LANCZOS)
+        data = webp_bytes(scaled, kind)
+        if len(data) >= len(webp):
+            # Downscaling anti-aliases flat drawings; not worth serving if it isn't smaller
+            continue
+        path = variant_path(output_path, target)
+        files.append((f"@{target}w", path, data))
+        meta['srcset'].append({
+            'url': IMAGE_URL_PREFIX + os.path.basename(path),
+            'width': scaled.size[0],
+            'height': scaled.size[1],
+            'bytes': len(data)
+        })
+
+    return files, meta
+
+# ============================================================================
+# WRITING
+# ============================================================================
+
+def write_diagram_images(files, meta, manifest=None, artifact_id=None, store=None):
+    """
+    Write encode_diagram_images output; with a manifest, unchanged files are left alone
+    Returns the metadata of the image the question should use: meta, or a
+    stored identical diagram's metadata (nothing is written then)
+    """
+    output_path = files[0][1]
+    if store is not None:
+        canonical = store.duplicate_of(meta, os.path.basename(output_path), artifact_id)
+        if canonical is not None:
+            # An earlier copy of this crop is now redundant, unless others point at it
+            if store.release(os.path.basename(output_path)):
+                _delete_files(output_path)
+            return canonical
+
+    with metrics.span('write'):
+        for suffix, path, data in files:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            if manifest is not None:
+                written = manifest.write_artifact(f"{artifact_id}{suffix}", path, data)
+            else:
+                with open(path, 'wb') as f:
+                    f.write(data)
+                written = True
+            if written:
+                metrics.add_bytes(len(data))
+
+    if store is not None:
+        for alias, alias_id in store.add(os.path.basename(output_path), meta).items():
+            # That question's record points at this file, which now shows another picture
+            if manifest is not None and alias_id is not None:
+                manifest.forget(alias_id)
+                action = "its page is extracted again when its PDF is next processed"
+            else:
+                action = "rerun its extraction with --full"
+            print(f"  [WARN] {alias} used {os.path.basename(output_path)}, whose picture changed: {action}")
+    return meta
+
+def save_diagram_images(image, output_path, manifest=None, artifact_id=None, store=None):
+    """Encode and write all variants of one diagram; returns the metadata to record"""
+    files, meta = encode_diagram_images(image, output_path)
+    return write_diagram_images(files, meta, manifest, artifact_id, store)
+
+def _delete_files(output_path):
+    paths = [output_path, variant_path(output_path)] + [variant_path(output_path, w) for w in RESPONSIVE_WIDTHS]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def remove_diagram_images(output_path, store=None):
+    """
+    Delete a diagram's PNG and WebP variants (page no longer has a diagram)
+    Files other questions were pointed at by the store are kept
+    """
+    if store is not None:
+        name = os.path.basename(output_path)
+        store.unalias(name)
+        if not store.release(name):
+            return
+    _delete_files(output_path)
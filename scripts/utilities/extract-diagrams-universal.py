@@ -12,10 +12,20 @@ Supports:
 import fitz  # PyMuPDF
 import os
 import re
+import argparse
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from PIL import Image
 import io
 
+from diagram_db import DEFAULT_DATABASE_URL, apply_diagrams, exam_name_for
+from diagram_images import encode_diagram_images, save_diagram_images, write_diagram_images
+from extraction_manifest import ExtractionManifest, page_fingerprint
+from extraction_metrics import add_metrics_args, metrics, metrics_from_args, timed
+from image_store import ImageStore
+
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
@@ -30,12 +40,16 @@ PDFS = {
     'Kangaroo': {
         'files': [r'C:\Users\vihaa\Downloads\mathkangaroo.pdf'],
         'output_prefix': 'kangaroo',
+        'year_pattern': r'(?:19|20)\d{2}',  # Exam year in the file name, if any (last match wins)
         'auto_detect': True  # Auto-detect which pages have diagrams
     }
 }
 
 OUTPUT_DIR = r'C:\Users\vihaa\ayanshtest\web-app\public\images\questions'
 
+# Records source PDFs and written diagrams, so reruns skip unchanged PDFs/pages
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, '.diagram-manifest.json')
+
 # Cropping presets
 CROP_PRESETS = {
     'MOEMS': {
@@ -58,43 +72,115 @@ CROP_PRESETS = {
     }
 }
 
+# Graphics closer than this (points) belong to the same diagram
+CLUSTER_GAP = 12
+# Spatial hash cell size (points) used when clustering graphics
+CLUSTER_CELL = 64
+# Clusters narrower or shorter than this (points) are rules/underlines, not diagrams
+MIN_DIAGRAM_SIZE = 20
+# Loaded page objects kept per document (parsed graphics are kept for every page)
+PAGE_CACHE_SIZE = 32
+
 # ============================================================================
 # SMART DIAGRAM DETECTION
 # ============================================================================
 
-def has_significant_images(page):
-    """Check if page has embedded images (likely diagrams)"""
-    image_list = page.get_images(full=True)
-    return len(image_list) > 0
+def graphic_rects(page, images=None):
+    """
+    Bounding boxes (x0, y0, x1, y1) of the page's vector drawings and placed images
+    Page backgrounds, invisible white paths and layout rules/frames are ignored
+    images: page.get_images(full=True), if the caller already has it
+    """
+    page_rect = page.rect
+    page_area = page_rect.width * page_rect.height
+    white = (1.0, 1.0, 1.0)
+    rects = []
+
+    for path in page.get_drawings():
+        rect = path['rect']
+        stroke, fill = path.get('color'), path.get('fill')
+        if rect.width * rect.height > 0.9 * page_area:
+            continue
+        if stroke in (None, white) and fill in (None, white):
+            continue
+        # Horizontal/vertical rules across the page
+        if min(rect.width, rect.height) < 2 and max(rect.width, rect.height) > 0.5 * page_rect.width:
+            continue
+        # Unfilled boxes framing a whole section of the page
+        is_box = len(path['items']) == 1 and path['items'][0][0] in ('re', 'qu')
+        if is_box and fill is None and rect.width > 0.6 * page_rect.width and rect.height > 0.2 * page_rect.height:
+            continue
+        rects.append((rect.x0, rect.y0, rect.x1, rect.y1))
 
-def estimate_diagram_region(page):
+    if images is None:
+        images = page.get_images(full=True)
+    for img in images:
+        bbox = page.get_image_bbox(img)
+        if bbox.is_infinite or bbox.is_empty:
+            continue
+        rects.append((bbox.x0, bbox.y0, bbox.x1, bbox.y1))
+
+    return rects
+
+def cluster_rects(rects, gap=CLUSTER_GAP, cell=CLUSTER_CELL):
     """
-    Analyze page to find likely diagram location
-    Returns: (top, bottom, left, right) percentages
+    Group rects that lie within `gap` points of each other into clusters
+    A uniform-grid spatial hash limits the distance checks to nearby rects;
+    union-find merges them. Returns one bounding box per cluster.
     """
-    # Get all drawing/image regions
-    drawings = page.get_drawings()
-    images = page.get_images(full=True)
+    parent = list(range(len(rects)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    grid = {}
+    for i, (x0, y0, x1, y1) in enumerate(rects):
+        for cx in range(int((x0 - gap) // cell), int((x1 + gap) // cell) + 1):
+            for cy in range(int((y0 - gap) // cell), int((y1 + gap) // cell) + 1):
+                bucket = grid.setdefault((cx, cy), [])
+                for j in bucket:
+                    ox0, oy0, ox1, oy1 = rects[j]
+                    if x0 - gap <= ox1 and ox0 <= x1 + gap and y0 - gap <= oy1 and oy0 <= y1 + gap:
+                        parent[find(i)] = find(j)
+                bucket.append(i)
+
+    clusters = {}
+    for i, (x0, y0, x1, y1) in enumerate(rects):
+        root = find(i)
+        if root in clusters:
+            cx0, cy0, cx1, cy1 = clusters[root]
+            clusters[root] = (min(cx0, x0), min(cy0, y0), max(cx1, x1), max(cy1, y1))
+        else:
+            clusters[root] = (x0, y0, x1, y1)
+
+    return list(clusters.values())
 
-    if not images and not drawings:
+def estimate_diagram_regions(page, rects=None):
+    """
+    Analyze page to find likely diagram locations
+    Vector drawings and image boxes are clustered spatially; each cluster big
+    enough to be a diagram becomes one region, ordered top to bottom
+    rects: graphic_rects(page), if the caller already has them
+    Returns: list of (top, bottom, left, right) percentages, or None
+    """
+    if rects is None:
+        rects = graphic_rects(page)
+    if not rects:
         return None
 
     page_rect = page.rect
     page_height = page_rect.height
     page_width = page_rect.width
 
-    # Find bounding box of all graphics
-    min_y, max_y = page_height, 0
-    min_x, max_x = page_width, 0
-
-    for img in images:
-        bbox = page.get_image_bbox(img)
-        min_y = min(min_y, bbox.y0)
-        max_y = max(max_y, bbox.y1)
-        min_x = min(min_x, bbox.x0)
-        max_x = max(max_x, bbox.x1)
+    regions = []
+    for min_x, min_y, max_x, max_y in sorted(cluster_rects(rects), key=lambda r: (r[1], r[0])):
+        # Rules, underlines and answer lines are too thin to be diagrams
+        if max_x - min_x < MIN_DIAGRAM_SIZE or max_y - min_y < MIN_DIAGRAM_SIZE:
+            continue
 
-    if max_y > min_y and max_x > min_x:
         # Add 10% padding
         padding_y = (max_y - min_y) * 0.1
         padding_x = (max_x - min_x) * 0.1
@@ -104,76 +190,151 @@ def estimate_diagram_region(page):
         left_percent = max(0, (min_x - padding_x) / page_width)
         right_percent = min(1, (max_x + padding_x) / page_width)
 
-        return (top_percent, bottom_percent, left_percent, right_percent)
+        regions.append((top_percent, bottom_percent, left_percent, right_percent))
 
-    return None
+    return regions or None
+
+def merge_regions(regions):
+    """
+    One (top, bottom, left, right) region covering all of `regions`
+    A figure often clusters into several parts (a grid beside a polygon), and a
+    question has one imageUrl, so its regions are cropped together
+    """
+    return (
+        min(region[0] for region in regions),
+        max(region[1] for region in regions),
+        min(region[2] for region in regions),
+        max(region[3] for region in regions)
+    )
 
 # ============================================================================
-# IMPROVED CROPPING
+# PAGE ANALYSIS CACHE
 # ============================================================================
 
-def crop_diagram_smart(pdf_document, page_num, output_path, preset='default', auto_detect=False, zoom=3.0):
+class PageAnalysisCache:
     """
-    Extract and crop diagram with smart detection or preset
+    Per-document cache of loaded pages and their parsed graphics
+    Each page's image list, image bboxes and drawings are parsed once and
+    shared by the region estimate, the page fingerprint and the crop
     """
-    page = pdf_document[page_num]
-    page_rect = page.rect
-    page_width = page_rect.width
-    page_height = page_rect.height
 
-    # Determine crop area
-    if auto_detect:
-        detected = estimate_diagram_region(page)
-        if detected:
-            top_p, bottom_p, left_p, right_p = detected
-            print(f"    Auto-detected diagram: top={top_p:.2f}, bottom={bottom_p:.2f}")
+    def __init__(self, pdf_doc, max_pages=PAGE_CACHE_SIZE):
+        self.doc = pdf_doc
+        self.max_pages = max_pages
+        self._pages = OrderedDict()
+        self._analyses = {}
+
+    def page(self, page_num):
+        """Loaded page object, kept for the most recently used pages"""
+        page = self._pages.get(page_num)
+        if page is None:
+            page = self.doc.load_page(page_num)
+            self._pages[page_num] = page
+            if len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
         else:
-            # Fallback to preset
-            crop_settings = CROP_PRESETS.get(preset, CROP_PRESETS['default'])
-            top_p = crop_settings['top_percent']
-            bottom_p = crop_settings['bottom_percent']
-            left_p = crop_settings['left_percent']
-            right_p = crop_settings['right_percent']
-            print(f"    Using preset crop")
-    else:
-        crop_settings = CROP_PRESETS.get(preset, CROP_PRESETS['default'])
-        top_p = crop_settings['top_percent']
-        bottom_p = crop_settings['bottom_percent']
-        left_p = crop_settings['left_percent']
-        right_p = crop_settings['right_percent']
+            self._pages.move_to_end(page_num)
+        return page
+
+    def analysis(self, page_num):
+        """{'images': get_images(full=True), 'graphic_rects': drawing + image bboxes}"""
+        analysis = self._analyses.get(page_num)
+        if analysis is None:
+            page = self.page(page_num)
+            images = page.get_images(full=True)
+            analysis = {
+                'images': images,
+                'graphic_rects': graphic_rects(page, images)
+            }
+            self._analyses[page_num] = analysis
+        return analysis
+
+    def estimate_diagram_regions(self, page_num):
+        return estimate_diagram_regions(self.page(page_num), self.analysis(page_num)['graphic_rects'])
+
+# ============================================================================
+# IMPROVED CROPPING
+# ============================================================================
 
-    # Define crop rectangle
+def render_crop(page, region, zoom=3.0):
+    """Render a (top, bottom, left, right) percentage region at high resolution as a PIL image"""
+    page_rect = page.rect
+    top_p, bottom_p, left_p, right_p = region
     crop_rect = fitz.Rect(
-        page_width * left_p,
-        page_height * top_p,
-        page_width * right_p,
-        page_height * bottom_p
+        page_rect.width * left_p,
+        page_rect.height * top_p,
+        page_rect.width * right_p,
+        page_rect.height * bottom_p
     )
+    with metrics.span('render'):
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=crop_rect)
+    return Image.frombytes('RGB', (pix.width, pix.height), pix.samples)
 
-    # Render at high resolution
-    mat = fitz.Matrix(zoom, zoom)
-    pix = page.get_pixmap(matrix=mat, clip=crop_rect)
-
-    # Save as PNG
-    pix.save(output_path)
+@timed('crop')
+def crop_diagram_smart(pdf_document, page_num, output_path, preset='default', auto_detect=False, zoom=3.0,
+                       manifest=None, artifact_id=None, analysis_cache=None, store=None):
+    """
+    Extract and crop diagram with smart detection or preset
+    With auto_detect, the crop is the union of the graphics clusters found on
+    the page (one question per page), else the preset's band
+    The crop is written as an optimized PNG plus WebP variants (diagram_images.py)
+    With a manifest, a file is only rewritten if its bytes changed
+    With an ImageStore, a copy of a stored image is not written and
+    its metadata (URL) is returned instead
+    analysis_cache: PageAnalysisCache for pdf_document, to reuse already parsed pages
+    Returns: image metadata of the crop (url, bytes, variants)
+    """
+    if analysis_cache is None:
+        analysis_cache = PageAnalysisCache(pdf_document)
+    page = analysis_cache.page(page_num)
+
+    # Determine crop areas
+    regions = analysis_cache.estimate_diagram_regions(page_num) if auto_detect else None
+    if regions:
+        region = merge_regions(regions)
+        print(f"    Auto-detected diagram: top={region[0]:.2f}, bottom={region[1]:.2f} "
+              f"({len(regions)} part{'s' if len(regions) > 1 else ''})")
+    else:
+        # Fallback to preset
+        crop_settings = CROP_PRESETS.get(preset, CROP_PRESETS['default'])
+        region = (
+            crop_settings['top_percent'],
+            crop_settings['bottom_percent'],
+            crop_settings['left_percent'],
+            crop_settings['right_percent']
+        )
+        if auto_detect:
+            print(f"    Using preset crop")
 
-    # Get file size for feedback
-    file_size = os.path.getsize(output_path)
-    return file_size
+    # Render at high resolution, save as optimized PNG + WebP variants
+    image = render_crop(page, region, zoom)
+    return save_diagram_images(image, output_path, manifest, artifact_id, store)
 
 # ============================================================================
 # PDF PROCESSING
 # ============================================================================
 
-def process_moems_pdf(pdf_path, year):
-    """Process MOEMS PDF and extract diagrams"""
+def process_moems_pdf(pdf_path, year, manifest=None, store=None):
+    """
+    Process MOEMS PDF and extract diagrams
+    With a manifest, unchanged PDFs and pages reuse their recorded diagrams
+    With an ImageStore, crops identical to a stored image point at it
+    """
     print(f"\nProcessing MOEMS {year}: {os.path.basename(pdf_path)}")
 
+    if manifest is not None and manifest.pdf_unchanged(pdf_path):
+        diagrams = manifest.records_for_pdf(pdf_path)
+        if diagrams is not None:
+            print(f"  SKIP: unchanged since last run ({len(diagrams)} diagrams)")
+            return diagrams
+
     pdf_doc = fitz.open(pdf_path)
+    analysis_cache = PageAnalysisCache(pdf_doc)
     total_pages = pdf_doc.page_count
     print(f"  Pages: {total_pages} (contests 1-{total_pages // 5})")
 
     diagrams_extracted = []
+    artifact_ids = []
     questions_to_extract = PDFS['MOEMS']['questions_with_diagrams']
 
     for q_num in questions_to_extract:
@@ -185,39 +346,69 @@ def process_moems_pdf(pdf_path, year):
         if page_num >= total_pages:
             print(f"  SKIP: {q_num} (page {page_num}) - not in PDF")
             continue
+        metrics.begin_page(pdf_path, page_num)
 
-        # Check if page has images
-        if not has_significant_images(pdf_doc[page_num]):
-            print(f"  SKIP: {q_num} (page {page_num}) - no images detected")
+        # Check if page has a diagram (placed image or vector drawing)
+        if not analysis_cache.estimate_diagram_regions(page_num):
+            print(f"  SKIP: {q_num} (page {page_num}) - no diagram detected")
             continue
 
         output_filename = f"{PDFS['MOEMS']['output_prefix']}-{year}-{q_num}.png"
         output_path = os.path.join(OUTPUT_DIR, output_filename)
+        artifact_id = output_filename
+
+        if manifest is not None:
+            page_hash = page_fingerprint(
+                analysis_cache.page(page_num),
+                "preset=MOEMS;auto_detect=True;zoom=3.0",
+                analysis_cache.analysis(page_num)['images']
+            )
+            if manifest.is_current(artifact_id, page_hash):
+                print(f"  SKIP: {q_num} (page {page_num}) - unchanged")
+                diagrams_extracted.append(manifest.record(artifact_id))
+                artifact_ids.append(artifact_id)
+                continue
 
         print(f"  Extracting {q_num} (page {page_num})...", end=" ")
 
         try:
-            file_size = crop_diagram_smart(
+            image = crop_diagram_smart(
                 pdf_doc,
                 page_num,
                 output_path,
                 preset='MOEMS',
-                auto_detect=True
+                auto_detect=True,
+                manifest=manifest,
+                artifact_id=artifact_id,
+                analysis_cache=analysis_cache,
+                store=store
             )
-            print(f"SUCCESS ({file_size // 1024}KB)")
-            diagrams_extracted.append({
+            print(f"SUCCESS ({image['bytes'] // 1024}KB)")
+            diagram = {
                 'question': q_num,
                 'filename': output_filename,
-                'path': f"/images/questions/{output_filename}",
+                'path': image['url'],
+                'image': image,
                 'year': year
-            })
+            }
+            diagrams_extracted.append(diagram)
+            if manifest is not None:
+                own_file = diagram['path'].endswith('/' + output_filename)
+                manifest.record_artifact(artifact_id, page_hash, diagram, output_path if own_file else None)
+                artifact_ids.append(artifact_id)
         except Exception as e:
             print(f"ERROR: {e}")
 
+    metrics.end_page()
     pdf_doc.close()
+
+    if manifest is not None:
+        manifest.record_pdf(pdf_path, artifact_ids)
+        manifest.save()
+
     return diagrams_extracted
 
-def process_all_moems():
+def process_all_moems(manifest=None, store=None):
     """Process all MOEMS PDFs"""
     moems_dir = PDFS['MOEMS']['dir']
     pattern = re.compile(PDFS['MOEMS']['pattern'])
@@ -230,17 +421,211 @@ def process_all_moems():
             year_start, year_end = match.groups()
             year = year_end  # Use ending year as exam year
 
-            diagrams = process_moems_pdf(str(pdf_file), year)
+            with metrics.pdf(pdf_file):
+                diagrams = process_moems_pdf(str(pdf_file), year, manifest, store)
             all_diagrams.extend(diagrams)
 
     return all_diagrams
 
+# ============================================================================
+# KANGAROO AUTO-DETECT SCANNER
+# ============================================================================
+#
+# Kangaroo books are long and any page may hold diagrams, so every page's
+# graphics are analysed (parsed and clustered, not rendered) in parallel
+# chunks, and only the pages with diagram regions are rendered and encoded,
+# also in the pool. The parent writes the files through the manifest and
+# image store.
+
+SCAN_CHUNK_PAGES = 16     # Pages analysed per worker job
+KANGAROO_ZOOM = 3.0
+KANGAROO_SETTINGS = f"preset=Kangaroo;auto_detect=True;zoom={KANGAROO_ZOOM}"
+# "7. ..." or "12) ..." at the start of a text block
+QUESTION_NUMBER = re.compile(r'^\s*(\d{1,2})[.)]\s')
+
+# Documents opened by this worker process, keyed by PDF path
+_scan_docs = {}
+
+def _scan_doc(pdf_path):
+    pdf = _scan_docs.get(pdf_path)
+    if pdf is None:
+        pdf = fitz.open(pdf_path)
+        _scan_docs[pdf_path] = pdf
+    return pdf
+
+def question_markers(page):
+    """(x0, y0, number) of every text block that starts with a question number"""
+    markers = []
+    for x0, y0, _, _, text, *_ in page.get_text('blocks'):
+        match = QUESTION_NUMBER.match(text)
+        if match:
+            markers.append((x0, y0, match.group(1)))
+    return markers
+
+def question_for_region(markers, region, page_rect):
+    """
+    Number of the question a diagram belongs to: the nearest question marker
+    above the region's centre (the lowest one on the page that is still above
+    it), preferring the region's own column
+    Returns None if no question number precedes it on the page
+    """
+    top_p, bottom_p, left_p, right_p = region
+    center_y = (top_p + bottom_p) / 2 * page_rect.height
+    left_column = (left_p + right_p) / 2 < 0.5
+    above = [marker for marker in markers if marker[1] <= center_y]
+    same_column = [marker for marker in above if (marker[0] < page_rect.width / 2) == left_column]
+    candidates = same_column or above
+    if not candidates:
+        return None
+    return max(candidates, key=lambda marker: marker[1])[2]
+
+def scan_chunk_job(job):
+    """
+    Process-pool worker: analyse pages [start, end) of a PDF without rendering
+    Returns [(page_num, page_hash, [(question or None, region)])] for the
+    pages with diagram regions (embedded images or clustered vector drawings),
+    with the regions of each question merged into one
+    """
+    pdf_path, start, end = job
+    analysis_cache = PageAnalysisCache(_scan_doc(pdf_path))
+    found = []
+    for page_num in range(start, end):
+        regions = analysis_cache.estimate_diagram_regions(page_num)
+        if not regions:
+            continue
+        page = analysis_cache.page(page_num)
+        page_hash = page_fingerprint(page, KANGAROO_SETTINGS, analysis_cache.analysis(page_num)['images'])
+
+        markers = question_markers(page)
+        groups = OrderedDict()
+        for region in regions:
+            groups.setdefault(question_for_region(markers, region, page.rect), []).append(region)
+        found.append((page_num, page_hash, [(question, merge_regions(group)) for question, group in groups.items()]))
+    return found
+
+def render_page_job(job):
+    """
+    Process-pool worker: render and encode a page's crops
+    job: (pdf_path, page_num, [(output_path, region)])
+    Returns encode_diagram_images (files, meta) per output_path
+    """
+    pdf_path, page_num, outputs = job
+    page = _scan_doc(pdf_path)[page_num]
+    return [encode_diagram_images(render_crop(page, region, KANGAROO_ZOOM), output_path)
+            for output_path, region in outputs]
+
+def kangaroo_year(pdf_path):
+    years = re.findall(PDFS['Kangaroo']['year_pattern'], os.path.basename(pdf_path))
+    return years[-1] if years else None
+
+def process_kangaroo_pdf(pdf_path, executor, manifest=None, store=None):
+    """
+    Scan every page of a Kangaroo book in the worker pool and extract the
+    diagrams it finds, one record per (page, question)
+    With a manifest, unchanged PDFs and pages reuse their recorded diagrams
+    """
+    print(f"\nScanning Kangaroo book: {os.path.basename(pdf_path)}")
+
+    if manifest is not None and manifest.pdf_unchanged(pdf_path):
+        diagrams = manifest.records_for_pdf(pdf_path)
+        if diagrams is not None:
+            print(f"  SKIP: unchanged since last run ({len(diagrams)} diagrams)")
+            return diagrams
+
+    prefix = PDFS['Kangaroo']['output_prefix']
+    year = kangaroo_year(pdf_path)
+    book = year or re.sub(r'[^a-z0-9]+', '-', Path(pdf_path).stem.lower()).strip('-')
+    with fitz.open(pdf_path) as pdf:
+        page_count = pdf.page_count
+
+    # Analyse every page in parallel chunks
+    start = time.perf_counter()
+    jobs = [(pdf_path, first, min(first + SCAN_CHUNK_PAGES, page_count))
+            for first in range(0, page_count, SCAN_CHUNK_PAGES)]
+    # Worker time is not seen by the metrics spans: the phase counts as a whole
+    with metrics.span('scan'):
+        pages = [page for chunk in executor.map(scan_chunk_job, jobs) for page in chunk]
+    seconds = time.perf_counter() - start
+    print(f"  Scanned {page_count} pages in {seconds:.1f}s ({page_count / max(seconds, 1e-9):.0f} pages/s), "
+          f"{len(pages)} with diagrams")
+
+    # Reuse unchanged pages; queue the rest for rendering
+    records = OrderedDict()
+    render_jobs = []
+    for page_num, page_hash, groups in pages:
+        outputs = []
+        for question, region in groups:
+            label = f"p{page_num + 1}-q{question}" if question else f"p{page_num + 1}"
+            filename = f"{prefix}-{book}-{label}.png"
+            records[filename] = None
+            if manifest is not None and manifest.is_current(filename, page_hash):
+                records[filename] = manifest.record(filename)
+            else:
+                outputs.append((os.path.join(OUTPUT_DIR, filename), region, question))
+        if outputs:
+            render_jobs.append((page_num, page_hash, outputs))
+
+    # Render + encode in the pool, write here (manifest and store are not shared)
+    rendered = executor.map(render_page_job, [
+        (pdf_path, page_num, [(output_path, region) for output_path, region, _ in outputs])
+        for page_num, _, outputs in render_jobs
+    ])
+    # Crop time here is waiting on the pool's render + encode; writes count separately
+    with metrics.span('crop'):
+        for (page_num, page_hash, outputs), encoded_outputs in zip(render_jobs, rendered):
+            metrics.begin_page(pdf_path, page_num)
+            for (output_path, region, question), (files, meta) in zip(outputs, encoded_outputs):
+                filename = os.path.basename(output_path)
+                image = write_diagram_images(files, meta, manifest, filename, store)
+                diagram = {
+                    'question': question,
+                    'page': page_num + 1,
+                    'filename': filename,
+                    'path': image['url'],
+                    'image': image,
+                    'year': year
+                }
+                records[filename] = diagram
+                if manifest is not None:
+                    own_file = diagram['path'].endswith('/' + filename)
+                    manifest.record_artifact(filename, page_hash, diagram, output_path if own_file else None)
+                label = f"question {question}" if question else "no question number"
+                print(f"  Page {page_num + 1} ({label}): {image['bytes'] // 1024}KB")
+    metrics.end_page()
+
+    if manifest is not None:
+        manifest.record_pdf(pdf_path, list(records))
+        manifest.save()
+
+    return list(records.values())
+
+def process_all_kangaroo(files, workers, manifest=None, store=None):
+    """Scan every Kangaroo book with one shared process pool"""
+    found = []
+    for path in files:
+        if os.path.exists(path):
+            found.append(path)
+        else:
+            print(f"  SKIP: {path} - not found")
+    if not found:
+        return []
+
+    all_diagrams = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for pdf_path in found:
+            with metrics.pdf(pdf_path):
+                all_diagrams.extend(process_kangaroo_pdf(pdf_path, executor, manifest, store))
+    return all_diagrams
+
 # ============================================================================
 # SQL GENERATION
 # ============================================================================
 
+def sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
 def generate_sql(diagrams, output_file='update-diagrams.sql'):
-    """Generate SQL to update database"""
+    """Generate SQL to update database (fallback for --apply-db)"""
     if not diagrams:
         return None
 
@@ -249,15 +634,15 @@ def generate_sql(diagrams, output_file='update-diagrams.sql'):
         f.write("-- Run with: PGPASSWORD=postgres psql -U postgres -h localhost -d ayansh_math_prep -f update-diagrams.sql\n\n")
 
         for item in diagrams:
-            exam_name = 'MOEMS Division E' if 'moems' in item['filename'] else 'Math Kangaroo'
+            exam_name = exam_name_for(item)
 
             f.write(f"-- Update {item['question']} ({item['year']})\n")
             f.write(f"UPDATE questions SET\n")
             f.write(f"  \"hasImage\" = true,\n")
-            f.write(f"  \"imageUrl\" = '{item['path']}'\n")
-            f.write(f"WHERE \"examName\" = '{exam_name}'\n")
-            f.write(f"  AND \"examYear\" = '{item['year']}'\n")
-            f.write(f"  AND \"questionNumber\" = '{item['question']}';\n\n")
+            f.write(f"  \"imageUrl\" = {sql_literal(item['path'])}\n")
+            f.write(f"WHERE \"examName\" = {sql_literal(exam_name)}\n")
+            f.write(f"  AND \"examYear\" = {sql_literal(item['year'])}\n")
+            f.write(f"  AND \"questionNumber\" = {sql_literal(item['question'])};\n\n")
 
     print(f"\nSQL saved to: {output_file}")
     return output_file
@@ -266,7 +651,30 @@ def generate_sql(diagrams, output_file='update-diagrams.sql'):
 # MAIN
 # ============================================================================
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Universal Math Competition Diagram Extractor")
+    parser.add_argument('--full', action='store_true',
+                        help="Reprocess every PDF and page, ignoring the extraction manifest")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Processes scanning Kangaroo pages (default: all cores)")
+    parser.add_argument('--kangaroo', action='append', metavar='PDF',
+                        help="Kangaroo book to scan instead of the configured files (repeatable)")
+    parser.add_argument('--no-dedupe', action='store_true',
+                        help="Write every crop under its own name, even exact copies of stored images")
+    parser.add_argument('--apply-db', action='store_true',
+                        help="Apply the diagrams to the database in one COPY + UPDATE transaction "
+                             "instead of writing update-diagrams.sql")
+    parser.add_argument('--database-url', default=DEFAULT_DATABASE_URL,
+                        help="PostgreSQL URL for --apply-db (default: $DATABASE_URL or local ayansh_math_prep)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="With --apply-db, report what would change and roll back")
+    add_metrics_args(parser)
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    metrics_from_args(args, 'diagrams_universal')
+
     print("=" * 70)
     print("Universal Math Competition Diagram Extractor")
     print("For legally purchased PDFs - Personal use only")
@@ -278,21 +686,62 @@ def main():
     # Process MOEMS
     print("\n[1/2] Processing MOEMS PDFs...")
     print("-" * 70)
-    moems_diagrams = process_all_moems()
+    manifest = ExtractionManifest(MANIFEST_PATH, enabled=not args.full)
+    store = ImageStore(OUTPUT_DIR, enabled=not args.no_dedupe)
+    moems_diagrams = process_all_moems(manifest, store)
+
+    # Scan Kangaroo books page by page
+    print("\n[2/2] Scanning Math Kangaroo books...")
+    print("-" * 70)
+    kangaroo_files = args.kangaroo or PDFS['Kangaroo']['files']
+    kangaroo_diagrams = process_all_kangaroo(kangaroo_files, max(1, args.workers), manifest, store)
+    store.save()
+
+    # Only diagrams with a year and question number can be matched to a question
+    diagrams = moems_diagrams + kangaroo_diagrams
+    db_diagrams = [item for item in diagrams if item.get('year') and item.get('question')]
 
     # Summary
     print("\n" + "=" * 70)
-    print(f"COMPLETE: Extracted {len(moems_diagrams)} diagrams")
+    print(f"COMPLETE: Extracted {len(diagrams)} diagrams "
+          f"(MOEMS: {len(moems_diagrams)}, Kangaroo: {len(kangaroo_diagrams)})")
+    if len(db_diagrams) < len(diagrams):
+        print(f"[WARN] {len(diagrams) - len(db_diagrams)} diagrams have no year or question number "
+              f"and are left out of the database update")
+    print(manifest.summary())
+    print(store.summary())
     print("=" * 70)
 
+    metrics.finish()
+
+    if not db_diagrams:
+        return
+
+    # Bulk apply, falling back to the SQL file if the database can't be reached
+    if args.apply_db:
+        try:
+            updated, unmatched = apply_diagrams(db_diagrams, args.database_url, dry_run=args.dry_run)
+            verb = "Would update" if args.dry_run else "Updated"
+            print(f"\n[DB] {verb} {updated} questions in one transaction")
+            if unmatched:
+                print(f"[WARN] {unmatched} diagrams have no matching question (examName/examYear/questionNumber)")
+            if args.dry_run:
+                print("[DB] Dry run - rolled back")
+            print("\nNext steps:")
+            print("1. Review extracted diagrams in: web-app/public/images/questions/")
+            print("2. Clear localStorage and test in practice mode")
+            return
+        except Exception as e:
+            print(f"\n[ERROR] Bulk apply failed, nothing was changed: {e}")
+            print("Writing update-diagrams.sql instead")
+
     # Generate SQL
-    if moems_diagrams:
-        generate_sql(moems_diagrams)
+    generate_sql(db_diagrams)
 
-        print("\nNext steps:")
-        print("1. Review extracted diagrams in: web-app/public/images/questions/")
-        print("2. Run: PGPASSWORD=postgres psql -U postgres -h localhost -d ayansh_math_prep -f update-diagrams.sql")
-        print("3. Clear localStorage and test in practice mode")
+    print("\nNext steps:")
+    print("1. Review extracted diagrams in: web-app/public/images/questions/")
+    print("2. Run: PGPASSWORD=postgres psql -U postgres -h localhost -d ayansh_math_prep -f update-diagrams.sql")
+    print("3. Clear localStorage and test in practice mode")
 
 if __name__ == "__main__":
     main()
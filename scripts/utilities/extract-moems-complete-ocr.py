@@ -4,19 +4,41 @@ Complete MOEMS Question Extractor with OCR
 Extracts questions, options, AND diagrams from MOEMS PDFs
 
 Requirements:
-    pip install pymupdf pytesseract pillow
+    pip install pymupdf pytesseract pillow numpy
     Install Tesseract: https://github.com/tesseract-ocr/tesseract
 """
 
 import fitz  # PyMuPDF
 import pytesseract
-from PIL import Image
-import io
 import re
-import json
 import os
+import argparse
+import asyncio
+import contextlib
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
+from PIL import Image
+
+from ocr_cache import add_cache_args, cache_from_args
+from extraction_manifest import ExtractionManifest, page_fingerprint
+from extraction_metrics import add_metrics_args, metrics, metrics_from_args
+from image_store import ImageStore
+from diagram_detect import DIAGRAM_SEARCH_BAND, detect_diagram_bbox
+from diagram_images import encode_diagram_images, remove_diagram_images, save_diagram_images, write_diagram_images
+from ocr_batch import BATCH_RENDER_KEY, ocr_pages_stitched
+from ocr_engine import get_engine, pixmap_to_image
+from page_ocr import (
+    ADAPTIVE_RENDER_KEY, OCR_CONFIG_KEY, OCR_RENDER_KEY, OCR_ZOOM, PREPROCESS_RENDER_KEY,
+    REGIONS_RENDER_KEY, AdaptiveStats, PreprocessStats, RegionStats,
+    adaptive_decision, blank_page_reason, extract_text_adaptive, extract_text_from_page,
+    extract_text_hybrid, extract_text_preprocessed, extract_text_regions,
+    preprocess_decision, region_decision, text_layer_quality
+)
+from page_raster import PageRaster, RenderStats
+from question_stream import QuestionStream, build_pretty_json, read_ndjson
+
 # Set Tesseract path for Windows
 pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
@@ -28,6 +50,48 @@ MOEMS_PDF_DIR = r"C:\Users\vihaa\ayanshtest\moems-pdfs"
 OUTPUT_DIR = r"C:\Users\vihaa\ayanshtest"
 IMAGE_DIR = r"C:\Users\vihaa\ayanshtest\web-app\public\images\questions"
 
+# Text extraction options, set from the command line in main() and copied
+# into every OCR worker process
+OCR_OPTIONS = {
+    'hybrid': False,    # Use the PDF text layer when it scores well, OCR only the rest
+    'adaptive': False,  # OCR at low zoom first, re-render only low-confidence pages/lines
+    'preprocess': False,  # OCR preprocessing variants concurrently, keep the most confident
+    'regions': False,   # OCR only text bands, not diagrams or blank answer space
+    'skip_blank': True,  # Skip blank/no-text pages before rendering them
+    'batch': 0,         # Pages whose text crops are stitched into one Tesseract call (0 = off)
+    'shared_raster': True,  # Render each page once for both OCR and the diagram crop
+}
+
+# Per-run counters reported in the summary
+run_stats = {
+    'text_layer_pages': 0,
+    'ocr_pages': 0,
+    'blank_pages': 0,
+}
+adaptive_stats = AdaptiveStats()
+preprocess_stats = PreprocessStats()
+region_stats = RegionStats()
+render_stats = RenderStats()
+batch_stats = {'pages': 0, 'calls': 0, 'seconds': 0.0}
+
+def reset_run_stats():
+    """Zero the per-run counters, for a caller that runs the extractor repeatedly in one process"""
+    global adaptive_stats, preprocess_stats, region_stats, render_stats
+    for counters in (run_stats, batch_stats):
+        for key in counters:
+            counters[key] = type(counters[key])()
+    adaptive_stats = AdaptiveStats()
+    preprocess_stats = PreprocessStats()
+    region_stats = RegionStats()
+    render_stats = RenderStats()
+
+# Records what each question was extracted from, so reruns skip unchanged PDFs/pages
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, 'moems-questions-ocr.manifest.json')
+
+# Questions are appended here as they are parsed; the JSON file is built from it at the end
+OUTPUT_FILE = os.path.join(OUTPUT_DIR, 'moems-questions-ocr.json')
+STREAM_FILE = os.path.join(OUTPUT_DIR, 'moems-questions-ocr.ndjson')
+
 # MOEMS structure: 5 questions per contest, 5 contests per year
 # Each question is on a separate page
 # Page 0 = Contest 1, Question A
@@ -38,27 +102,260 @@ IMAGE_DIR = r"C:\Users\vihaa\ayanshtest\web-app\public\images\questions"
 # OCR TEXT EXTRACTION
 # ============================================================================
 
-def extract_text_from_page(page):
+def ocr_render_key():
+    if OCR_OPTIONS['batch']:
+        return BATCH_RENDER_KEY
+    if OCR_OPTIONS['preprocess']:
+        return PREPROCESS_RENDER_KEY
+    if OCR_OPTIONS['regions']:
+        return REGIONS_RENDER_KEY
+    return ADAPTIVE_RENDER_KEY if OCR_OPTIONS['adaptive'] else OCR_RENDER_KEY
+
+def ocr_page(page, raster=None):
     """
-    Extract text from PDF page using OCR
-    Returns raw OCR text
+    OCR one page at fixed or adaptive resolution, through the preprocessing
+    variants, or restricted to its text bands
+    raster: optional PageRaster shared with the diagram crop (fixed zoom and
+            preprocessing; adaptive and band OCR render only what they need)
+    Returns (text, info); info describes the zoom/variant/band decision, else None
     """
-    # Render page as high-resolution image
-    zoom = 3.0  # High quality for better OCR
-    mat = fitz.Matrix(zoom, zoom)
-    pix = page.get_pixmap(matrix=mat)
+    if OCR_OPTIONS['preprocess']:
+        return extract_text_preprocessed(page, raster)
+    if OCR_OPTIONS['regions']:
+        return extract_text_regions(page)
+    if OCR_OPTIONS['adaptive']:
+        return extract_text_adaptive(page)
+    return extract_text_from_page(page, raster), None
+
+def report_ocr(info, prefix):
+    """Print a page's adaptive zoom / variant / band decision and add it to the run totals"""
+    if not info:
+        return
+    if 'bands' in info:
+        print(f"{prefix}{region_decision(info)}")
+        region_stats.add(info)
+    elif 'variant' in info:
+        print(f"{prefix}{preprocess_decision(info)}")
+        preprocess_stats.add(info)
+    else:
+        print(f"{prefix}{adaptive_decision(info)}")
+        adaptive_stats.add(info)
+
+def skip_blank_page(page, prefix="    "):
+    """True (and counted) if the blank-page pre-filter says the page needs no OCR"""
+    if not OCR_OPTIONS['skip_blank']:
+        return False
+    reason = blank_page_reason(page)
+    if reason is None:
+        return False
+    print(f"{prefix}[BLANK] Skipped before OCR ({reason})")
+    run_stats['blank_pages'] += 1
+    return True
+
+def page_text(page, pdf_path, page_num, cache=None, raster=None):
+    """
+    Text for one page: the embedded text layer in hybrid mode when it is
+    good enough, otherwise OCR (through the cache when one is given)
+    Pages the blank-page pre-filter rejects return ""
+    raster: optional PageRaster, rendered only if OCR actually runs
+    """
+    if skip_blank_page(page):
+        return ""
 
-    # Convert to PIL Image
-    img_data = pix.tobytes("png")
-    img = Image.open(io.BytesIO(img_data))
+    def ocr():
+        print(f"    - Running OCR...")
+        result = {}
 
-    # Use Tesseract OCR
-    try:
-        text = pytesseract.image_to_string(img, lang='eng')
+        def compute():
+            text, result['info'] = ocr_page(page, raster)
+            return text
+
+        if cache is None:
+            text = compute()
+        else:
+            text = cache.get_or_compute(pdf_path, page_num, ocr_render_key(), OCR_CONFIG_KEY, compute)
+
+        report_ocr(result.get('info'), "    - OCR: ")
         return text
+
+    if OCR_OPTIONS['hybrid']:
+        text, source = extract_text_hybrid(page, ocr=ocr)
+    else:
+        text, source = ocr(), 'ocr'
+
+    run_stats['text_layer_pages' if source == 'text' else 'ocr_pages'] += 1
+    return text
+
+# ============================================================================
+# PARALLEL OCR
+# ============================================================================
+
+# Documents opened by this worker process, keyed by PDF path
+_worker_docs = {}
+_worker_doc_stamps = {}   # PDF path -> (mtime_ns, size) when it was opened
+
+def _init_ocr_worker(options):
+    """
+    Copy the parent's OCR options (workers may be spawned, not forked) and keep
+    each Tesseract process single-threaded so workers don't oversubscribe cores
+    """
+    OCR_OPTIONS.update(options)
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+    # Load the engine once per worker, not on its first page
+    get_engine()
+
+def _worker_doc(pdf_path):
+    """
+    Each worker opens its own fitz document and reuses it for later pages
+    A PDF replaced since it was opened (long-lived pools) is opened again
+    """
+    stat = os.stat(pdf_path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    pdf = _worker_docs.get(pdf_path)
+    if pdf is not None and _worker_doc_stamps.get(pdf_path) != stamp:
+        pdf.close()
+        pdf = None
+    if pdf is None:
+        pdf = fitz.open(pdf_path)
+        _worker_docs[pdf_path] = pdf
+        _worker_doc_stamps[pdf_path] = stamp
+    return pdf
+
+def close_worker_docs():
+    """Close and forget the documents opened by _worker_doc"""
+    for pdf in _worker_docs.values():
+        pdf.close()
+    _worker_docs.clear()
+    _worker_doc_stamps.clear()
+
+def ocr_page_job(job):
+    """
+    Process-pool worker: OCR one (pdf_path, page_num) job
+    Returns (text, adaptive info or None)
+    """
+    pdf_path, page_num = job
+    return ocr_page(_worker_doc(pdf_path)[page_num])
+
+def ocr_batch_job(batch):
+    """
+    OCR a list of (pdf_path, page_num) jobs as stitched composites
+    Runs in a worker process, or in the main process without --workers
+    Returns (one text per job, number of Tesseract calls)
+    """
+    pages = [_worker_doc(pdf_path)[page_num] for pdf_path, page_num in batch]
+    try:
+        return ocr_pages_stitched(pages)
     except Exception as e:
         print(f"    OCR Error: {e}")
-        return ""
+        return [""] * len(batch), 0
+
+def collect_ocr_jobs(pdfs, cache, manifest=None, stream=None):
+    """
+    (pdf_path, page_num) jobs still needing OCR
+    Pages already in the OCR cache, unchanged since the manifest was
+    written, already in the output stream (--resume) or blank are left out
+    Returns (ocr_texts of the pages resolved without OCR, jobs, cache keys of the jobs)
+    """
+    ocr_texts = {}
+    jobs = []
+    job_keys = []
+    for pdf_info in pdfs:
+        with fitz.open(pdf_info['path']) as pdf:
+            for page_num in pending_pages(pdf, pdf_info['path'], pdf_info['year'], manifest, stream):
+                job = (pdf_info['path'], page_num)
+
+                if skip_blank_page(pdf[page_num], f"  {pdf_info['name']} page {page_num + 1}: "):
+                    ocr_texts[job] = ""
+                    continue
+
+                # The text layer check is cheap enough to do here instead of in a worker
+                if OCR_OPTIONS['hybrid']:
+                    text = pdf[page_num].get_text()
+                    if text_layer_quality(text)['usable']:
+                        ocr_texts[job] = text
+                        run_stats['text_layer_pages'] += 1
+                        continue
+
+                key = cache.key(pdf_info['path'], page_num, ocr_render_key(), OCR_CONFIG_KEY) if cache.enabled else None
+                cached = cache.get(key)
+                if cached is not None:
+                    ocr_texts[job] = cached
+                    run_stats['ocr_pages'] += 1
+                else:
+                    jobs.append(job)
+                    job_keys.append(key)
+
+    return ocr_texts, jobs, job_keys
+
+def start_ocr_pool(workers):
+    """
+    Process pool of OCR workers, each with the current OCR options and a loaded engine
+    The workers are started here rather than on the first job: forked from a
+    process that already runs threads or has PDFs open, they could inherit a
+    held lock or a shared file offset. Call this before either.
+    """
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_ocr_worker, initargs=(dict(OCR_OPTIONS),))
+    pool.submit(os.getpid).result()   # The first job forks every worker
+    return pool
+
+def ocr_pages_parallel(pdfs, workers, cache, manifest=None, stream=None, pool=None):
+    """
+    OCR every page of every PDF that needs it (see collect_ocr_jobs) in a process pool
+    pool: an already running start_ocr_pool() to reuse (it is left running), else one is started
+    Returns {(pdf_path, page_num): ocr_text}; results come back in job order
+    """
+    ocr_texts, jobs, job_keys = collect_ocr_jobs(pdfs, cache, manifest, stream)
+
+    print(f"\nRunning OCR on {len(jobs)} pages with {workers} workers ({len(ocr_texts)} cached or text layer)...")
+    if not jobs:
+        return ocr_texts
+
+    # Contiguous chunks keep a worker on the same PDF, so it opens fewer documents
+    chunksize = max(1, len(jobs) // (workers * 4))
+    run_stats['ocr_pages'] += len(jobs)
+    with contextlib.nullcontext(pool) if pool is not None else start_ocr_pool(workers) as pool:
+        for job, key, (text, info) in zip(jobs, job_keys, pool.map(ocr_page_job, jobs, chunksize=chunksize)):
+            ocr_texts[job] = text
+            report_ocr(info, f"  {os.path.basename(job[0])} page {job[1] + 1}: ")
+            if text:
+                cache.put(key, text)
+
+    return ocr_texts
+
+def ocr_pages_batched(pdfs, batch_size, workers, cache, manifest=None, stream=None):
+    """
+    OCR every page that needs it in batches of `batch_size` pages, each batch's
+    text crops stitched into as few Tesseract calls as possible (see ocr_batch.py)
+    Batches are spread over a process pool when workers > 1
+    Returns {(pdf_path, page_num): ocr_text}
+    """
+    ocr_texts, jobs, job_keys = collect_ocr_jobs(pdfs, cache, manifest, stream)
+    batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+    key_batches = [job_keys[i:i + batch_size] for i in range(0, len(job_keys), batch_size)]
+
+    print(f"\nRunning batched OCR on {len(jobs)} pages in {len(batches)} batch(es) "
+          f"({len(ocr_texts)} cached or text layer)...")
+    if not jobs:
+        return ocr_texts
+
+    start = time.perf_counter()
+    run_stats['ocr_pages'] += len(jobs)
+    if workers > 1:
+        with start_ocr_pool(workers) as pool:
+            results = list(pool.map(ocr_batch_job, batches))
+    else:
+        results = [ocr_batch_job(batch) for batch in batches]
+
+    for batch, keys, (texts, calls) in zip(batches, key_batches, results):
+        batch_stats['calls'] += calls
+        for job, key, text in zip(batch, keys, texts):
+            ocr_texts[job] = text
+            if text:
+                cache.put(key, text)
+
+    batch_stats['pages'] += len(jobs)
+    batch_stats['seconds'] += time.perf_counter() - start
+    return ocr_texts
 
 # ============================================================================
 # TEXT PARSING
@@ -126,50 +423,149 @@ def parse_options(ocr_text):
 # DIAGRAM EXTRACTION
 # ============================================================================
 
-def extract_diagram_from_page(page, output_path):
+DIAGRAM_ZOOM = 3.0
+
+def diagram_rect(page):
     """
-    Extract diagram from PDF page
-    Uses middle portion of page (skip question text at top, answer space at bottom)
+    Tight bounding box of the page's diagram, or None if it has none
+    Searches the middle portion of the page (skip question text at top, answer
+    space at bottom) with a low-resolution in-memory ink detector
     """
-    page_rect = page.rect
-    page_width = page_rect.width
-    page_height = page_rect.height
+    # MOEMS layout: Question text top 20%, Diagram middle 45%, Answer space bottom 35%
+    return detect_diagram_bbox(page, DIAGRAM_SEARCH_BAND)
 
-    # MOEMS layout: Question text top 20%, Diagram middle 40%, Answer space bottom 40%
-    crop_rect = fitz.Rect(
-        page_width * 0.05,      # left (5% margin)
-        page_height * 0.20,     # top (skip question)
-        page_width * 0.95,      # right (5% margin)
-        page_height * 0.65      # bottom (keep diagram only)
-    )
+def diagram_pixmap(page):
+    """
+    High-resolution pixmap of the page's diagram, or None if it has none
+    Only renders a tight crop when a diagram is found
+    """
+    crop_rect = diagram_rect(page)
+    if crop_rect is None:
+        return None
 
     # Render cropped area at high resolution
-    zoom = 3.0
-    mat = fitz.Matrix(zoom, zoom)
-    pix = page.get_pixmap(matrix=mat, clip=crop_rect)
-
-    # Save as PNG
-    pix.save(output_path)
+    mat = fitz.Matrix(DIAGRAM_ZOOM, DIAGRAM_ZOOM)
+    with metrics.span('render'):
+        return page.get_pixmap(matrix=mat, clip=crop_rect)
 
-    # Check if diagram has actual content (not just white space)
-    file_size = os.path.getsize(output_path)
-    return file_size > 5000  # At least 5KB to be considered a real diagram
+def extract_diagram_from_page(page, output_path, manifest=None, artifact_id=None, store=None, raster=None):
+    """
+    Extract diagram from PDF page and save it as an optimized PNG plus WebP
+    variants (see diagram_images.py)
+    With a manifest, a file is only rewritten if its bytes changed
+    With an ImageStore, a copy of a stored image is not written
+    raster: optional PageRaster at DIAGRAM_ZOOM; the crop is sliced from it
+            if OCR already rendered the page
+    Returns the image metadata, or None if the page has no diagram
+    """
+    if raster is not None and raster.zoom == DIAGRAM_ZOOM:
+        crop_rect = diagram_rect(page)
+        if crop_rect is None:
+            return None
+        image = raster.crop_image(crop_rect)
+    else:
+        pix = diagram_pixmap(page)
+        if pix is None:
+            return None
+        image = pixmap_to_image(pix)
+    return save_diagram_images(image, output_path, manifest, artifact_id, store)
+
+def own_image_path(image, diagram_path):
+    """diagram_path if the question's image was written there, None if none or a stored duplicate"""
+    if image is not None and image['url'].endswith('/' + os.path.basename(diagram_path)):
+        return diagram_path
+    return None
 
 # ============================================================================
 # MAIN PROCESSING
 # ============================================================================
 
-def process_moems_pdf(pdf_path, exam_year):
+def question_id_for_page(page_num):
+    """Page 0 = 1A, page 1 = 1B, ... page 5 = 2A"""
+    contest_num = (page_num // 5) + 1
+    question_letter = chr(65 + (page_num % 5))  # A=0, B=1, etc.
+    return f"{contest_num}{question_letter}"
+
+def diagram_filename(exam_year, question_id):
+    return f"moems-{exam_year}-{question_id}.png"
+
+def build_question(exam_year, question_id, question_text, options, has_diagram, image=None):
+    """image: diagram_images metadata (URL - maybe of a stored duplicate - dimensions, byte sizes, WebP srcset)"""
+    question_letter = question_id[-1]
+    image_url = f'/images/questions/{diagram_filename(exam_year, question_id)}' if has_diagram else None
+    if image is not None:
+        image_url = image['url']
+    return {
+        'examName': 'MOEMS Division E',
+        'examYear': int(exam_year),
+        'questionNumber': question_id,
+        'questionText': question_text,
+        'options': options,
+        'hasImage': has_diagram,
+        'imageUrl': image_url,
+        'image': image,
+        'topic': 'General Math',
+        'difficulty': 'EASY' if question_letter == 'A' else ('MEDIUM' if question_letter in ['B', 'C'] else 'HARD')
+    }
+
+def question_status(question):
+    """[OK]/[WARN] marker plus diagram marker for the per-page log"""
+    options = question['options']
+    if options:
+        status = "[OK]" if len(options) == 5 else "[WARN]"
+    else:
+        status = "[OK]"  # Free-form questions are valid without options
+    diagram_status = "[IMG]" if question['hasImage'] else "     "
+    return f"{status} {diagram_status}"
+
+def manifest_page_hash(page):
+    return page_fingerprint(page, f"{ocr_render_key()};{OCR_CONFIG_KEY};hybrid={OCR_OPTIONS['hybrid']}")
+
+def pending_pages(pdf, pdf_path, exam_year, manifest, stream=None):
+    """Page numbers that need OCR (all of them without a manifest or stream)"""
+    pages = list(range(pdf.page_count))
+    if stream is not None:
+        pages = [page_num for page_num in pages if not stream.has(exam_year, question_id_for_page(page_num))]
+    if manifest is None:
+        return pages
+    if manifest.pdf_unchanged(pdf_path) and manifest.records_for_pdf(pdf_path) is not None:
+        return []
+    return [
+        page_num for page_num in pages
+        if not manifest.is_current(f"{exam_year}-{question_id_for_page(page_num)}", manifest_page_hash(pdf[page_num]))
+    ]
+
+def process_moems_pdf(pdf_path, exam_year, ocr_texts=None, cache=None, manifest=None, stream=None, store=None):
     """
     Process MOEMS PDF and extract all questions
+    ocr_texts: optional {(pdf_path, page_num): text} from ocr_pages_parallel
+    cache: optional OcrCache consulted before running OCR on a page
+    manifest: optional ExtractionManifest; unchanged PDFs and pages reuse their recorded questions
+    stream: optional QuestionStream; each question is appended as soon as it is
+            parsed, and pages already in it (--resume) are skipped
+    store: optional ImageStore; diagrams identical to a stored image point at it
     """
     print(f"\n{'='*70}")
     print(f"Processing: {os.path.basename(pdf_path)}")
     print(f"Exam Year: {exam_year}")
     print(f"{'='*70}")
 
+    if manifest is not None and manifest.pdf_unchanged(pdf_path):
+        questions = manifest.records_for_pdf(pdf_path)
+        if questions is not None:
+            print(f"[SKIP] Unchanged since last run - reusing {len(questions)} questions")
+            if stream is not None:
+                for question in questions:
+                    stream.append(question)
+                stream.checkpoint()
+            return questions
+
     pdf = fitz.open(pdf_path)
     questions = []
+    artifact_ids = []
+    # Set when --resume skips a page the manifest has no record of; the PDF
+    # is then not marked complete, so a later run without --resume redoes it
+    resumed_unrecorded = False
 
     total_pages = pdf.page_count
     contests = total_pages // 5
@@ -178,25 +574,52 @@ def process_moems_pdf(pdf_path, exam_year):
 
     for page_num in range(total_pages):
         # Calculate contest number and question letter
-        contest_num = (page_num // 5) + 1
-        question_letter = chr(65 + (page_num % 5))  # A=0, B=1, etc.
-        question_id = f"{contest_num}{question_letter}"
+        question_id = question_id_for_page(page_num)
+        artifact_id = f"{exam_year}-{question_id}"
 
         print(f"\n  [{question_id}] Page {page_num + 1}/{total_pages}")
+        metrics.begin_page(pdf_path, page_num)
+
+        if stream is not None and stream.has(exam_year, question_id):
+            print(f"    [SKIP] Already in {os.path.basename(stream.path)}")
+            if manifest is not None and manifest.record(artifact_id) is not None:
+                artifact_ids.append(artifact_id)
+            else:
+                resumed_unrecorded = True
+            continue
 
         page = pdf[page_num]
 
-        # Extract text via OCR
-        print(f"    - Running OCR...")
-        ocr_text = extract_text_from_page(page)
+        if manifest is not None:
+            page_hash = manifest_page_hash(page)
+            if manifest.is_current(artifact_id, page_hash):
+                print(f"    [SKIP] Page unchanged")
+                question = manifest.record(artifact_id)
+                questions.append(question)
+                artifact_ids.append(artifact_id)
+                if stream is not None:
+                    stream.append(question)
+                    stream.checkpoint()
+                continue
+
+        # One render of the page feeds both OCR and the diagram crop
+        raster = PageRaster(page, OCR_ZOOM, render_stats, shared=OCR_OPTIONS['shared_raster'])
+
+        # Extract text via OCR (or use the text the worker pool already produced)
+        if ocr_texts is not None:
+            ocr_text = ocr_texts.get((pdf_path, page_num), "")
+        else:
+            ocr_text = page_text(page, pdf_path, page_num, cache, raster)
 
         if not ocr_text:
             print(f"    ❌ No text extracted")
+            raster.release()
             continue
 
         # Parse question and options
-        question_text = parse_question_text(ocr_text)
-        options = parse_options(ocr_text)
+        with metrics.span('parse'):
+            question_text = parse_question_text(ocr_text)
+            options = parse_options(ocr_text)
 
         print(f"    - Question: {len(question_text)} chars")
         if options:
@@ -205,46 +628,331 @@ def process_moems_pdf(pdf_path, exam_year):
             print(f"    - Options: None (Free-form answer)")
 
         # Extract diagram
-        diagram_filename = f"moems-{exam_year}-{question_id}.png"
-        diagram_path = os.path.join(IMAGE_DIR, diagram_filename)
+        diagram_path = os.path.join(IMAGE_DIR, diagram_filename(exam_year, question_id))
 
         os.makedirs(IMAGE_DIR, exist_ok=True)
 
         print(f"    - Extracting diagram...")
-        has_diagram = extract_diagram_from_page(page, diagram_path)
+        with metrics.span('crop'):
+            image = extract_diagram_from_page(page, diagram_path, manifest, artifact_id, store, raster)
+            has_diagram = image is not None
+            raster.release()
 
-        if not has_diagram:
-            # Remove empty diagram file
-            if os.path.exists(diagram_path):
-                os.remove(diagram_path)
+            if not has_diagram:
+                # Remove stale diagram files
+                remove_diagram_images(diagram_path, store)
 
         # Build question object
-        question = {
-            'examName': 'MOEMS Division E',
-            'examYear': int(exam_year),
-            'questionNumber': question_id,
-            'questionText': question_text,
-            'options': options,
-            'hasImage': has_diagram,
-            'imageUrl': f'/images/questions/{diagram_filename}' if has_diagram else None,
-            'topic': 'General Math',
-            'difficulty': 'EASY' if question_letter == 'A' else ('MEDIUM' if question_letter in ['B', 'C'] else 'HARD')
-        }
+        question = build_question(exam_year, question_id, question_text, options, has_diagram, image)
 
         questions.append(question)
+        if stream is not None:
+            stream.append(question)
+            stream.checkpoint()
+        if manifest is not None:
+            manifest.record_artifact(artifact_id, page_hash, question, own_image_path(image, diagram_path))
+            artifact_ids.append(artifact_id)
 
         # Show status
-        if options:
-            status = "[OK]" if len(options) == 5 else "[WARN]"
-        else:
-            status = "[OK]"  # Free-form questions are valid without options
-        diagram_status = "[IMG]" if has_diagram else "     "
-        print(f"    {status} {diagram_status} Extracted")
+        print(f"    {question_status(question)} Extracted")
 
+    metrics.end_page()
     pdf.close()
 
+    if manifest is not None:
+        if not resumed_unrecorded:
+            manifest.record_pdf(pdf_path, artifact_ids)
+        manifest.save()
+
     return questions
 
+# ============================================================================
+# STAGED PIPELINE
+# ============================================================================
+#
+#   plan (fitz thread) -> ocr queue -> OCR (process pool) -> diagram queue
+#   -> diagram render (fitz thread) + PNG encode (thread pool) -> write queue
+#   -> writer (io thread, page order)
+#
+# PyMuPDF is not thread-safe, so every fitz call in the main process runs on
+# one dedicated thread; PNG encoding (Pillow releases the GIL), OCR and disk
+# writes overlap with it. Bounded queues give backpressure: a slow stage
+# makes the stages feeding it wait instead of piling pages up in memory.
+
+PIPELINE_QUEUE_SIZE = 8       # Pages each queue holds before its producer waits
+PNG_ENCODERS = 2              # Threads encoding diagram PNG/WebP variants
+QUEUE_SAMPLE_SECONDS = 0.1    # How often queue depths are sampled
+
+def plan_pdf(pdf_info, manifest, stream, cache):
+    """
+    Fitz thread: one work item per page of a PDF, in page order
+    Item kinds: 'reuse' (question recorded in the manifest), 'skip' (nothing
+    to write) and 'ocr' (text may already be known from the text layer or cache)
+    """
+    pdf_path, exam_year = pdf_info['path'], pdf_info['year']
+    state = {'path': pdf_path, 'artifact_ids': [], 'resumed_unrecorded': False, 'reused': False}
+
+    if manifest is not None and manifest.pdf_unchanged(pdf_path):
+        questions = manifest.records_for_pdf(pdf_path)
+        if questions is not None:
+            print(f"[SKIP] {pdf_info['name']} unchanged since last run - reusing {len(questions)} questions")
+            state['reused'] = True
+            return [{'kind': 'reuse', 'record': question, 'state': state} for question in questions]
+
+    pdf = _worker_doc(pdf_path)
+    items = []
+    for page_num in range(pdf.page_count):
+        question_id = question_id_for_page(page_num)
+        artifact_id = f"{exam_year}-{question_id}"
+        item = {
+            'kind': 'ocr', 'state': state, 'path': pdf_path, 'year': exam_year,
+            'page_num': page_num, 'question_id': question_id, 'artifact_id': artifact_id, 'text': None
+        }
+        items.append(item)
+
+        if stream is not None and stream.has(exam_year, question_id):
+            item['kind'] = 'skip'
+            if manifest is not None and manifest.record(artifact_id) is not None:
+                state['artifact_ids'].append(artifact_id)
+            else:
+                state['resumed_unrecorded'] = True
+            continue
+
+        page = pdf[page_num]
+        if manifest is not None:
+            item['page_hash'] = manifest_page_hash(page)
+            if manifest.is_current(artifact_id, item['page_hash']):
+                item['kind'], item['record'] = 'reuse', manifest.record(artifact_id)
+                continue
+
+        if skip_blank_page(page, f"  [{artifact_id}] "):
+            item['kind'] = 'skip'
+            continue
+
+        if OCR_OPTIONS['hybrid']:
+            text = page.get_text()
+            if text_layer_quality(text)['usable']:
+                item['text'] = text
+                run_stats['text_layer_pages'] += 1
+                continue
+
+        item['cache_key'] = cache.key(pdf_path, page_num, ocr_render_key(), OCR_CONFIG_KEY) if cache.enabled else None
+
+    return items
+
+def render_diagram_job(pdf_path, page_num):
+    """Fitz thread: the page's diagram as raw RGB samples, or None"""
+    with metrics.span('crop'):
+        pix = diagram_pixmap(_worker_doc(pdf_path)[page_num])
+    if pix is None:
+        return None
+    return pix.samples, pix.width, pix.height, pix.n
+
+def encode_images(raster, output_path):
+    """Encoder thread: (files, metadata) of a render_diagram_job result, see diagram_images.py"""
+    samples, width, height, n = raster
+    image = Image.frombytes({1: 'L', 3: 'RGB', 4: 'RGBA'}[n], (width, height), samples)
+    return encode_diagram_images(image, output_path)
+
+def write_item(item, manifest, stream, store=None):
+    """IO thread: write one page's output, in page order, and close off finished PDFs"""
+    state = item['state']
+    if item['kind'] == 'reuse':
+        question = item['record']
+        if item.get('artifact_id'):
+            state['artifact_ids'].append(item['artifact_id'])
+    elif item['kind'] == 'question':
+        diagram_path = os.path.join(IMAGE_DIR, diagram_filename(item['year'], item['question_id']))
+        files, image = item['images'] or (None, None)
+        has_diagram = image is not None
+        if has_diagram:
+            image = write_diagram_images(files, image, manifest, item['artifact_id'], store)
+        else:
+            remove_diagram_images(diagram_path, store)
+
+        question = build_question(item['year'], item['question_id'], item['question_text'], item['options'],
+                                  has_diagram, image)
+        print(f"  [{item['artifact_id']}] {question_status(question)} Extracted")
+        if manifest is not None:
+            manifest.record_artifact(item['artifact_id'], item['page_hash'], question, own_image_path(image, diagram_path))
+            state['artifact_ids'].append(item['artifact_id'])
+    else:
+        question = None
+
+    if question is not None and stream is not None:
+        stream.append(question)
+        stream.checkpoint()
+
+    if item.get('last') and manifest is not None:
+        if not state['resumed_unrecorded'] and not state['reused']:
+            manifest.record_pdf(state['path'], state['artifact_ids'])
+        manifest.save()
+
+class StageMonitor:
+    """Queue depth samples and busy time per stage, for finding the bottleneck"""
+
+    def __init__(self, queues):
+        self.queues = queues
+        self.samples = {name: [] for name in queues}
+        self.busy = {}
+
+    def add_busy(self, stage, seconds):
+        self.busy[stage] = self.busy.get(stage, 0.0) + seconds
+
+    async def sample(self):
+        while True:
+            for name, queue in self.queues.items():
+                self.samples[name].append(queue.qsize())
+            await asyncio.sleep(QUEUE_SAMPLE_SECONDS)
+
+    def summary(self):
+        lines = []
+        fullest, fullest_ratio = None, -1.0
+        for name, depths in self.samples.items():
+            if not depths:
+                continue
+            size = self.queues[name].maxsize
+            mean = sum(depths) / len(depths)
+            full = sum(1 for d in depths if d >= size) / len(depths)
+            lines.append(f"  {name:<8} queue: mean {mean:.1f}/{size}, max {max(depths)}, full {full:.0%} of the time")
+            if mean / size > fullest_ratio:
+                fullest, fullest_ratio = name, mean / size
+        busy = ', '.join(f"{stage} {seconds:.1f}s" for stage, seconds in self.busy.items())
+        lines.append(f"  Busy time: {busy}")
+        if fullest is not None:
+            lines.append(f"  Bottleneck: the stage reading the {fullest} queue (fullest on average)")
+        return '\n'.join(lines)
+
+async def run_pipeline(pdfs, workers, cache, manifest=None, stream=None, store=None):
+    """Run every PDF through the staged pipeline; returns the StageMonitor"""
+    loop = asyncio.get_running_loop()
+    # Before any thread or document exists (see start_ocr_pool)
+    ocr_pool = start_ocr_pool(workers)
+    fitz_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fitz')
+    io_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='writer')
+    encoders = ThreadPoolExecutor(max_workers=PNG_ENCODERS, thread_name_prefix='png')
+
+    ocr_queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+    diagram_queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+    write_queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+    monitor = StageMonitor({'ocr': ocr_queue, 'diagram': diagram_queue, 'write': write_queue})
+    # Pages between plan and writer, so the writer's reorder buffer is bounded
+    # too: room for full queues and busy stages, beyond that plan waits
+    in_flight = asyncio.Semaphore(3 * PIPELINE_QUEUE_SIZE + workers + PNG_ENCODERS)
+
+    async def timed(stage, executor, fn, *args, page=None):
+        start = time.perf_counter()
+        try:
+            if page is None:
+                return await loop.run_in_executor(executor, fn, *args)
+            # Thread stages: spans inside fn are charged to the page
+            return await loop.run_in_executor(executor, metrics.call_for_page, page, fn, *args)
+        finally:
+            monitor.add_busy(stage, time.perf_counter() - start)
+
+    async def plan():
+        seq = 0
+        for pdf_info in pdfs:
+            items = await timed('plan', fitz_thread, plan_pdf, pdf_info, manifest, stream, cache)
+            for index, item in enumerate(items):
+                item['seq'] = seq
+                item['last'] = index == len(items) - 1
+                seq += 1
+                await in_flight.acquire()
+                await (ocr_queue if item['kind'] == 'ocr' else write_queue).put(item)
+            if not items:
+                # Empty PDF: still close it off in the manifest
+                await in_flight.acquire()
+                await write_queue.put({'kind': 'skip', 'seq': seq, 'last': True,
+                                       'state': {'path': pdf_info['path'], 'artifact_ids': [],
+                                                 'resumed_unrecorded': False, 'reused': False}})
+                seq += 1
+
+    async def ocr_stage():
+        while (item := await ocr_queue.get()) is not None:
+            if item['text'] is None:
+                text = cache.get(item['cache_key'])
+                if text is None:
+                    start = time.perf_counter()
+                    text, info = await timed('ocr', ocr_pool, ocr_page_job, (item['path'], item['page_num']))
+                    # The worker process's own spans are not seen here
+                    metrics.record('ocr', time.perf_counter() - start, (item['path'], item['page_num']))
+                    report_ocr(info, f"  [{item['artifact_id']}] OCR: ")
+                    if text:
+                        cache.put(item['cache_key'], text)
+                run_stats['ocr_pages'] += 1
+                item['text'] = text
+
+            if not item['text']:
+                print(f"  [{item['artifact_id']}] ❌ No text extracted")
+                item['kind'] = 'skip'
+                await write_queue.put(item)
+                continue
+
+            with metrics.span('parse', (item['path'], item['page_num'])):
+                item['question_text'] = parse_question_text(item['text'])
+                item['options'] = parse_options(item['text'])
+            item['kind'] = 'question'
+            await diagram_queue.put(item)
+
+    async def diagram_stage():
+        while (item := await diagram_queue.get()) is not None:
+            page = (item['path'], item['page_num'])
+            raster = await timed('render', fitz_thread, render_diagram_job, item['path'], item['page_num'], page=page)
+            diagram_path = os.path.join(IMAGE_DIR, diagram_filename(item['year'], item['question_id']))
+            item['images'] = (await timed('encode', encoders, encode_images, raster, diagram_path, page=page)
+                              if raster is not None else None)
+            await write_queue.put(item)
+
+    async def writer():
+        # Pages finish out of order; write them back in page order
+        pending = {}
+        next_seq = 0
+        while (item := await write_queue.get()) is not None:
+            pending[item['seq']] = item
+            while next_seq in pending:
+                ready = pending.pop(next_seq)
+                page = (ready['path'], ready['page_num']) if 'page_num' in ready else None
+                await timed('write', io_thread, write_item, ready, manifest, stream, store, page=page)
+                in_flight.release()
+                next_seq += 1
+
+    async def drive():
+        await plan()
+        for _ in ocr_tasks:
+            await ocr_queue.put(None)
+        await asyncio.gather(*ocr_tasks)
+        for _ in diagram_tasks:
+            await diagram_queue.put(None)
+        await asyncio.gather(*diagram_tasks)
+        await write_queue.put(None)
+        await writer_task
+
+    sampler = asyncio.create_task(monitor.sample())
+    ocr_tasks = [asyncio.create_task(ocr_stage()) for _ in range(workers)]
+    diagram_tasks = [asyncio.create_task(diagram_stage()) for _ in range(PNG_ENCODERS)]
+    writer_task = asyncio.create_task(writer())
+    tasks = ocr_tasks + diagram_tasks + [writer_task, asyncio.create_task(drive())]
+
+    try:
+        # A failed stage stops reading its queue, and the stages feeding it
+        # would wait on the full queue forever: stop at the first exception
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+    finally:
+        for task in tasks + [sampler]:
+            task.cancel()
+        await asyncio.gather(*tasks, sampler, return_exceptions=True)
+        ocr_pool.shutdown(cancel_futures=True)
+        encoders.shutdown()
+        io_thread.shutdown()
+        fitz_thread.submit(close_worker_docs).result()
+        fitz_thread.shutdown()
+
+    return monitor
+
 def find_moems_pdfs():
     """Find all MOEMS PDFs and extract year"""
     pdfs = []
@@ -262,7 +970,54 @@ def find_moems_pdfs():
 
     return sorted(pdfs, key=lambda x: x['year'])
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="MOEMS Complete Question Extractor with OCR")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="OCR pages in a pool of N processes (default: 1, sequential)")
+    add_cache_args(parser)
+    parser.add_argument('--full', action='store_true',
+                        help="Reprocess every PDF and page, ignoring the extraction manifest")
+    parser.add_argument('--hybrid', action='store_true',
+                        help="Use the PDF text layer where it is usable and OCR only the other pages")
+    ocr_mode = parser.add_mutually_exclusive_group()
+    ocr_mode.add_argument('--adaptive', action='store_true',
+                          help="OCR at low zoom first and re-render only pages/lines Tesseract is unsure of")
+    ocr_mode.add_argument('--preprocess', action='store_true',
+                          help="OCR normalized/threshold/denoised/... variants concurrently and keep the best")
+    ocr_mode.add_argument('--regions', action='store_true',
+                          help="OCR only the text bands of each page, skipping diagrams and blank space")
+    ocr_mode.add_argument('--batch', type=int, default=0, metavar='N',
+                          help="Stitch the text bands of N pages into one Tesseract call")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Overlap OCR, diagram rendering/encoding and file writes in a staged "
+                             "pipeline (uses --workers OCR processes)")
+    parser.add_argument('--separate-renders', action='store_true',
+                        help="Render each page separately for OCR and the diagram crop, as before "
+                             "(to compare render time in the summary)")
+    parser.add_argument('--no-dedupe', action='store_true',
+                        help="Write every diagram under its own name, even exact copies of stored images")
+    parser.add_argument('--keep-blank', action='store_true',
+                        help="OCR every page, without the blank/no-text page pre-filter")
+    parser.add_argument('--resume', action='store_true',
+                        help=f"Continue an interrupted run: keep the questions already in "
+                             f"{os.path.basename(STREAM_FILE)} and skip their pages")
+    add_metrics_args(parser)
+    args = parser.parse_args()
+    if args.pipeline and args.batch:
+        parser.error("--pipeline and --batch cannot be combined")
+    return args
+
 def main():
+    args = parse_args()
+    OCR_OPTIONS['hybrid'] = args.hybrid
+    OCR_OPTIONS['adaptive'] = args.adaptive
+    OCR_OPTIONS['preprocess'] = args.preprocess
+    OCR_OPTIONS['regions'] = args.regions
+    OCR_OPTIONS['skip_blank'] = not args.keep_blank
+    OCR_OPTIONS['batch'] = max(0, args.batch)
+    OCR_OPTIONS['shared_raster'] = not args.separate_renders
+    metrics_from_args(args, 'moems_ocr')
+
     print("="*70)
     print("MOEMS Complete Question Extractor with OCR")
     print("Extracts: Questions, Options, Diagrams")
@@ -270,7 +1025,7 @@ def main():
 
     # Check if Tesseract is installed
     try:
-        pytesseract.get_tesseract_version()
+        print(f"OCR engine: {get_engine().name} (Tesseract {get_engine().version()})")
     except Exception:
         print("\n❌ ERROR: Tesseract OCR not installed!")
         print("Please install from: https://github.com/tesseract-ocr/tesseract")
@@ -290,39 +1045,87 @@ def main():
     for pdf in pdfs:
         print(f"  - {pdf['name']} (Year: {pdf['year']})")
 
-    # Process all PDFs
-    all_questions = []
+    # OCR all pages up front when batching or running with a worker pool
+    cache = cache_from_args(args)
+    manifest = ExtractionManifest(MANIFEST_PATH, enabled=not args.full)
+    stream = QuestionStream(STREAM_FILE, resume=args.resume)
+    store = ImageStore(IMAGE_DIR, enabled=not args.no_dedupe)
+    ocr_texts = None
+    monitor = None
+    if args.pipeline:
+        monitor = asyncio.run(run_pipeline(pdfs, max(1, args.workers), cache, manifest, stream, store))
+    elif OCR_OPTIONS['batch']:
+        with metrics.span('ocr'):
+            ocr_texts = ocr_pages_batched(pdfs, OCR_OPTIONS['batch'], args.workers, cache, manifest, stream)
+    elif args.workers > 1:
+        with metrics.span('ocr'):
+            ocr_texts = ocr_pages_parallel(pdfs, args.workers, cache, manifest, stream)
+
+    # Process all PDFs - questions go straight to the NDJSON stream
+    if not args.pipeline:
+        for pdf_info in pdfs:
+            with metrics.pdf(pdf_info['path']):
+                process_moems_pdf(pdf_info['path'], pdf_info['year'], ocr_texts, cache, manifest, stream, store)
+    stream.close()
+    store.save()
+
+    # Build the JSON array read by import.ts from the stream
+    with metrics.span('write'):
+        total = build_pretty_json(STREAM_FILE, OUTPUT_FILE)
+    metrics.add_bytes(os.path.getsize(OUTPUT_FILE))
+
+    # Summary (one pass over the stream, nothing held in memory)
+    with_options = complete_options = with_diagrams = 0
+    png_bytes = webp_bytes = 0
+    sample = None
+    for q in read_ndjson(STREAM_FILE):
+        sample = sample or q
+        with_options += bool(q['options'])
+        complete_options += len(q['options']) == 5
+        with_diagrams += bool(q['hasImage'])
+        if q.get('image'):
+            png_bytes += q['image'].get('bytes', 0)
+            webp_bytes += q['image'].get('webp', {}).get('bytes', 0)
+    free_form = total - with_options
 
-    for pdf_info in pdfs:
-        questions = process_moems_pdf(pdf_info['path'], pdf_info['year'])
-        all_questions.extend(questions)
-
-    # Save to JSON
-    output_file = os.path.join(OUTPUT_DIR, 'moems-questions-ocr.json')
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(all_questions, f, indent=2, ensure_ascii=False)
-
-    # Summary
     print("\n" + "="*70)
     print("EXTRACTION COMPLETE!")
     print("="*70)
-    print(f"Total questions: {len(all_questions)}")
-
-    with_options = sum(1 for q in all_questions if q['options'])
-    complete_options = sum(1 for q in all_questions if len(q['options']) == 5)
-    free_form = len(all_questions) - with_options
-
+    print(f"Total questions: {total} ({stream.written} written this run)")
     print(f"Multiple choice (with options): {with_options}")
     print(f"  - Complete (5 options): {complete_options}")
     print(f"  - Incomplete: {with_options - complete_options}")
     print(f"Free-form answer: {free_form}")
-    print(f"With diagrams: {sum(1 for q in all_questions if q['hasImage'])}/{len(all_questions)}")
-    print(f"\nSaved to: {output_file}")
+    print(f"With diagrams: {with_diagrams}/{total}")
+    if with_diagrams:
+        print(f"  - Full-size PNG: {png_bytes / 1024:.0f} KB, WebP: {webp_bytes / 1024:.0f} KB")
+    print(f"Pages from text layer: {run_stats['text_layer_pages']}, OCR: {run_stats['ocr_pages']}, "
+          f"skipped as blank: {run_stats['blank_pages']}")
+    if args.adaptive:
+        print(adaptive_stats.summary())
+    if args.preprocess:
+        print(preprocess_stats.summary())
+    if args.regions:
+        print(region_stats.summary())
+    if render_stats.pages:
+        print(render_stats.summary(shared=OCR_OPTIONS['shared_raster']))
+    if monitor is not None:
+        print("Pipeline stages:")
+        print(monitor.summary())
+    if batch_stats['pages']:
+        print(f"Batched OCR: {batch_stats['pages']} pages in {batch_stats['calls']} Tesseract call(s), "
+              f"{batch_stats['pages'] / max(batch_stats['seconds'], 1e-9):.1f} pages/s")
+    print(cache.summary())
+    print(manifest.summary())
+    print(store.summary())
+    cache.close()
+    metrics.finish()
+    print(f"\nSaved to: {OUTPUT_FILE}")
+    print(f"Stream: {STREAM_FILE} (rerun with --resume after an interruption)")
 
     # Show sample
-    if all_questions:
+    if sample:
         print("\nSample question:")
-        sample = all_questions[0]
         print(f"  Year: {sample['examYear']}")
         print(f"  Question: {sample['questionNumber']}")
         print(f"  Text: {sample['questionText'][:100]}...")
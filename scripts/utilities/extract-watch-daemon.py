@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Watch-folder extraction daemon
+
+Runs the extractors as one long-lived process on an inbox directory instead
+of a batch script started by hand for every new packet. Interpreter start-up,
+imports, the OCR engine and the --workers OCR pool are paid for once; each
+PDF dropped into the inbox (or replaced there) is extracted as soon as it
+has finished copying:
+
+    MOEMS packets (a "YYYY-YYYY" year range in the name)
+        process_moems_pdf -> <output>/moems/<name>.json, and
+        <output>/moems-questions-ocr.json rebuilt from every packet in the
+        inbox (the file scripts/import.ts reads); diagrams go to --image-dir
+    any other PDF
+        extract_with_ocr (extract-with-pdf2image.py) -> <output>/text/<name>.txt
+
+Outputs are written to a temporary file and renamed into place, so a reader
+never sees a half-written file. The extraction manifest and OCR cache persist
+across restarts: packets extracted before are reused, not OCRed again.
+Removing a PDF from the inbox removes its JSON/text output (diagram images
+are kept).
+
+The inbox is watched through watchdog (inotify on Linux) when it is
+installed, and otherwise polled every --poll seconds.
+
+Usage:
+    python extract-watch-daemon.py INBOX [--output DIR] [--image-dir DIR] [--workers N]
+                                   [--hybrid] [--adaptive | --preprocess | --regions] [--once]
+
+Requirements:
+    pip install pymupdf pytesseract pillow numpy
+    pip install watchdog   (optional, event-driven instead of polling)
+"""
+
+import argparse
+import os
+import re
+import signal
+import sys
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+from extraction_manifest import ExtractionManifest
+from extraction_metrics import add_metrics_args, metrics, metrics_from_args
+from image_store import ImageStore
+from ocr_cache import add_cache_args, cache_from_args
+from ocr_engine import get_engine
+from question_stream import QuestionStream, build_pretty_json
+from script_loader import load_script
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+UTILITIES_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.dirname(UTILITIES_DIR)
+
+POLL_SECONDS = 1.0       # Inbox scan interval without watchdog
+RESCAN_SECONDS = 30.0    # Scan interval with watchdog, in case an event is missed
+SETTLE_SECONDS = 1.0     # A PDF must keep its size/mtime this long before it is read
+
+MOEMS_YEAR = re.compile(r'(\d{4})-(\d{4})')
+COMBINED_JSON = 'moems-questions-ocr.json'
+MANIFEST_NAME = 'moems-questions-ocr.manifest.json'
+
+# Loaded at import time, so spawned OCR workers (which re-import this file)
+# can find the module their jobs are pickled from
+moems = load_script(os.path.join(UTILITIES_DIR, 'extract-moems-complete-ocr.py'), 'extract_moems_complete_ocr')
+
+# ============================================================================
+# INBOX
+# ============================================================================
+
+def pdf_stamp(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+class Inbox:
+    """
+    PDFs in the inbox directory that are new or changed since they were last
+    extracted, and have finished copying (unchanged for `settle` seconds)
+    """
+
+    def __init__(self, directory, settle=SETTLE_SECONDS):
+        self.directory = directory
+        self.settle = settle
+        self.pending = {}   # path -> (stamp, monotonic time the stamp was first seen)
+        self.arrived = {}   # path -> monotonic time it first showed up as new/changed
+        self.done = {}      # path -> stamp when it was last extracted
+
+    def scan(self):
+        """
+        Returns (ready, wait, removed): PDFs to extract now, seconds until the
+        next still-copying PDF may be ready (None if there is none), and PDFs
+        extracted before that have since been removed
+        """
+        now = time.monotonic()
+        present = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith('.pdf'):
+                    stat = entry.stat()
+                    present[entry.path] = (stat.st_mtime_ns, stat.st_size)
+
+        removed = sorted(path for path in self.done if path not in present)
+        for path in removed:
+            del self.done[path]
+        for path in [path for path in self.pending if path not in present]:
+            del self.pending[path]
+            self.arrived.pop(path, None)
+
+        ready = []
+        wait = None
+        for path, stamp in sorted(present.items()):
+            if self.done.get(path) == stamp:
+                continue
+            self.arrived.setdefault(path, now)
+            seen = self.pending.get(path)
+            if seen is None or seen[0] != stamp:
+                seen = self.pending[path] = (stamp, now)
+            left = seen[1] + self.settle - now
+            if left <= 0:
+                ready.append(path)
+            else:
+                wait = left if wait is None else min(wait, left)
+        return ready, wait, removed
+
+    def mark_done(self, path, stamp):
+        """Record the stamp a PDF was extracted at; returns seconds since it arrived"""
+        self.done[path] = stamp
+        self.pending.pop(path, None)
+        return time.monotonic() - self.arrived.pop(path, time.monotonic())
+
+class _WakeHandler(FileSystemEventHandler):
+    """watchdog handler: any event in the inbox wakes the daemon"""
+
+    def __init__(self, wake):
+        super().__init__()
+        self.wake = wake
+
+    def on_any_event(self, event):
+        self.wake.set()
+
+class InboxWatcher:
+    """
+    Sleeps until something happens in the inbox: an inotify/watchdog event,
+    or the next poll when watchdog is not installed (or use_events=False)
+    """
+
+    def __init__(self, directory, poll=POLL_SECONDS, use_events=True):
+        self.wake = threading.Event()
+        self.observer = None
+        self.interval = poll
+        if use_events and Observer is not None:
+            self.observer = Observer()
+            self.observer.schedule(_WakeHandler(self.wake), directory, recursive=False)
+            self.observer.start()
+            self.interval = RESCAN_SECONDS
+
+    def mode(self):
+        if self.observer is not None:
+            return f"watchdog events ({type(self.observer).__name__})"
+        return f"polling every {self.interval:g}s"
+
+    def wait(self, timeout=None):
+        """Block until an inbox event, `timeout` seconds or the scan interval, whichever is first"""
+        self.wake.wait(self.interval if timeout is None else min(timeout, self.interval))
+        self.wake.clear()
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+
+# ============================================================================
+# EXTRACTION
+# ============================================================================
+
+class ExtractionDaemon:
+    """Extractor state kept warm between PDFs: OCR engine and pool, cache, manifest, image store"""
+
+    def __init__(self, args):
+        self.inbox = Inbox(args.inbox, args.settle)
+        self.output_dir = args.output or os.path.join(args.inbox, 'extracted')
+        self.moems_dir = os.path.join(self.output_dir, 'moems')
+        self.text_dir = os.path.join(self.output_dir, 'text')
+        self.combined_path = os.path.join(self.output_dir, COMBINED_JSON)
+        moems.IMAGE_DIR = args.image_dir or os.path.join(self.output_dir, 'images')
+
+        self.workers = max(1, args.workers)
+        self.cache = cache_from_args(args)
+        self.manifest = ExtractionManifest(os.path.join(self.output_dir, MANIFEST_NAME))
+        self.store = ImageStore(moems.IMAGE_DIR, enabled=not args.no_dedupe)
+        self.pdf2image = None   # extract-with-pdf2image.py, loaded for the first non-MOEMS PDF
+        self.pool = None
+        if self.workers > 1:
+            self.start_pool()
+
+    def start_pool(self):
+        """Start every OCR worker now (each loads its engine) rather than on the next packet"""
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+        self.pool = moems.start_ocr_pool(self.workers)
+        print(f"OCR pool: {self.workers} worker process(es) started")
+
+    def output_name(self, path):
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def moems_year(self, path):
+        match = MOEMS_YEAR.search(os.path.basename(path))
+        return match.group(2) if match else None   # Use ending year, as find_moems_pdfs does
+
+    def stream_path(self, path):
+        return os.path.join(self.moems_dir, f"{self.output_name(path)}.ndjson")
+
+    def extract_moems(self, path, year):
+        """Questions and diagrams of one packet -> <output>/moems/<name>.json; returns the question count"""
+        os.makedirs(self.moems_dir, exist_ok=True)
+        moems.reset_run_stats()   # Counters are per packet, not per daemon lifetime
+        stream_path = self.stream_path(path)
+        stream = QuestionStream(stream_path)
+        try:
+            ocr_texts = None
+            if self.pool is not None:
+                pdf_info = {'path': path, 'name': os.path.basename(path), 'year': year}
+                with metrics.span('ocr'):
+                    ocr_texts = moems.ocr_pages_parallel([pdf_info], self.workers, self.cache, self.manifest,
+                                                         stream, self.pool)
+            with metrics.pdf(path):
+                moems.process_moems_pdf(path, year, ocr_texts, self.cache, self.manifest, stream, self.store)
+        finally:
+            stream.close()
+
+        with metrics.span('write'):
+            return build_pretty_json(stream_path, os.path.join(self.moems_dir, f"{self.output_name(path)}.json"))
+
+    def extract_text(self, path):
+        """OCR text of any other PDF -> <output>/text/<name>.txt; returns the character count"""
+        if self.pdf2image is None:
+            try:
+                self.pdf2image = load_script(os.path.join(SCRIPTS_DIR, 'extract-with-pdf2image.py'),
+                                             'extract_with_pdf2image')
+            except SystemExit:
+                raise RuntimeError("extract-with-pdf2image.py dependencies are not installed")
+            if not os.path.isdir(self.pdf2image.POPPLER_PATH):
+                self.pdf2image.POPPLER_PATH = None   # poppler from PATH
+
+        os.makedirs(self.text_dir, exist_ok=True)
+        output_path = os.path.join(self.text_dir, f"{self.output_name(path)}.txt")
+        tmp_path = f"{output_path}.tmp"
+        try:
+            with metrics.pdf(path):
+                self.pdf2image.extract_with_ocr(path, output_file=tmp_path, cache=self.cache)
+            os.replace(tmp_path, output_path)
+        except SystemExit:
+            raise RuntimeError("extract_with_ocr failed (see its [ERROR] line)")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return os.path.getsize(output_path)
+
+    def extract(self, path):
+        """Extract one settled PDF; a failure is reported and retried only when the file changes"""
+        stamp = pdf_stamp(path)
+        start = time.perf_counter()
+        try:
+            year = self.moems_year(path)
+            if year is not None:
+                count = self.extract_moems(path, year)
+                result = f"{count} questions"
+            else:
+                result = f"{self.extract_text(path)} bytes of text"
+        except BrokenProcessPool as e:
+            # A worker died (crash, OOM kill); the pool refuses all later jobs, so replace it
+            print(f"[ERROR] {os.path.basename(path)}: OCR worker crashed ({e}), restarting the OCR pool")
+            self.start_pool()
+            self.inbox.mark_done(path, stamp)
+            return False
+        except Exception as e:
+            print(f"[ERROR] {os.path.basename(path)}: {e}")
+            self.inbox.mark_done(path, stamp)
+            return False
+
+        latency = self.inbox.mark_done(path, stamp)
+        print(f"[OK] {os.path.basename(path)}: {result} in {time.perf_counter() - start:.1f}s "
+              f"({latency:.1f}s after it arrived)")
+        return year is not None
+
+    def remove(self, path):
+        """Drop the outputs of a PDF taken out of the inbox; returns True for a MOEMS packet"""
+        name = self.output_name(path)
+        outputs = [os.path.join(self.moems_dir, f"{name}.ndjson"), os.path.join(self.moems_dir, f"{name}.json"),
+                   os.path.join(self.text_dir, f"{name}.txt")]
+        for output_path in outputs:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+        print(f"[REMOVED] {os.path.basename(path)}: outputs deleted")
+        return self.moems_year(path) is not None
+
+    def build_combined(self):
+        """Rebuild moems-questions-ocr.json from every packet's stream, by year"""
+        packets = sorted(
+            (self.moems_year(path), path) for path in self.inbox.done
+            if self.moems_year(path) is not None and os.path.exists(self.stream_path(path))
+        )
+        with metrics.span('write'):
+            total = build_pretty_json([self.stream_path(path) for _, path in packets], self.combined_path)
+        metrics.add_bytes(os.path.getsize(self.combined_path))
+        print(f"[OK] {self.combined_path}: {total} questions from {len(packets)} packet(s)")
+
+    def run(self, watcher, once=False):
+        """Extract PDFs as they settle in the inbox; with once, stop when nothing is left to do"""
+        while True:
+            ready, wait, removed = self.inbox.scan()
+            moems_changed = False
+            for path in removed:
+                moems_changed |= self.remove(path)
+            for path in ready:
+                moems_changed |= self.extract(path)
+
+            if ready or removed:
+                if moems_changed:
+                    self.build_combined()
+                self.store.save()
+                metrics.finish()
+                metrics.reset()
+                print(f"Waiting for PDFs in {self.inbox.directory} ...")
+            elif once and wait is None:
+                return
+            watcher.wait(wait)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.store.save()
+        self.cache.close()
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extract PDFs dropped into an inbox directory as they arrive")
+    parser.add_argument('inbox', help="Directory to watch for PDFs")
+    parser.add_argument('--output', help="Output directory (default: INBOX/extracted)")
+    parser.add_argument('--image-dir', help="Diagram image directory, e.g. web-app/public/images/questions "
+                                            "(default: OUTPUT/images)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Keep a pool of N OCR processes running (default: 1, OCR in the daemon)")
+    parser.add_argument('--hybrid', action='store_true',
+                        help="Use the PDF text layer where it is usable and OCR only the other pages")
+    ocr_mode = parser.add_mutually_exclusive_group()
+    ocr_mode.add_argument('--adaptive', action='store_true',
+                          help="OCR at low zoom first and re-render only pages/lines Tesseract is unsure of")
+    ocr_mode.add_argument('--preprocess', action='store_true',
+                          help="OCR normalized/threshold/denoised/... variants concurrently and keep the best")
+    ocr_mode.add_argument('--regions', action='store_true',
+                          help="OCR only the text bands of each page, skipping diagrams and blank space")
+    parser.add_argument('--keep-blank', action='store_true',
+                        help="OCR every page, without the blank/no-text page pre-filter")
+    parser.add_argument('--no-dedupe', action='store_true',
+                        help="Write every diagram under its own name, even exact copies of stored images")
+    parser.add_argument('--poll', type=float, default=POLL_SECONDS,
+                        help=f"Seconds between inbox scans without watchdog (default: {POLL_SECONDS:g})")
+    parser.add_argument('--settle', type=float, default=SETTLE_SECONDS,
+                        help=f"Seconds a PDF must stay unchanged before it is read (default: {SETTLE_SECONDS:g})")
+    parser.add_argument('--no-events', action='store_true',
+                        help="Poll the inbox even when watchdog is installed")
+    parser.add_argument('--once', action='store_true',
+                        help="Extract what is in the inbox, then exit")
+    add_cache_args(parser)
+    add_metrics_args(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if not os.path.isdir(args.inbox):
+        print(f"[ERROR] Inbox not found: {args.inbox}")
+        sys.exit(1)
+
+    moems.OCR_OPTIONS['hybrid'] = args.hybrid
+    moems.OCR_OPTIONS['adaptive'] = args.adaptive
+    moems.OCR_OPTIONS['preprocess'] = args.preprocess
+    moems.OCR_OPTIONS['regions'] = args.regions
+    moems.OCR_OPTIONS['skip_blank'] = not args.keep_blank
+    metrics_from_args(args, 'watch_daemon')
+
+    print("=" * 70)
+    print("Extraction daemon")
+    print("=" * 70)
+    try:
+        print(f"OCR engine: {get_engine().name} (Tesseract {get_engine().version()})")
+    except Exception as e:
+        print(f"[ERROR] Tesseract OCR not available: {e}")
+        sys.exit(1)
+
+    # Stop cleanly (pool, cache, image index) on SIGTERM as on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    daemon = ExtractionDaemon(args)
+    watcher = InboxWatcher(args.inbox, args.poll, use_events=not args.no_events)
+    print(f"Inbox: {os.path.abspath(args.inbox)} ({watcher.mode()})")
+    print(f"Output: {os.path.abspath(daemon.output_dir)}")
+    try:
+        daemon.run(watcher, once=args.once)
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        watcher.stop()
+        daemon.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Incremental extraction manifest shared by the PDF extractors
+
+Records, per source PDF, its mtime/size/SHA-256 and, per question ID, a
+fingerprint of the source page plus the hash of the artifact written for it.
+A rerun can then:
+    - skip PDFs that have not changed (reusing their recorded output)
+    - skip pages whose content fingerprint has not changed
+    - leave output files untouched when the new bytes are identical,
+      so unchanged images keep their mtime and static-asset caching works
+
+The manifest is a JSON file written atomically after each PDF.
+"""
+
+import hashlib
+import json
+import os
+
+from ocr_cache import file_sha256
+
+MANIFEST_VERSION = 1
+
+# ============================================================================
+# FINGERPRINTS
+# ============================================================================
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+def pdf_fingerprint(pdf_path):
+    """mtime/size/hash of a source PDF"""
+    stat = os.stat(pdf_path)
+    return {
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': file_sha256(pdf_path)
+    }
+
+def page_fingerprint(page, settings='', images=None):
+    """
+    Hash of everything that affects a page's output without rendering it:
+    the page content stream, its embedded image streams and the caller's
+    render/crop settings
+    images: page.get_images(full=True), if the caller already has it
+    """
+    sha = hashlib.sha256()
+    sha.update(page.read_contents())
+    doc = page.parent
+    if images is None:
+        images = page.get_images(full=True)
+    for img in images:
+        sha.update(doc.xref_stream_raw(img[0]) or b'')
+    sha.update(str(settings).encode('utf-8'))
+    return sha.hexdigest()
+
+# ============================================================================
+# MANIFEST
+# ============================================================================
+
+class ExtractionManifest:
+    """
+    JSON manifest of source PDFs and the artifacts produced from them
+
+    enabled=False (--full) ignores the recorded state so every page is
+    processed again; artifacts are still only written when their bytes change.
+    """
+
+    def __init__(self, path, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self.written = 0
+        self.unchanged = 0
+        self.data = {'version': MANIFEST_VERSION, 'pdfs': {}, 'artifacts': {}}
+
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == MANIFEST_VERSION:
+                    self.data = data
+            except (OSError, ValueError) as e:
+                print(f"  [WARN] Ignoring unreadable manifest {path}: {e}")
+
+    # ------------------------------------------------------------------ PDFs
+
+    def pdf_unchanged(self, pdf_path):
+        """True if the PDF matches the manifest entry recorded after its last complete run"""
+        if not self.enabled:
+            return False
+
+        entry = self.data['pdfs'].get(os.path.abspath(pdf_path))
+        if not entry:
+            return False
+
+        stat = os.stat(pdf_path)
+        if entry['size'] != stat.st_size:
+            return False
+        if entry['mtime_ns'] == stat.st_mtime_ns:
+            return True
+        # Touched but maybe not modified (copied, re-downloaded) - fall back to the content hash
+        if entry['sha256'] != file_sha256(pdf_path):
+            return False
+        entry['mtime_ns'] = stat.st_mtime_ns
+        return True
+
+    def records_for_pdf(self, pdf_path):
+        """
+        Records of every artifact produced from an unchanged PDF, in page order
+        Returns None if any of them is missing so the caller reprocesses the PDF
+        """
+        entry = self.data['pdfs'].get(os.path.abspath(pdf_path))
+        if not entry:
+            return None
+
+        records = []
+        for artifact_id in entry.get('artifacts', []):
+            artifact = self.data['artifacts'].get(artifact_id)
+            if artifact is None or not self._output_present(artifact):
+                return None
+            records.append(artifact['record'])
+        return records
+
+    def record_pdf(self, pdf_path, artifact_ids):
+        """Mark a PDF as completely processed into the given artifacts"""
+        fingerprint = pdf_fingerprint(pdf_path)
+        fingerprint['artifacts'] = list(artifact_ids)
+        self.data['pdfs'][os.path.abspath(pdf_path)] = fingerprint
+
+    # ------------------------------------------------------------- artifacts
+
+    def is_current(self, artifact_id, page_hash):
+        """True if the artifact was produced from an identical page and its output still exists"""
+        if not self.enabled:
+            return False
+        artifact = self.data['artifacts'].get(artifact_id)
+        return bool(artifact) and artifact.get('page_hash') == page_hash and self._output_present(artifact)
+
+    def record(self, artifact_id):
+        artifact = self.data['artifacts'].get(artifact_id)
+        return artifact['record'] if artifact else None
+
+    def forget(self, artifact_id):
+        """Drop an artifact's record, so its page (and its PDF) is processed again"""
+        self.data['artifacts'].pop(artifact_id, None)
+
+    def record_artifact(self, artifact_id, page_hash, record, output_path=None):
+        artifact = self.data['artifacts'].setdefault(artifact_id, {})
+        artifact['page_hash'] = page_hash
+        artifact['record'] = record
+        if output_path is None:
+            for field in ('path', 'sha256', 'size'):
+                artifact.pop(field, None)
+        else:
+            artifact['path'] = os.path.abspath(output_path)
+
+    def write_artifact(self, artifact_id, output_path, data):
+        """
+        Write an output file only if its bytes changed
+        Returns True if the file was (re)written
+        """
+        digest = sha256_bytes(data)
+        artifact = self.data['artifacts'].setdefault(artifact_id, {})
+
+        unchanged = False
+        if os.path.exists(output_path) and os.path.getsize(output_path) == len(data):
+            if artifact.get('sha256') == digest:
+                unchanged = True
+            else:
+                # No (matching) manifest entry yet, e.g. first run over existing images
+                with open(output_path, 'rb') as f:
+                    unchanged = sha256_bytes(f.read()) == digest
+
+        if not unchanged:
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            tmp_path = f"{output_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, output_path)
+
+        artifact['path'] = os.path.abspath(output_path)
+        artifact['sha256'] = digest
+        artifact['size'] = len(data)
+
+        if unchanged:
+            self.unchanged += 1
+        else:
+            self.written += 1
+        return not unchanged
+
+    def _output_present(self, artifact):
+        path = artifact.get('path')
+        if path is None:
+            return True
+        return os.path.exists(path) and os.path.getsize(path) == artifact.get('size')
+
+    # ------------------------------------------------------------------ save
+
+    def save(self):
+        """Atomically write the manifest"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def summary(self):
+        return f"Artifacts: {self.written} written, {self.unchanged} unchanged ({self.path})"
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+Per-stage timing and resource metrics for the extractors
+
+Spans around each stage of the work (render, ocr, parse, crop, encode,
+write) record where a run spends its time, per page and per PDF, along
+with the bytes written and peak memory. Span times are exclusive: a render
+inside a crop counts as render, not twice. Disabled (the default), a span
+is a shared no-op context.
+
+    --metrics FILE      per-stage, per-page and per-PDF results as JSON
+    --prometheus FILE   the run totals for node_exporter's textfile collector
+    --profile DIR       cProfile each stage: DIR/<stage>.prof plus a
+                        cumulative-time report DIR/<stage>.txt
+
+Only spans on the main thread are profiled: a process can have one active
+profiler (Python 3.12+ refuses a second), so spans on worker threads
+(--preprocess variants, --pipeline stages) are timed but not profiled. On
+3.12+ that profiler also records other threads' calls made while a
+main-thread span is open.
+
+Work done in worker processes (--workers, --pipeline OCR, the Kangaroo
+scanner) is not seen here; those phases are timed as a whole in the parent.
+
+Usage:
+    from extraction_metrics import add_metrics_args, metrics, metrics_from_args
+    metrics_from_args(args, 'moems_ocr')
+    with metrics.pdf(pdf_path):
+        metrics.begin_page(pdf_path, page_num)
+        with metrics.span('render'):
+            pix = page.get_pixmap(...)
+        metrics.end_page()
+    metrics.finish()
+
+Requirements:
+    none (standard library)
+"""
+
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import math
+import os
+import pstats
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+METRICS_VERSION = 1
+PROFILE_LINES = 40    # Functions listed per stage in the --profile text report
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, or None if unknown"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # KB on Linux, bytes on macOS
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+
+def percentile(values, q):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+def _atomic_write(path, text):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+# ============================================================================
+# SPANS
+# ============================================================================
+
+class _Span:
+    """One timed stage; time spent in nested spans is subtracted from it"""
+
+    def __init__(self, metrics, stage, page):
+        self.metrics = metrics
+        self.stage = stage
+        self.page = page
+        self.child_seconds = 0.0
+        self.reentrant = False
+
+    def __enter__(self):
+        local = self.metrics._local
+        stack = local.__dict__.setdefault('stack', [])
+        parent = stack[-1] if stack else None
+        # e.g. pixmap_to_string calling image_to_string: one OCR call, not two
+        self.reentrant = parent is not None and parent.stage == self.stage
+        if self.reentrant:
+            return self
+        if self.page is None:
+            self.page = getattr(local, 'page', None)
+        stack.append(self)
+        self.metrics._switch_profiler(parent, self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.reentrant:
+            return False
+        seconds = time.perf_counter() - self.start
+        stack = self.metrics._local.stack
+        stack.pop()
+        parent = stack[-1] if stack else None
+        self.metrics._switch_profiler(self, parent)
+        if parent is not None:
+            parent.child_seconds += seconds
+        self.metrics._record(self.stage, seconds - self.child_seconds, self.page)
+        return False
+
+def _page_key(pdf_path, page_num):
+    return (os.path.basename(str(pdf_path)), page_num)
+
+class ExtractionMetrics:
+    """Run-wide stage, page and PDF totals (one per process: `metrics` below)"""
+
+    def __init__(self):
+        self.enabled = False
+        self.script = None
+        self.metrics_path = None
+        self.prometheus_path = None
+        self.profile_dir = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._null = contextlib.nullcontext()
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+        self.stages = {}     # stage -> {'calls', 'seconds'}
+        self.pages = {}      # (pdf name, page_num) -> {'seconds', 'stages', 'bytes'}
+        self.pdfs = []
+        self.bytes_written = 0
+        self.files_written = 0
+        self._profilers = {}   # stage -> cProfile.Profile, main thread only
+
+    def configure(self, script, metrics_path=None, prometheus_path=None, profile_dir=None):
+        self.script = script
+        self.metrics_path = metrics_path
+        self.prometheus_path = prometheus_path
+        self.profile_dir = profile_dir
+        self.enabled = bool(metrics_path or prometheus_path or profile_dir)
+        self.reset()
+
+    # ------------------------------------------------------------------ record
+
+    def span(self, stage, page=None):
+        """
+        Context timing one stage
+        page: (pdf_path, page_num) to charge, if not the thread's current page
+        """
+        if not self.enabled:
+            return self._null
+        return _Span(self, stage, None if page is None else _page_key(*page))
+
+    def _page_entry(self, key):
+        entry = self.pages.get(key)
+        if entry is None:
+            entry = self.pages[key] = {'seconds': None, 'stages': {}, 'bytes': 0}
+        return entry
+
+    def _record(self, stage, seconds, page):
+        with self._lock:
+            totals = self.stages.setdefault(stage, {'calls': 0, 'seconds': 0.0})
+            totals['calls'] += 1
+            totals['seconds'] += seconds
+            if page is not None:
+                stages = self._page_entry(page)['stages']
+                stages[stage] = stages.get(stage, 0.0) + seconds
+
+    def record(self, stage, seconds, page=None):
+        """Add time measured outside a span, e.g. a page's OCR in a worker process"""
+        if self.enabled:
+            self._record(stage, seconds, None if page is None else _page_key(*page))
+
+    def call_for_page(self, page, fn, *args):
+        """fn(*args) with its spans charged to page ((pdf_path, page_num)), on any thread"""
+        if not self.enabled or page is None:
+            return fn(*args)
+        previous = getattr(self._local, 'page', None)
+        self._local.page = _page_key(*page)
+        try:
+            return fn(*args)
+        finally:
+            self._local.page = previous
+
+    def add_bytes(self, count, page=None):
+        """Count a file of `count` bytes written (to the current page, if any)"""
+        if not self.enabled:
+            return
+        key = _page_key(*page) if page is not None else getattr(self._local, 'page', None)
+        with self._lock:
+            self.bytes_written += count
+            self.files_written += 1
+            if key is not None:
+                self._page_entry(key)['bytes'] += count
+
+    def begin_page(self, pdf_path, page_num):
+        """Start timing a page on this thread (ends the previous one)"""
+        if not self.enabled:
+            return
+        self.end_page()
+        self._local.page = _page_key(pdf_path, page_num)
+        self._local.page_start = time.perf_counter()
+        with self._lock:
+            self._page_entry(self._local.page)
+
+    def end_page(self):
+        key = getattr(self._local, 'page', None)
+        if key is None:
+            return
+        seconds = time.perf_counter() - self._local.page_start
+        with self._lock:
+            entry = self._page_entry(key)
+            entry['seconds'] = (entry['seconds'] or 0.0) + seconds
+        self._local.page = None
+
+    @contextlib.contextmanager
+    def page(self, pdf_path, page_num):
+        self.begin_page(pdf_path, page_num)
+        try:
+            yield
+        finally:
+            self.end_page()
+
+    @contextlib.contextmanager
+    def pdf(self, pdf_path):
+        """Time one PDF; pages and bytes are those recorded while it runs"""
+        if not self.enabled:
+            yield
+            return
+        name = os.path.basename(str(pdf_path))
+        start = time.perf_counter()
+        bytes_before = self.bytes_written
+        try:
+            yield
+        finally:
+            self.end_page()
+            self.pdfs.append({
+                'pdf': name,
+                'seconds': round(time.perf_counter() - start, 4),
+                'pages': sum(1 for key in self.pages if key[0] == name),
+                'bytes_written': self.bytes_written - bytes_before,
+                'peak_rss_mb': peak_rss_mb(),
+            })
+
+    # ---------------------------------------------------------------- profile
+
+    def _switch_profiler(self, old, new):
+        """
+        Profile only the innermost span, so every function lands in one stage
+        Main thread only, so at most one profiler is ever enabled
+        """
+        if not self.profile_dir or threading.current_thread() is not threading.main_thread():
+            return
+        if old is not None:
+            self._profilers[old.stage].disable()
+        if new is not None:
+            profiler = self._profilers.get(new.stage)
+            if profiler is None:
+                profiler = self._profilers[new.stage] = cProfile.Profile()
+            profiler.enable()
+
+    def write_profiles(self):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        for stage, profiler in sorted(self._profilers.items()):
+            try:
+                stats = pstats.Stats(profiler)
+            except TypeError:
+                continue   # Nothing recorded for the stage
+            stats.dump_stats(os.path.join(self.profile_dir, f"{stage}.prof"))
+            report = io.StringIO()
+            stats.stream = report
+            stats.sort_stats('cumulative').print_stats(PROFILE_LINES)
+            _atomic_write(os.path.join(self.profile_dir, f"{stage}.txt"), report.getvalue())
+
+    # ----------------------------------------------------------------- output
+
+    def report(self):
+        """JSON-ready run metrics"""
+        self.end_page()
+        page_stage_times = {}
+        pages = []
+        for (pdf, page_num), entry in sorted(self.pages.items()):
+            for stage, seconds in entry['stages'].items():
+                page_stage_times.setdefault(stage, []).append(seconds)
+            seconds = entry['seconds']
+            if seconds is None:
+                # Not timed as a page (pipeline threads): the sum of its stages
+                seconds = sum(entry['stages'].values())
+            pages.append({
+                'pdf': pdf,
+                'page': page_num + 1,
+                'ms': _ms(seconds),
+                'stages_ms': {stage: _ms(s) for stage, s in sorted(entry['stages'].items())},
+                'bytes_written': entry['bytes'],
+            })
+
+        page_ms = [page['ms'] for page in pages]
+        return {
+            'version': METRICS_VERSION,
+            'script': self.script,
+            'started': self.started_at.isoformat(timespec='seconds'),
+            'seconds': round(time.perf_counter() - self.started, 4),
+            'peak_rss_mb': peak_rss_mb(),
+            'bytes_written': self.bytes_written,
+            'files_written': self.files_written,
+            'page_ms': {'p50': percentile(page_ms, 50), 'p95': percentile(page_ms, 95)},
+            'stages': {
+                stage: {
+                    'calls': totals['calls'],
+                    'seconds': round(totals['seconds'], 4),
+                    'page_p50_ms': _ms(percentile(page_stage_times.get(stage), 50)),
+                    'page_p95_ms': _ms(percentile(page_stage_times.get(stage), 95)),
+                }
+                for stage, totals in sorted(self.stages.items())
+            },
+            'pdfs': self.pdfs,
+            'pages': pages,
+        }
+
+    def prometheus_text(self, report):
+        """node_exporter textfile-collector format; all values describe the last run"""
+        script = self.script or 'extractor'
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP extractor_{name} {help_text}")
+            lines.append(f"# TYPE extractor_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{val}"' for key, val in [('script', script)] + labels)
+                lines.append(f"extractor_{name}{{{label_text}}} {value}")
+
+        metric('stage_seconds', 'gauge', "Exclusive time spent in each stage in the last run",
+               [([('stage', stage)], totals['seconds']) for stage, totals in report['stages'].items()])
+        metric('stage_calls', 'gauge', "Spans of each stage in the last run",
+               [([('stage', stage)], totals['calls']) for stage, totals in report['stages'].items()])
+        metric('run_seconds', 'gauge', "Wall time of the last run", [([], report['seconds'])])
+        metric('pages', 'gauge', "Pages processed in the last run", [([], len(report['pages']))])
+        metric('pdfs', 'gauge', "PDFs processed in the last run", [([], len(report['pdfs']))])
+        metric('bytes_written', 'gauge', "Bytes of output files written in the last run",
+               [([], report['bytes_written'])])
+        if report['peak_rss_mb'] is not None:
+            metric('peak_rss_bytes', 'gauge', "Peak resident memory of the last run",
+                   [([], int(report['peak_rss_mb'] * 1024 * 1024))])
+        metric('last_run_timestamp_seconds', 'gauge', "End of the last run (Unix time)",
+               [([], int(time.time()))])
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        stages = sorted(self.stages.items(), key=lambda item: -item[1]['seconds'])
+        parts = ', '.join(f"{stage} {totals['seconds']:.1f}s" for stage, totals in stages)
+        return (f"Stages: {parts or 'none'}; {self.bytes_written / 1024:.0f} KB written, "
+                f"peak RSS {peak_rss_mb() or 0:.0f} MB")
+
+    def finish(self):
+        """Write the configured metrics/Prometheus/profile outputs"""
+        if not self.enabled:
+            return
+        report = self.report()
+        print(f"[STATS] {self.summary()}")
+        if self.metrics_path:
+            _atomic_write(self.metrics_path, json.dumps(report, indent=2))
+            print(f"Metrics saved to: {self.metrics_path}")
+        if self.prometheus_path:
+            _atomic_write(self.prometheus_path, self.prometheus_text(report))
+            print(f"Prometheus metrics saved to: {self.prometheus_path}")
+        if self.profile_dir:
+            self.write_profiles()
+            print(f"Stage profiles saved to: {self.profile_dir}")
+
+    def _after_fork(self):
+        # A forked worker's copy is never reported; don't let it wait on a lock
+        # another parent thread held at fork time
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+# One per process; every module records into it
+metrics = ExtractionMetrics()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=metrics._after_fork)
+
+def timed(stage):
+    """Decorator: run the function inside metrics.span(stage)"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# ============================================================================
+# COMMAND LINE
+# ============================================================================
+
+def add_metrics_args(parser):
+    """Add --metrics / --prometheus / --profile to an argparse parser"""
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="Write per-stage, per-page and per-PDF timings, bytes and memory as JSON")
+    parser.add_argument('--prometheus', metavar='FILE',
+                        help="Also write run totals as a Prometheus textfile-collector .prom file")
+    parser.add_argument('--profile', metavar='DIR',
+                        help="cProfile each stage (main thread); writes DIR/<stage>.prof and DIR/<stage>.txt")
+
+def metrics_from_args(args, script):
+    metrics.configure(script, args.metrics, args.prometheus, args.profile)
+    return metrics
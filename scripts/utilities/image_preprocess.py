@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+OCR preprocessing variants for grayscale page renders
+
+The same strategies as the ocr-debug-images/ experiments, as vectorized
+NumPy/Pillow operations on a (height, width) uint8 array:
+
+    original      - the render as-is
+    normalized    - 1st-99th percentile contrast stretch
+    highcontrast  - normalized, then contrast doubled around mid-gray
+    threshold     - Otsu binarization
+    inverted      - negative (light text on dark backgrounds)
+    denoised      - 3x3 median filter (speckled scans)
+
+Usage:
+    from image_preprocess import preprocess
+    array = preprocess(gray, 'threshold')
+
+Requirements:
+    pip install numpy pillow
+"""
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+# Tried in this order: cheap/likely winners first, so early stopping usually
+# finishes before the slow or rarely useful ones start
+PREPROCESS_VARIANTS = ('original', 'normalized', 'threshold', 'denoised', 'highcontrast', 'inverted')
+
+CLIP_PERCENT = 1           # Percent of pixels clipped at each end when normalizing
+CONTRAST_GAIN = 2.0        # highcontrast slope around mid-gray
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def gray_histogram(gray):
+    return np.bincount(gray.ravel(), minlength=256)
+
+def _lut(gray, table):
+    """Apply a 256-entry lookup table (one vectorized gather)"""
+    return np.clip(table, 0, 255).astype(np.uint8)[gray]
+
+def _stretch_table(hist):
+    cdf = np.cumsum(hist)
+    total = cdf[-1]
+    lo = int(np.searchsorted(cdf, total * CLIP_PERCENT / 100))
+    hi = int(np.searchsorted(cdf, total * (100 - CLIP_PERCENT) / 100))
+    if hi <= lo:
+        return np.arange(256, dtype=np.float32)
+    return (np.arange(256, dtype=np.float32) - lo) * (255.0 / (hi - lo))
+
+def otsu_threshold(hist):
+    """Gray level maximising between-class variance"""
+    levels = np.arange(256, dtype=np.float64)
+    weight = np.cumsum(hist).astype(np.float64)
+    total = weight[-1]
+    mass = np.cumsum(hist * levels)
+    background = weight
+    foreground = total - weight
+    valid = (background > 0) & (foreground > 0)
+    mean_b = np.divide(mass, background, out=np.zeros(256), where=valid)
+    mean_f = np.divide(mass[-1] - mass, foreground, out=np.zeros(256), where=valid)
+    variance = np.where(valid, background * foreground * (mean_b - mean_f) ** 2, 0)
+    return int(np.argmax(variance))
+
+# ============================================================================
+# VARIANTS
+# ============================================================================
+
+def normalized(gray, hist=None):
+    return _lut(gray, _stretch_table(gray_histogram(gray) if hist is None else hist))
+
+def high_contrast(gray, hist=None):
+    table = _stretch_table(gray_histogram(gray) if hist is None else hist)
+    return _lut(gray, (np.clip(table, 0, 255) - 128) * CONTRAST_GAIN + 128)
+
+def threshold(gray, hist=None):
+    level = otsu_threshold(gray_histogram(gray) if hist is None else hist)
+    return np.where(gray > level, 255, 0).astype(np.uint8)
+
+def inverted(gray, hist=None):
+    return 255 - gray
+
+def denoised(gray, hist=None):
+    return np.asarray(Image.fromarray(gray).filter(ImageFilter.MedianFilter(3)))
+
+VARIANT_FUNCTIONS = {
+    'original': lambda gray, hist=None: gray,
+    'normalized': normalized,
+    'highcontrast': high_contrast,
+    'threshold': threshold,
+    'inverted': inverted,
+    'denoised': denoised,
+}
+
+def preprocess(gray, variant, hist=None):
+    """
+    One preprocessing variant of a grayscale array
+    hist: gray_histogram(gray), to share between variants of the same page
+    """
+    return VARIANT_FUNCTIONS[variant](gray, hist)
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Duplicate-image store for extracted diagrams
+
+The extractors write crops into one directory (public/images/questions),
+and reruns or overlapping crops keep adding copies of the same picture
+under new names. The store indexes every diagram it wrote by a hash of its
+pixels, so a crop identical to a stored diagram is not written again: the
+question is pointed at the URL of the image already stored (an alias).
+
+Only exact duplicates are aliased. Every PNG also gets a difference hash
+(dHash), and the CLI below reports near-duplicates (a few hash bits apart,
+found with a BK-tree) for review - two different puzzles, say a grid with
+one changed label, can hash that close, so they are never aliased.
+
+When a stored diagram is rewritten with different pixels (its page changed),
+the questions aliased to it are detached; add() returns their artifact IDs
+so the caller can have them extracted again.
+
+The index is a JSON file in the directory; files added or changed outside
+the extractors are re-hashed on load (by size/mtime).
+
+Usage:
+    store = ImageStore(IMAGE_DIR)
+    canonical = store.duplicate_of(meta, filename, artifact_id)   # meta from diagram_images
+    ...
+    store.save()
+
+    # Report duplicate groups already on disk
+    python image_store.py ../../public/images/questions --mapping duplicates.json
+
+Requirements:
+    pip install pillow numpy
+"""
+
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+HASH_SIZE = 16                    # 16x16 gradient bits = 256-bit hash
+DUPLICATE_DISTANCE = 10           # Max differing bits (of 256) for a near-duplicate (CLI report)
+VARIANT_FIELDS = ('format', 'webp', 'srcset')   # Metadata only diagram_images writes
+ASPECT_TOLERANCE = 0.05           # Near-duplicates must also have the same shape
+STORE_INDEX = '.image-store.json'
+STORE_VERSION = 1
+
+# ============================================================================
+# HASHING
+# ============================================================================
+
+def dhash(image, hash_size=HASH_SIZE):
+    """
+    Difference hash: sign of the horizontal gradient of a box-filtered
+    (hash_size + 1) x hash_size thumbnail, as an int of hash_size**2 bits
+    """
+    if 'A' in image.getbands() or 'transparency' in image.info:
+        # Transparent background counts as white, not black
+        rgba = image.convert('RGBA')
+        image = Image.alpha_composite(Image.new('RGBA', rgba.size, 'white'), rgba)
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.BOX)
+    px = np.asarray(small, dtype=np.int16)
+    bits = (px[:, 1:] > px[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def dhash_hex(image):
+    return f"{dhash(image):0{HASH_SIZE * HASH_SIZE // 4}x}"
+
+def pixel_hash(image):
+    """SHA-256 of the image's size and RGB pixels: equal only for identical crops"""
+    rgb = image.convert('RGB')
+    return hashlib.sha256(f"{rgb.width}x{rgb.height};".encode() + rgb.tobytes()).hexdigest()
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+# ============================================================================
+# BK-TREE
+# ============================================================================
+
+class BKTree:
+    """
+    Burkhard-Keller tree over Hamming distance
+    A search for radius r only descends into children whose edge distance d
+    satisfies |d - dist(query, node)| <= r (triangle inequality)
+    """
+
+    def __init__(self):
+        self.root = None   # [hash, values, {distance: child}]
+        self.size = 0
+
+    def add(self, key, value):
+        self.size += 1
+        if self.root is None:
+            self.root = [key, [value], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, [value], {}]
+                return
+            node = child
+
+    def search(self, key, radius):
+        """(distance, value) for every stored value within radius, nearest first"""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(key, node[0])
+            if distance <= radius:
+                found.extend((distance, value) for value in node[1])
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return sorted(found, key=lambda item: item[0])
+
+# ============================================================================
+# STORE
+# ============================================================================
+
+def similar_shape(a, b):
+    aspect_a = a['width'] / max(1, a['height'])
+    aspect_b = b['width'] / max(1, b['height'])
+    return abs(aspect_a - aspect_b) <= ASPECT_TOLERANCE * max(aspect_a, aspect_b)
+
+class ImageStore:
+    """
+    Pixel-hash index of the PNGs in one output directory
+
+    enabled=False (--no-dedupe) never reports duplicates, so every crop is
+    written under its own name; the index is still kept up to date.
+    """
+
+    def __init__(self, directory, url_prefix='/images/questions/', enabled=True,
+                 max_distance=DUPLICATE_DISTANCE):
+        self.directory = directory
+        self.url_prefix = url_prefix
+        self.enabled = enabled
+        self.max_distance = max_distance
+        self.index_path = os.path.join(directory, STORE_INDEX)
+        self.entries = {}   # filename -> {dhash, width, height, size, mtime, meta, aliases}
+        # aliases: {filename of a question pointed at this image: its artifact ID or None}
+        self.duplicates = 0
+        self.bytes_saved = 0
+
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == STORE_VERSION:
+                    self.entries = data['images']
+                    for entry in self.entries.values():
+                        # Older indexes listed aliases without their artifact IDs
+                        if isinstance(entry['aliases'], list):
+                            entry['aliases'] = dict.fromkeys(entry['aliases'])
+            except (OSError, ValueError) as e:
+                print(f"  [WARN] Ignoring unreadable image index {self.index_path}: {e}")
+        self.refresh()
+
+    def refresh(self):
+        """Drop entries for deleted files, hash new or changed PNGs, rebuild the pixel index"""
+        on_disk = {}
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.lower().endswith('.png'):
+                    stat = os.stat(os.path.join(self.directory, name))
+                    on_disk[name] = (stat.st_size, stat.st_mtime)
+
+        self.entries = {name: entry for name, entry in self.entries.items() if name in on_disk}
+        for name, (size, mtime) in on_disk.items():
+            entry = self.entries.get(name)
+            if entry is None or entry['size'] != size or entry['mtime'] != mtime:
+                try:
+                    with Image.open(os.path.join(self.directory, name)) as image:
+                        meta = {'url': self.url_prefix + name, 'width': image.width,
+                                'height': image.height, 'bytes': size, 'dhash': dhash_hex(image)}
+                except (OSError, ValueError) as e:
+                    print(f"  [WARN] Not indexing unreadable image {name}: {e}")
+                    continue
+                self.entries[name] = self._entry(meta, size, mtime, entry['aliases'] if entry else None)
+
+        self.by_pixels = {}
+        for name, entry in self.entries.items():
+            self._index(name, entry)
+
+    def _entry(self, meta, size, mtime, aliases=None):
+        return {
+            'dhash': meta['dhash'], 'width': meta['width'], 'height': meta['height'],
+            'size': size, 'mtime': mtime, 'meta': meta, 'aliases': aliases or {}
+        }
+
+    def _index(self, filename, entry):
+        # Files indexed from disk alone have no pixel hash and are never aliased
+        pixels = entry['meta'].get('pixels')
+        if pixels is not None:
+            self.by_pixels.setdefault(pixels, set()).add(filename)
+
+    def has_variants(self, meta):
+        """True if meta describes a full diagram_images output set (PNG + WebP variants) still on disk"""
+        if any(field not in meta for field in VARIANT_FIELDS):
+            return False
+        urls = [meta['webp']['url']] + [variant['url'] for variant in meta['srcset']]
+        return all(os.path.exists(os.path.join(self.directory, url.rsplit('/', 1)[-1])) for url in urls)
+
+    def find(self, meta, exclude=None):
+        """
+        Filename of a stored diagram with exactly the same pixels as meta, or None
+        Files indexed from disk alone (no pixel hash or WebP variants) never match
+        """
+        for name in sorted(self.by_pixels.get(meta['pixels'], ())):
+            entry = self.entries.get(name)
+            if entry is None or name == exclude:
+                continue
+            stored = entry['meta']
+            # The index may still hold a file's old hash after it was rewritten
+            if stored.get('pixels') == meta['pixels'] and self.has_variants(stored):
+                return name
+        return None
+
+    def duplicate_of(self, meta, filename, artifact_id=None):
+        """
+        Image metadata of the stored copy of a new crop (with its URLs), or
+        None if the crop should be written as filename
+        artifact_id: manifest ID of the question, returned by add() if the
+        stored copy is later rewritten with other pixels
+        """
+        if not self.enabled:
+            return None
+        canonical = self.find(meta, exclude=filename)
+        if canonical is None:
+            return None
+
+        self.unalias(filename)
+        self.entries[canonical]['aliases'][filename] = artifact_id
+        self.duplicates += 1
+        self.bytes_saved += meta['bytes']
+        return dict(self.entries[canonical]['meta'])
+
+    def add(self, filename, meta):
+        """
+        Index a crop just written as filename
+        If filename held different pixels before, the questions aliased to it
+        no longer show the picture they were extracted with: they are detached
+        Returns {alias filename: artifact ID or None} of the detached questions
+        """
+        stat = os.stat(os.path.join(self.directory, filename))
+        self.unalias(filename)
+        previous = self.entries.get(filename)
+        aliases, detached = {}, {}
+        if previous is not None:
+            if previous['meta'].get('pixels') == meta['pixels']:
+                aliases = previous['aliases']
+            else:
+                detached = previous['aliases']
+        self.entries[filename] = self._entry(meta, stat.st_size, stat.st_mtime, aliases)
+        self._index(filename, self.entries[filename])
+        return detached
+
+    def unalias(self, filename):
+        """filename's question no longer uses a stored duplicate"""
+        for entry in self.entries.values():
+            entry['aliases'].pop(filename, None)
+
+    def release(self, filename):
+        """
+        filename's question no longer uses filename itself
+        Returns True if the file can be deleted, False if other questions point at it
+        """
+        entry = self.entries.get(filename)
+        if entry is not None and entry['aliases']:
+            return False
+        self.entries.pop(filename, None)
+        return True
+
+    def duplicate_groups(self):
+        """Groups of on-disk filenames that are near-duplicates of each other (CLI report)"""
+        tree = BKTree()
+        for name, entry in self.entries.items():
+            tree.add(int(entry['dhash'], 16), name)
+
+        seen = set()
+        groups = []
+        for name in sorted(self.entries):
+            if name in seen:
+                continue
+            entry = self.entries[name]
+            group = list(dict.fromkeys(
+                other for _, other in tree.search(int(entry['dhash'], 16), self.max_distance)
+                if other not in seen and other in self.entries and similar_shape(entry, self.entries[other])
+            ))
+            seen.update(group)
+            if len(group) > 1:
+                groups.append(sorted(group))
+        return groups
+
+    def save(self):
+        """Atomically write the index"""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': STORE_VERSION, 'images': self.entries}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def summary(self):
+        return (f"Image store: {len(self.entries)} images, {self.duplicates} duplicates not written "
+                f"({self.bytes_saved / 1024:.0f} KB saved)")
+
+# ============================================================================
+# CLI: REPORT EXISTING DUPLICATES
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Report near-duplicate images in an extractor output directory")
+    parser.add_argument('directory', help="Image directory, e.g. public/images/questions")
+    parser.add_argument('--distance', type=int, default=DUPLICATE_DISTANCE,
+                        help=f"Max differing hash bits of {HASH_SIZE * HASH_SIZE} (default: {DUPLICATE_DISTANCE})")
+    parser.add_argument('--mapping', help="Write a JSON map of duplicate URL -> kept URL")
+    args = parser.parse_args()
+
+    store = ImageStore(args.directory, max_distance=args.distance)
+    store.save()
+
+    groups = store.duplicate_groups()
+    mapping = {}
+    reclaimable = 0
+    for group in groups:
+        # Keep the smallest file of each group
+        keep = min(group, key=lambda name: (store.entries[name]['size'], name))
+        print(f"[DUP] {keep} <- {', '.join(name for name in group if name != keep)}")
+        for name in group:
+            if name != keep:
+                mapping[store.url_prefix + name] = store.url_prefix + keep
+                reclaimable += store.entries[name]['size']
+
+    print(f"\n{len(store.entries)} images, {len(groups)} duplicate groups, "
+          f"{len(mapping)} redundant files ({reclaimable / 1024:.0f} KB reclaimable)")
+
+    if args.mapping:
+        with open(args.mapping, 'w', encoding='utf-8') as f:
+            json.dump(mapping, f, indent=2)
+        print(f"Mapping saved to: {args.mapping}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Batched OCR: many pages' text crops in one Tesseract call
+
+MOEMS pages hold one short question each, so per-call overhead (process
+start / page layout setup) dominates when every page is OCRed on its own.
+Here the text bands of many pages (see text_bands.py) are rendered as tight
+grayscale crops, tiled into one tall composite with white separators, and
+recognised with a single line-level Tesseract call. Each recognised line is
+mapped back to its crop - and so its page - by its vertical position.
+
+Usage:
+    from ocr_batch import ocr_pages_stitched
+    texts, calls = ocr_pages_stitched([pdf[0], pdf[1], ...])
+
+Requirements:
+    pip install pymupdf numpy pillow pytesseract
+"""
+
+from bisect import bisect_right
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from diagram_detect import pixmap_gray_array
+from extraction_metrics import metrics
+from ocr_engine import get_engine, lines_to_text
+from page_ocr import OCR_LANG, OCR_RENDER_KEY, OCR_ZOOM
+from text_bands import text_bands
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+BATCH_SEPARATOR = 48          # White pixels between crops; keeps Tesseract from joining them
+BATCH_MARGIN = 16             # White border around the composite
+MAX_COMPOSITE_HEIGHT = 30000  # Stay under Tesseract/Leptonica's 32767 px image limit
+BATCH_RENDER_KEY = f"{OCR_RENDER_KEY} text-bands stitched"
+
+# ============================================================================
+# CROPS
+# ============================================================================
+
+def page_crops(page):
+    """Grayscale OCR-resolution crops of a page's text bands (the whole page if none are found)"""
+    bands, _ = text_bands(page)
+    mat = fitz.Matrix(OCR_ZOOM, OCR_ZOOM)
+    crops = []
+    for band in bands or [page.rect]:
+        with metrics.span('render'):
+            pix = page.get_pixmap(matrix=mat, clip=band, colorspace=fitz.csGRAY)
+        crops.append(pixmap_gray_array(pix).copy())
+    return crops
+
+def stitch(crops):
+    """
+    Tile crops top to bottom on a white canvas
+    Returns (composite array, start row of each crop)
+    """
+    width = max(crop.shape[1] for crop in crops) + 2 * BATCH_MARGIN
+    height = sum(crop.shape[0] for crop in crops) + BATCH_SEPARATOR * (len(crops) - 1) + 2 * BATCH_MARGIN
+    canvas = np.full((height, width), 255, dtype=np.uint8)
+
+    starts = []
+    y = BATCH_MARGIN
+    for crop in crops:
+        h, w = crop.shape
+        canvas[y:y + h, BATCH_MARGIN:BATCH_MARGIN + w] = crop
+        starts.append(y)
+        y += h + BATCH_SEPARATOR
+    return canvas, starts
+
+def composite_groups(crops):
+    """Split (owner, crop) pairs into runs whose composite fits MAX_COMPOSITE_HEIGHT"""
+    groups = [[]]
+    height = 2 * BATCH_MARGIN
+    for owner, crop in crops:
+        crop_height = crop.shape[0] + BATCH_SEPARATOR
+        if groups[-1] and height + crop_height > MAX_COMPOSITE_HEIGHT:
+            groups.append([])
+            height = 2 * BATCH_MARGIN
+        groups[-1].append((owner, crop))
+        height += crop_height
+    return groups
+
+# ============================================================================
+# OCR
+# ============================================================================
+
+def ocr_crops_stitched(crops_by_page):
+    """
+    OCR every page's crops with as few Tesseract calls as possible
+    crops_by_page: one list of grayscale crops per page
+    Returns (one text per page, number of Tesseract calls)
+    """
+    flat = [(page_index, crop) for page_index, crops in enumerate(crops_by_page) for crop in crops]
+    lines_by_crop = []
+    owners = []
+    calls = 0
+
+    for group in composite_groups(flat):
+        canvas, starts = stitch([crop for _, crop in group])
+        lines = get_engine().image_to_lines(Image.fromarray(canvas), lang=OCR_LANG)
+        calls += 1
+
+        group_lines = [[] for _ in group]
+        for line in lines:
+            center = (line['bbox'][1] + line['bbox'][3]) / 2
+            group_lines[max(0, bisect_right(starts, center) - 1)].append(line)
+        lines_by_crop.extend(group_lines)
+        owners.extend(owner for owner, _ in group)
+
+    texts = [[] for _ in crops_by_page]
+    for owner, lines in zip(owners, lines_by_crop):
+        text = lines_to_text(lines)
+        if text:
+            texts[owner].append(text)
+    return ['\n\n'.join(parts) for parts in texts], calls
+
+def ocr_pages_stitched(pages):
+    """
+    Batched OCR of PyMuPDF pages
+    Returns (one text per page, number of Tesseract calls)
+    """
+    return ocr_crops_stitched([page_crops(page) for page in pages])
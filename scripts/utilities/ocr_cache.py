@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Content-addressed OCR result cache shared by the PDF extractors
+
+Raw OCR text is stored in SQLite, keyed by a hash of:
+    PDF bytes + page index + render settings (zoom/DPI) + Tesseract config
+so re-running an extractor after changing only the parsing code skips
+rendering and OCR entirely. The cache is bounded by total text size and
+evicts least-recently-used entries.
+
+Usage from an extractor:
+    cache = cache_from_args(args)
+    text = cache.get_or_compute(pdf_path, page_index, 'zoom=3.0', 'lang=eng',
+                                lambda: run_ocr(...))
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    'OCR_CACHE_PATH',
+    os.path.join(Path.home(), '.cache', 'ayanshtest', 'ocr-cache.sqlite3')
+)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512MB of OCR text is far more than the whole corpus
+
+# ============================================================================
+# PDF HASHING
+# ============================================================================
+
+# (path, mtime, size) -> sha256, so each PDF is hashed once per run
+_pdf_hashes = {}
+
+def file_sha256(path):
+    """SHA-256 of a file's bytes, memoized on path/mtime/size"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    digest = _pdf_hashes.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        _pdf_hashes[memo_key] = digest
+
+    return digest
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+class OcrCache:
+    """
+    SQLite-backed OCR text cache with size-based LRU eviction
+
+    enabled=False turns every lookup into a miss and stores nothing (--no-cache).
+    refresh=True ignores existing entries but stores the new results (--refresh).
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, enabled=True, refresh=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+
+        if enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS ocr_cache (
+                    key      TEXT PRIMARY KEY,
+                    text     TEXT NOT NULL,
+                    size     INTEGER NOT NULL,
+                    accessed REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS ocr_cache_accessed ON ocr_cache (accessed)")
+            self._db.commit()
+
+    def key(self, pdf_path, page_index, render, config):
+        """Cache key for one page: PDF content hash + page + render settings + OCR config"""
+        parts = [file_sha256(pdf_path), str(page_index), str(render), str(config)]
+        return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return cached OCR text, or None on a miss"""
+        if not self.enabled or self.refresh:
+            self.misses += 1
+            return None
+
+        row = self._db.execute("SELECT text FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self._db.execute("UPDATE ocr_cache SET accessed = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, text):
+        """Store OCR text and evict least-recently-used entries if over budget"""
+        if not self.enabled:
+            return
+
+        self._db.execute(
+            "INSERT OR REPLACE INTO ocr_cache (key, text, size, accessed) VALUES (?, ?, ?, ?)",
+            (key, text, len(text.encode('utf-8')), time.time())
+        )
+        self._evict()
+        self._db.commit()
+
+    def get_or_compute(self, pdf_path, page_index, render, config, compute):
+        """Return cached text for the page, calling compute() and storing the result on a miss"""
+        key = self.key(pdf_path, page_index, render, config) if self.enabled else None
+        text = self.get(key)
+        if text is None:
+            text = compute()
+            # Empty text usually means an OCR error - don't pin it in the cache
+            if text:
+                self.put(key, text)
+        return text
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        stale = []
+        for key, size in self._db.execute("SELECT key, size FROM ocr_cache ORDER BY accessed"):
+            stale.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._db.executemany("DELETE FROM ocr_cache WHERE key = ?", stale)
+
+    def summary(self):
+        if not self.enabled:
+            return "OCR cache: disabled"
+        return f"OCR cache: {self.hits} hits, {self.misses} misses ({self.path})"
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+# ============================================================================
+# COMMAND LINE
+# ============================================================================
+
+def add_cache_args(parser):
+    """Add --no-cache / --refresh / --cache-path / --cache-max-mb to an argparse parser"""
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Don't read or write the OCR cache")
+    parser.add_argument('--refresh', action='store_true',
+                        help="Re-run OCR for every page and overwrite cached results")
+    parser.add_argument('--cache-path', default=DEFAULT_CACHE_PATH,
+                        help=f"OCR cache database (default: {DEFAULT_CACHE_PATH})")
+    parser.add_argument('--cache-max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="Evict least-recently-used entries above this size")
+
+def cache_from_args(args):
+    return OcrCache(
+        path=args.cache_path,
+        max_bytes=args.cache_max_mb * 1024 * 1024,
+        enabled=not args.no_cache,
+        refresh=args.refresh
+    )
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+OCR engine shared by the PDF extractors
+
+pytesseract starts a new tesseract process for every call, writes the image
+to a temp file and reloads the language model each time. When tesserocr is
+installed, this module keeps Tesseract loaded in-process through its C API
+(one instance per thread, language and config) and passes images in memory.
+Without tesserocr it falls back to pytesseract.
+
+config takes tesseract command-line options for either engine. tesserocr
+applies --psm, --oem, --dpi, --tessdata-dir, -c name=value variables and
+config file names (e.g. "digits") when it creates an instance; any other
+option raises ValueError instead of being silently ignored.
+
+Usage:
+    from ocr_engine import get_engine
+    text = get_engine().image_to_string(pil_image, lang='eng', config='--psm 6')
+    text = get_engine().pixmap_to_string(fitz_pixmap, lang='eng')
+    lines = get_engine().pixmap_to_lines(fitz_pixmap, lang='eng')  # text + confidence per line
+
+Set OCR_ENGINE=pytesseract or OCR_ENGINE=tesserocr to force an engine.
+
+Requirements:
+    pip install tesserocr   (optional, recommended)
+    pip install pytesseract (fallback)
+"""
+
+import os
+import shlex
+import threading
+
+import pytesseract
+from PIL import Image
+
+from extraction_metrics import timed
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+# Tesseract command-line options taking a value -> tesserocr init argument or variable
+CONFIG_INIT_OPTIONS = {'--psm': 'psm', '--oem': 'oem', '--tessdata-dir': 'path'}
+CONFIG_VARIABLE_OPTIONS = {'--dpi': 'user_defined_dpi', '--user-words': 'user_words_file',
+                           '--user-patterns': 'user_patterns_file'}
+
+# ============================================================================
+# CONFIG
+# ============================================================================
+
+def parse_config(config):
+    """
+    Tesseract command-line options as tesserocr init arguments
+    Returns {'psm', 'oem', 'path' (each None if not given), 'variables', 'configs'}
+    Raises ValueError for an option tesserocr can't apply
+    """
+    parsed = {'psm': None, 'oem': None, 'path': None, 'variables': {}, 'configs': []}
+    args = shlex.split(config or '')
+    while args:
+        arg = args.pop(0)
+        if arg in CONFIG_INIT_OPTIONS or arg in CONFIG_VARIABLE_OPTIONS or arg == '-c':
+            if not args:
+                raise ValueError(f"OCR config option {arg} has no value")
+            value = args.pop(0)
+            if arg == '-c':
+                name, sep, value = value.partition('=')
+                if not sep:
+                    raise ValueError(f"OCR config -c {name}: expected name=value")
+                parsed['variables'][name] = value
+            elif arg in CONFIG_VARIABLE_OPTIONS:
+                parsed['variables'][CONFIG_VARIABLE_OPTIONS[arg]] = value
+            elif arg == '--tessdata-dir':
+                parsed['path'] = value
+            else:
+                parsed[CONFIG_INIT_OPTIONS[arg]] = int(value)
+        elif arg.startswith('-'):
+            raise ValueError(f"OCR config option {arg} is not supported by the tesserocr engine")
+        else:
+            parsed['configs'].append(arg)
+    return parsed
+
+# ============================================================================
+# LINE RESULTS
+# ============================================================================
+
+# *_to_lines() return one dict per recognised text line, in reading order:
+#     {'text': str, 'conf': mean word confidence 0-100,
+#      'bbox': (x0, y0, x1, y1) in image pixels, 'block': block number}
+
+def lines_to_text(lines):
+    """Join line results back into page text, with a blank line between blocks"""
+    parts = []
+    block = None
+    for line in lines:
+        if parts and line['block'] != block:
+            parts.append('')
+        parts.append(line['text'])
+        block = line['block']
+    return '\n'.join(parts)
+
+# ============================================================================
+# PIXMAP CONVERSION
+# ============================================================================
+
+def pixmap_to_image(pix):
+    """
+    Wrap a PyMuPDF pixmap's raw samples as a PIL image without copying or
+    a PNG encode/decode round trip. The image shares the pixmap's memory,
+    so keep the pixmap alive for as long as the image is used.
+    """
+    if pix.alpha:
+        mode = 'RGBA' if pix.n == 4 else 'LA'
+    else:
+        mode = {1: 'L', 3: 'RGB', 4: 'CMYK'}[pix.n]
+    return Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, 'raw', mode, pix.stride, 1)
+
+# ============================================================================
+# ENGINES
+# ============================================================================
+
+class PytesseractEngine:
+    """One tesseract subprocess per call (the original behaviour)"""
+
+    name = 'pytesseract'
+
+    @timed('ocr')
+    def image_to_string(self, image, lang='eng', config=''):
+        return pytesseract.image_to_string(image, lang=lang, config=config)
+
+    @timed('ocr')
+    def pixmap_to_string(self, pix, lang='eng', config=''):
+        # pytesseract still hands tesseract a temp file, but skips our own PNG round trip
+        return self.image_to_string(pixmap_to_image(pix), lang=lang, config=config)
+
+    @timed('ocr')
+    def image_to_lines(self, image, lang='eng', config=''):
+        data = pytesseract.image_to_data(image, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+        lines = {}
+        for i, word in enumerate(data['text']):
+            word = (word or '').strip()
+            if not word:
+                continue
+            key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            x0, y0 = data['left'][i], data['top'][i]
+            x1, y1 = x0 + data['width'][i], y0 + data['height'][i]
+            line = lines.get(key)
+            if line is None:
+                line = lines[key] = {'words': [], 'confs': [], 'bbox': (x0, y0, x1, y1), 'block': key[0]}
+            line['words'].append(word)
+            conf = float(data['conf'][i])
+            if conf >= 0:
+                line['confs'].append(conf)
+            bx0, by0, bx1, by1 = line['bbox']
+            line['bbox'] = (min(bx0, x0), min(by0, y0), max(bx1, x1), max(by1, y1))
+
+        return [
+            {
+                'text': ' '.join(line['words']),
+                'conf': sum(line['confs']) / len(line['confs']) if line['confs'] else 0.0,
+                'bbox': line['bbox'],
+                'block': line['block']
+            }
+            for line in lines.values()
+        ]
+
+    @timed('ocr')
+    def pixmap_to_lines(self, pix, lang='eng', config=''):
+        return self.image_to_lines(pixmap_to_image(pix), lang=lang, config=config)
+
+    def version(self):
+        return str(pytesseract.get_tesseract_version())
+
+class TesserocrEngine:
+    """
+    Resident Tesseract instances through the tesserocr C API
+    Instances are cached per thread, keyed by (lang, config), and reused for every page
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self):
+        self._local = threading.local()
+        self.tessdata = _tessdata_path()
+
+    def _api(self, lang, config):
+        apis = getattr(self._local, 'apis', None)
+        if apis is None:
+            apis = self._local.apis = {}
+
+        api = apis.get((lang, config))
+        if api is None:
+            options = parse_config(config)
+            kwargs = {
+                'lang': lang,
+                'psm': tesserocr.PSM.AUTO if options['psm'] is None else options['psm'],
+                'oem': tesserocr.OEM.DEFAULT if options['oem'] is None else options['oem'],
+                'variables': options['variables'],
+                'configs': options['configs'],
+            }
+            path = options['path'] or self.tessdata
+            if path:
+                kwargs['path'] = path
+            api = tesserocr.PyTessBaseAPI(**kwargs)
+            apis[(lang, config)] = api
+        return api
+
+    def _set_pixmap(self, pix, lang, config):
+        # Raw samples go straight into Tesseract - no image codec at all
+        api = self._api(lang, config)
+        if pix.alpha or pix.n not in (1, 3):
+            api.SetImage(pixmap_to_image(pix).convert('RGB'))
+        else:
+            api.SetImageBytes(pix.samples, pix.width, pix.height, pix.n, pix.stride)
+        return api
+
+    @timed('ocr')
+    def image_to_string(self, image, lang='eng', config=''):
+        api = self._api(lang, config)
+        api.SetImage(image)
+        return api.GetUTF8Text()
+
+    @timed('ocr')
+    def pixmap_to_string(self, pix, lang='eng', config=''):
+        return self._set_pixmap(pix, lang, config).GetUTF8Text()
+
+    def _lines(self, api):
+        api.Recognize()
+        level = tesserocr.RIL.TEXTLINE
+        lines = []
+        block = 0
+        for item in tesserocr.iterate_level(api.GetIterator(), level):
+            if item.IsAtBeginningOf(tesserocr.RIL.BLOCK):
+                block += 1
+            try:
+                text = ' '.join(item.GetUTF8Text(level).split())
+            except RuntimeError:
+                continue
+            if text:
+                lines.append({'text': text, 'conf': item.Confidence(level), 'bbox': item.BoundingBox(level), 'block': block})
+        return lines
+
+    @timed('ocr')
+    def image_to_lines(self, image, lang='eng', config=''):
+        api = self._api(lang, config)
+        api.SetImage(image)
+        return self._lines(api)
+
+    @timed('ocr')
+    def pixmap_to_lines(self, pix, lang='eng', config=''):
+        return self._lines(self._set_pixmap(pix, lang, config))
+
+    def version(self):
+        return tesserocr.tesseract_version().splitlines()[0]
+
+def _tessdata_path():
+    """tessdata next to the configured tesseract binary (Windows installs), if present"""
+    if os.environ.get('TESSDATA_PREFIX'):
+        return None
+    cmd = pytesseract.pytesseract.tesseract_cmd
+    tessdata = os.path.join(os.path.dirname(cmd), 'tessdata')
+    return tessdata if os.path.isdir(tessdata) else None
+
+# ============================================================================
+# ENGINE SELECTION
+# ============================================================================
+
+# One engine per process; worker processes each build their own
+_engine = None
+
+def get_engine():
+    """Process-wide OCR engine: tesserocr when available, else pytesseract"""
+    global _engine
+    if _engine is None:
+        choice = os.environ.get('OCR_ENGINE', 'auto')
+        if choice == 'tesserocr' and tesserocr is None:
+            raise ImportError("OCR_ENGINE=tesserocr but tesserocr is not installed (pip install tesserocr)")
+        if tesserocr is not None and choice != 'pytesseract':
+            _engine = TesserocrEngine()
+        else:
+            _engine = PytesseractEngine()
+    return _engine
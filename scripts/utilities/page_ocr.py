@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+Shared page text extraction for the PDF extractors
+
+    extract_text_from_page  - render a PyMuPDF page and OCR it with Tesseract
+    extract_text_adaptive   - OCR at low zoom first, re-render only the page
+                              or lines whose Tesseract confidence is low
+    extract_text_preprocessed - OCR several preprocessing variants concurrently
+                              and keep the most confident one
+    extract_text_regions    - OCR only the page's text bands, skipping
+                              diagrams and blank space
+    blank_page_reason       - cheap check for pages not worth rendering/OCRing
+    text_layer_quality      - score a page's embedded text layer
+    extract_text_hybrid     - use the text layer when it is good enough,
+                              fall back to OCR only for pages that fail
+
+Requirements:
+    pip install pymupdf pytesseract pillow
+    pip install tesserocr (optional, keeps Tesseract loaded - see ocr_engine.py)
+"""
+
+import re
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from diagram_detect import pixmap_gray_array
+from extraction_metrics import metrics
+from image_preprocess import PREPROCESS_VARIANTS, gray_histogram, preprocess
+from text_bands import text_bands
+
+from ocr_engine import get_engine, lines_to_text
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# OCR render/recognition settings (also part of the OCR cache key)
+OCR_ZOOM = 3.0  # High quality for better OCR
+OCR_LANG = 'eng'
+OCR_RENDER_KEY = f"fitz zoom={OCR_ZOOM}"
+OCR_CONFIG_KEY = f"lang={OCR_LANG}"
+
+# Adaptive resolution: OCR cost grows with pixel count, and most clean pages
+# read fine well below OCR_ZOOM. Zooms are tried lowest first.
+ADAPTIVE_ZOOMS = (1.5, 2.0, OCR_ZOOM)
+MIN_LINE_CONFIDENCE = 70      # Lines below this are re-read from a higher-zoom crop
+MAX_LOW_LINE_RATIO = 0.5      # More low lines than this re-renders the whole page instead
+LINE_PADDING = 4              # Points added around a re-read line
+LINE_OCR_CONFIG = '--psm 7'   # A line crop is a single text line
+ADAPTIVE_KEY = (
+    f"adaptive zooms={','.join(str(z) for z in ADAPTIVE_ZOOMS)} "
+    f"line>={MIN_LINE_CONFIDENCE} low<={MAX_LOW_LINE_RATIO}"
+)
+ADAPTIVE_RENDER_KEY = f"fitz {ADAPTIVE_KEY}"
+
+# Preprocessing variants: OCRed concurrently, stopping as soon as one reaches the bar
+PREPROCESS_QUALITY_BAR = 90   # Mean confidence that ends the search early
+PREPROCESS_WORKERS = 3        # Variants OCRed at the same time
+PREPROCESS_RENDER_KEY = (
+    f"{OCR_RENDER_KEY} gray variants={','.join(PREPROCESS_VARIANTS)} bar={PREPROCESS_QUALITY_BAR}"
+)
+
+# A text layer is used instead of OCR when it passes all of these
+MIN_TEXT_CHARS = 40           # Fewer usually means a scanned page with a stray header/footer
+MIN_TEXT_CHARS_OPTIONS = 15   # A page with (A)-(E) markers can be short and still be complete
+MAX_GARBAGE_RATIO = 0.05      # Replacement/control/private-use chars from broken font encodings
+MIN_ALNUM_RATIO = 0.40        # Mostly symbols means a broken encoding rather than real text
+
+OPTION_MARKER = re.compile(r'\([A-E]\)')
+
+# Blank page pre-filter, run before a page is rendered for OCR
+BLANK_THUMB_ZOOM = 0.2        # ~120x160 px thumbnail for a letter page
+BLANK_INK_LEVEL = 200         # Gray levels below this count as ink on the thumbnail
+MAX_BLANK_INK_RATIO = 0.001   # Less ink than this is a blank page or stray specks
+
+# ============================================================================
+# OCR
+# ============================================================================
+
+def extract_text_from_page(page, raster=None):
+    """
+    Extract text from PDF page using OCR
+    raster: optional PageRaster at OCR_ZOOM shared with the diagram crop
+    Returns raw OCR text
+    """
+    # Render page as high-resolution image
+    if raster is not None:
+        pix = raster.pixmap()
+    else:
+        mat = fitz.Matrix(OCR_ZOOM, OCR_ZOOM)
+        with metrics.span('render'):
+            pix = page.get_pixmap(matrix=mat)
+
+    # Use Tesseract OCR on the raw pixmap samples (no PNG encode/decode)
+    try:
+        text = get_engine().pixmap_to_string(pix, lang=OCR_LANG)
+        return text
+    except Exception as e:
+        print(f"    OCR Error: {e}")
+        return ""
+
+# ============================================================================
+# ADAPTIVE RESOLUTION OCR
+# ============================================================================
+
+def _raster_pixels(raster):
+    if isinstance(raster, fitz.Pixmap):
+        return raster.width * raster.height
+    return raster.size[0] * raster.size[1]
+
+def _ocr_lines(raster, config=''):
+    engine = get_engine()
+    if isinstance(raster, fitz.Pixmap):
+        return engine.pixmap_to_lines(raster, lang=OCR_LANG, config=config)
+    return engine.image_to_lines(raster, lang=OCR_LANG, config=config)
+
+def _mean_confidence(lines):
+    """Line confidences weighted by line length"""
+    chars = sum(len(line['text']) for line in lines)
+    if not chars:
+        return 0.0
+    return sum(line['conf'] * len(line['text']) for line in lines) / chars
+
+def adaptive_ocr(render, zooms=ADAPTIVE_ZOOMS, config=''):
+    """
+    OCR a page at the lowest zoom that reads well
+    render(zoom, clip) returns a fitz.Pixmap or PIL image of the page at `zoom`
+    (1.0 = 72 DPI), cropped to clip=(x0, y0, x1, y1) in page points when given
+    The whole page moves to the next zoom only while most of its lines are
+    below MIN_LINE_CONFIDENCE; the remaining low lines are then re-read one by
+    one from higher-zoom crops
+    config: Tesseract options for the full-page passes
+    Returns (text, info) with info keys zoom, confidence, regions, pixels, seconds
+    """
+    start = time.perf_counter()
+    pixels = 0
+
+    for zoom in zooms:
+        raster = render(zoom, None)
+        pixels += _raster_pixels(raster)
+        lines = _ocr_lines(raster, config)
+        for line in lines:
+            line['bbox'] = tuple(v / zoom for v in line['bbox'])
+        low = sum(1 for line in lines if line['conf'] < MIN_LINE_CONFIDENCE)
+        if lines and low <= MAX_LOW_LINE_RATIO * len(lines):
+            break
+
+    regions = 0
+    for line in lines:
+        if line['conf'] >= MIN_LINE_CONFIDENCE:
+            continue
+        regions += 1
+        x0, y0, x1, y1 = line['bbox']
+        for higher in (z for z in zooms if z > zoom):
+            crop = render(higher, (x0 - LINE_PADDING, y0 - LINE_PADDING, x1 + LINE_PADDING, y1 + LINE_PADDING))
+            pixels += _raster_pixels(crop)
+            reread = _ocr_lines(crop, LINE_OCR_CONFIG)
+            conf = _mean_confidence(reread)
+            if reread and conf > line['conf']:
+                line['text'] = ' '.join(r['text'] for r in reread)
+                line['conf'] = conf
+            if line['conf'] >= MIN_LINE_CONFIDENCE:
+                break
+
+    info = {
+        'zoom': zoom,
+        'confidence': _mean_confidence(lines),
+        'regions': regions,
+        'pixels': pixels,
+        'seconds': time.perf_counter() - start
+    }
+    return lines_to_text(lines), info
+
+def extract_text_adaptive(page):
+    """
+    Adaptive-resolution OCR of a PyMuPDF page
+    Returns (text, info); info also has fixed_pixels, the cost of a plain
+    OCR_ZOOM render, for reporting the saving. info is None on OCR errors
+    """
+    def render(zoom, clip):
+        clip = fitz.Rect(clip) & page.rect if clip else None
+        with metrics.span('render'):
+            return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip)
+
+    try:
+        text, info = adaptive_ocr(render)
+    except Exception as e:
+        print(f"    OCR Error: {e}")
+        return "", None
+    info['fixed_pixels'] = int(page.rect.width * OCR_ZOOM) * int(page.rect.height * OCR_ZOOM)
+    return text, info
+
+def adaptive_decision(info):
+    """One-line description of a page's zoom decision"""
+    text = f"{info['zoom']}x, confidence {info['confidence']:.0f}"
+    if info['regions']:
+        text += f", {info['regions']} line(s) re-read at higher zoom"
+    return text
+
+class AdaptiveStats:
+    """Run totals of adaptive OCR decisions for the summary"""
+
+    def __init__(self):
+        self.zooms = Counter()
+        self.regions = 0
+        self.pixels = 0
+        self.fixed_pixels = 0
+        self.seconds = 0.0
+
+    def add(self, info):
+        if not info:
+            return
+        self.zooms[info['zoom']] += 1
+        self.regions += info['regions']
+        self.pixels += info['pixels']
+        self.fixed_pixels += info['fixed_pixels']
+        self.seconds += info['seconds']
+
+    def summary(self, fixed_label=f"{OCR_ZOOM}x"):
+        if not self.zooms:
+            return "Adaptive OCR: no pages OCRed"
+        pages = ', '.join(f"{count} at {zoom}x" for zoom, count in sorted(self.zooms.items()))
+        ratio = self.pixels / self.fixed_pixels if self.fixed_pixels else 1.0
+        # OCR time scales roughly with pixels, so estimate the fixed-zoom time from the ratio
+        saved = self.seconds / ratio - self.seconds if ratio else 0.0
+        return (f"Adaptive OCR: pages {pages}; {self.regions} line(s) re-read; "
+                f"{ratio:.0%} of the pixels of fixed {fixed_label} "
+                f"({self.seconds:.1f}s OCR, ~{saved:.1f}s saved)")
+
+# ============================================================================
+# PREPROCESSING VARIANTS
+# ============================================================================
+
+# Shared by all pages; Tesseract (tesserocr or the pytesseract subprocess)
+# runs outside the GIL, so threads give real concurrency
+_variant_pools = {}
+
+def _variant_executor(workers):
+    pool = _variant_pools.get(workers)
+    if pool is None:
+        pool = _variant_pools[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr-variant')
+    return pool
+
+def _ocr_variant(gray, hist, variant):
+    image = Image.fromarray(preprocess(gray, variant, hist))
+    return _ocr_lines(image)
+
+def ocr_best_variant(gray, variants=PREPROCESS_VARIANTS, workers=PREPROCESS_WORKERS):
+    """
+    OCR preprocessing variants of a grayscale array concurrently
+    Results are taken as they finish; the first one at PREPROCESS_QUALITY_BAR
+    wins and variants not yet started are cancelled, otherwise the most
+    confident of all of them is kept
+    Returns (text, info) with info keys variant, confidence, tried, seconds
+    """
+    start = time.perf_counter()
+    hist = gray_histogram(gray)
+    pool = _variant_executor(workers)
+    futures = {pool.submit(_ocr_variant, gray, hist, variant): variant for variant in variants}
+
+    best_variant, best_lines, best_conf = None, [], -1.0
+    tried = 0
+    try:
+        for future in as_completed(futures):
+            tried += 1
+            lines = future.result()
+            conf = _mean_confidence(lines)
+            if conf > best_conf:
+                best_variant, best_lines, best_conf = futures[future], lines, conf
+            if best_conf >= PREPROCESS_QUALITY_BAR:
+                break
+    finally:
+        for future in futures:
+            future.cancel()
+
+    info = {
+        'variant': best_variant,
+        'confidence': max(best_conf, 0.0),
+        'tried': tried,
+        'seconds': time.perf_counter() - start
+    }
+    return lines_to_text(best_lines), info
+
+def extract_text_preprocessed(page, raster=None):
+    """
+    OCR a PyMuPDF page through the preprocessing variants
+    raster: optional PageRaster at OCR_ZOOM shared with the diagram crop
+    Returns (text, info) as ocr_best_variant does; info is None on OCR errors
+    """
+    if raster is not None:
+        gray = raster.gray()
+    else:
+        with metrics.span('render'):
+            pix = page.get_pixmap(matrix=fitz.Matrix(OCR_ZOOM, OCR_ZOOM), colorspace=fitz.csGRAY)
+        # Copy out of the pixmap: cancelled-too-late variants may still be reading it
+        gray = pixmap_gray_array(pix).copy()
+    try:
+        return ocr_best_variant(gray)
+    except Exception as e:
+        print(f"    OCR Error: {e}")
+        return "", None
+
+def preprocess_decision(info):
+    """One-line description of a page's variant choice"""
+    return f"variant {info['variant']}, confidence {info['confidence']:.0f} ({info['tried']} OCRed)"
+
+class PreprocessStats:
+    """Run totals of winning preprocessing variants for the summary"""
+
+    def __init__(self):
+        self.variants = Counter()
+        self.tried = 0
+        self.seconds = 0.0
+
+    def add(self, info):
+        if not info:
+            return
+        self.variants[info['variant']] += 1
+        self.tried += info['tried']
+        self.seconds += info['seconds']
+
+    def summary(self):
+        pages = sum(self.variants.values())
+        if not pages:
+            return "Preprocessing: no pages OCRed"
+        winners = ', '.join(f"{variant} {count}" for variant, count in self.variants.most_common())
+        return (f"Preprocessing: best variant {winners}; "
+                f"{self.tried / pages:.1f} of {len(PREPROCESS_VARIANTS)} variants OCRed per page, "
+                f"{self.seconds / pages:.2f}s per page")
+
+# ============================================================================
+# REGION-RESTRICTED OCR
+# ============================================================================
+
+BAND_OCR_CONFIG = '--psm 6'   # A band is a uniform block of text
+REGIONS_RENDER_KEY = f"{OCR_RENDER_KEY} text-bands"
+
+def extract_text_regions(page):
+    """
+    OCR only the page's text bands (see text_bands.py) at OCR_ZOOM, top to bottom
+    Falls back to the whole page when no bands are found
+    Returns (text, info) with info keys bands, source, pixels, fixed_pixels;
+    info is None on OCR errors
+    """
+    mat = fitz.Matrix(OCR_ZOOM, OCR_ZOOM)
+    fixed_pixels = int(page.rect.width * OCR_ZOOM) * int(page.rect.height * OCR_ZOOM)
+
+    try:
+        bands, source = text_bands(page)
+        if not bands:
+            return extract_text_from_page(page), {
+                'bands': 0, 'source': 'page', 'pixels': fixed_pixels, 'fixed_pixels': fixed_pixels
+            }
+
+        texts = []
+        pixels = 0
+        for band in bands:
+            with metrics.span('render'):
+                pix = page.get_pixmap(matrix=mat, clip=band)
+            pixels += pix.width * pix.height
+            text = get_engine().pixmap_to_string(pix, lang=OCR_LANG, config=BAND_OCR_CONFIG).strip()
+            if text:
+                texts.append(text)
+    except Exception as e:
+        print(f"    OCR Error: {e}")
+        return "", None
+
+    info = {'bands': len(bands), 'source': source, 'pixels': pixels, 'fixed_pixels': fixed_pixels}
+    return '\n\n'.join(texts), info
+
+def region_decision(info):
+    """One-line description of a page's text bands"""
+    if not info['bands']:
+        return "no text bands found, full page"
+    return (f"{info['bands']} text band(s) from {info['source']}, "
+            f"{info['pixels'] / info['fixed_pixels']:.0%} of the page pixels")
+
+class RegionStats:
+    """Run totals of region-restricted OCR for the summary"""
+
+    def __init__(self):
+        self.pages = 0
+        self.bands = 0
+        self.pixels = 0
+        self.fixed_pixels = 0
+
+    def add(self, info):
+        if not info:
+            return
+        self.pages += 1
+        self.bands += info['bands']
+        self.pixels += info['pixels']
+        self.fixed_pixels += info['fixed_pixels']
+
+    def summary(self):
+        if not self.pages:
+            return "Text bands: no pages OCRed"
+        ratio = self.pixels / self.fixed_pixels if self.fixed_pixels else 1.0
+        return (f"Text bands: {self.bands} band(s) on {self.pages} pages; "
+                f"OCRed {ratio:.0%} of the full-page pixels")
+
+# ============================================================================
+# BLANK PAGE FILTER
+# ============================================================================
+
+def blank_page_reason(page):
+    """
+    Why a page can be skipped without OCR, or None if it may hold text
+    A page without images and with an empty content stream is skipped unseen;
+    anything else (text may be vector outlines) is judged by the ink ratio of
+    a tiny grayscale thumbnail
+    """
+    if not page.get_images() and not page.read_contents().strip():
+        return 'empty content stream'
+
+    with metrics.span('render'):
+        pix = page.get_pixmap(matrix=fitz.Matrix(BLANK_THUMB_ZOOM, BLANK_THUMB_ZOOM), colorspace=fitz.csGRAY)
+    ink_ratio = (pixmap_gray_array(pix) < BLANK_INK_LEVEL).mean()
+    if ink_ratio < MAX_BLANK_INK_RATIO:
+        return f'blank thumbnail ({ink_ratio:.2%} ink)'
+    return None
+
+# ============================================================================
+# TEXT LAYER
+# ============================================================================
+
+def _is_garbage(char):
+    if char == '\ufffd':
+        return True
+    return unicodedata.category(char) in ('Cc', 'Co', 'Cn') and not char.isspace()
+
+def text_layer_quality(text):
+    """
+    Score an embedded text layer
+    Returns dict with chars, garbage_ratio, alnum_ratio, has_options and usable
+    """
+    stripped = ''.join((text or '').split())
+    chars = len(stripped)
+    if chars == 0:
+        return {'chars': 0, 'garbage_ratio': 0.0, 'alnum_ratio': 0.0, 'has_options': False, 'usable': False}
+
+    garbage_ratio = sum(1 for c in stripped if _is_garbage(c)) / chars
+    alnum_ratio = sum(1 for c in stripped if c.isalnum()) / chars
+    has_options = bool(OPTION_MARKER.search(text))
+
+    min_chars = MIN_TEXT_CHARS_OPTIONS if has_options else MIN_TEXT_CHARS
+    usable = (
+        chars >= min_chars
+        and garbage_ratio <= MAX_GARBAGE_RATIO
+        and alnum_ratio >= MIN_ALNUM_RATIO
+    )
+
+    return {
+        'chars': chars,
+        'garbage_ratio': garbage_ratio,
+        'alnum_ratio': alnum_ratio,
+        'has_options': has_options,
+        'usable': usable
+    }
+
+# ============================================================================
+# HYBRID
+# ============================================================================
+
+def extract_text_hybrid(page, text_layer=None, ocr=None):
+    """
+    Text-layer-first extraction for one page
+    text_layer: the page's embedded text if already read (e.g. via PyPDF2);
+                defaults to PyMuPDF's page.get_text()
+    ocr: callable returning OCR text for the page (e.g. an OcrCache lookup);
+         defaults to extract_text_from_page(page)
+    Returns (text, source) where source is 'text' or 'ocr'
+    """
+    if text_layer is None:
+        text_layer = page.get_text()
+
+    if text_layer_quality(text_layer)['usable']:
+        return text_layer, 'text'
+
+    if ocr is None:
+        return extract_text_from_page(page), 'ocr'
+    return ocr(), 'ocr'
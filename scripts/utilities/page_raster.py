@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Shared per-page raster
+
+The MOEMS extractor used to rasterize every page twice at zoom 3: once for
+OCR and again, clipped, for the diagram crop. A PageRaster renders the page
+once and hands out what each consumer needs:
+    pixmap()        full-page RGB pixmap, the OCR input
+    gray()          grayscale copy, the input of the preprocessing variants
+    crop_image()    a diagram crop, sliced from the full raster as a NumPy view
+
+The full render is lazy: a page whose text came from the text layer or the
+OCR cache only has its diagram region rendered (clipped). release() drops
+the raster, so only one page's pixels are held at a time.
+
+Usage:
+    raster = PageRaster(page, OCR_ZOOM, render_stats)
+    text = extract_text_from_page(page, raster)
+    image = raster.crop_image(diagram_rect)
+    raster.release()
+
+Requirements:
+    pip install pymupdf numpy pillow
+"""
+
+import time
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from diagram_detect import pixmap_gray_array
+from extraction_metrics import metrics
+
+
+class RenderStats:
+    """Run totals of page rasterization for the summary"""
+
+    def __init__(self):
+        self.pages = 0
+        self.full = 0
+        self.clips = 0
+        self.pixels = 0
+        self.seconds = 0.0
+
+    def add(self, kind, pix, seconds):
+        if kind == 'full':
+            self.full += 1
+        else:
+            self.clips += 1
+        self.pixels += pix.width * pix.height
+        self.seconds += seconds
+
+    def summary(self, shared=True):
+        if not self.pages:
+            return "Rendering: no pages rendered"
+        mode = "shared page raster" if shared else "separate OCR and diagram renders"
+        return (f"Rendering: {self.full} full-page + {self.clips} clipped renders for {self.pages} pages, "
+                f"{self.pixels / self.pages / 1e6:.1f} MP and {self.seconds / self.pages * 1000:.0f} ms "
+                f"per page ({mode})")
+
+
+class PageRaster:
+    """
+    One page rendered once at `zoom`, shared by OCR and the diagram crop
+
+    shared=False renders every request separately, as before (for comparing
+    render time in the run summary).
+    """
+
+    def __init__(self, page, zoom, stats=None, shared=True):
+        self.page = page
+        self.zoom = zoom
+        self.stats = stats
+        self.shared = shared
+        self._pix = None
+        self._gray = None
+        if stats is not None:
+            stats.pages += 1
+
+    def _render(self, kind, **kwargs):
+        start = time.perf_counter()
+        with metrics.span('render'):
+            pix = self.page.get_pixmap(matrix=fitz.Matrix(self.zoom, self.zoom), **kwargs)
+        if self.stats is not None:
+            self.stats.add(kind, pix, time.perf_counter() - start)
+        return pix
+
+    @property
+    def rendered(self):
+        return self._pix is not None
+
+    def pixmap(self):
+        """Full-page RGB pixmap"""
+        if self._pix is None or not self.shared:
+            self._pix = self._render('full')
+        return self._pix
+
+    def gray(self):
+        """Full-page grayscale (height, width) array, owned - safe to hand to other threads"""
+        if self._gray is None or not self.shared:
+            gray_pix = fitz.Pixmap(fitz.csGRAY, self.pixmap())
+            self._gray = pixmap_gray_array(gray_pix).copy()
+        return self._gray
+
+    def crop_array(self, rect):
+        """(height, width, 3) view of the full raster inside rect (page points)"""
+        pix = self.pixmap()
+        box = (fitz.Rect(rect) * fitz.Matrix(self.zoom, self.zoom)).irect & fitz.IRect(0, 0, pix.width, pix.height)
+        samples = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+        rows = samples[box.y0:box.y1, box.x0 * pix.n:box.x1 * pix.n]
+        return rows.reshape(box.height, box.width, pix.n)
+
+    def crop_image(self, rect):
+        """
+        PIL RGB image of rect (page points): sliced from the full raster when
+        it is already rendered, otherwise rendered clipped
+        """
+        if self.shared and self.rendered:
+            return Image.fromarray(self.crop_array(rect))
+        pix = self._render('clip', clip=rect)
+        return Image.frombytes('RGB', (pix.width, pix.height), pix.samples)
+
+    def release(self):
+        """Drop the raster once every consumer has finished with the page"""
+        self._pix = None
+        self._gray = None
+
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Crash-safe NDJSON question output for the extractors
+
+Each question is appended as one JSON line as soon as it is parsed and the
+file is fsynced at page boundaries, so an interrupted run keeps everything
+up to the last finished page. With resume=True the existing file is read
+back, a torn last line is dropped, and already-written questions can be
+skipped. build_pretty_json() turns the stream into the indented JSON array
+that scripts/import.ts reads, without loading it all into memory.
+"""
+
+import json
+import os
+
+def question_key(question):
+    return (int(question['examYear']), str(question['questionNumber']))
+
+def read_ndjson(path):
+    """Yield each complete JSON line in an NDJSON file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+class QuestionStream:
+    """Append-only NDJSON question log"""
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.done = set()
+        self.written = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if resume and os.path.exists(path):
+            self._recover()
+            self._file = open(path, 'a', encoding='utf-8')
+        else:
+            self._file = open(path, 'w', encoding='utf-8')
+
+    def _recover(self):
+        """Load finished question keys and cut off a partially written last line"""
+        good_bytes = 0
+        with open(self.path, 'rb') as f:
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break
+                try:
+                    question = json.loads(raw)
+                except ValueError:
+                    break
+                self.done.add(question_key(question))
+                good_bytes += len(raw)
+
+        if good_bytes != os.path.getsize(self.path):
+            print(f"  [WARN] Dropping incomplete record at end of {self.path}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(good_bytes)
+
+        print(f"  Resuming: {len(self.done)} questions already in {self.path}")
+
+    def has(self, exam_year, question_number):
+        return (int(exam_year), str(question_number)) in self.done
+
+    def append(self, question):
+        """Write one question line (not yet fsynced); already-written questions are ignored"""
+        key = question_key(question)
+        if key in self.done:
+            return
+        self._file.write(json.dumps(question, ensure_ascii=False) + '\n')
+        self.done.add(key)
+        self.written += 1
+
+    def checkpoint(self):
+        """Flush and fsync - call at page boundaries"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if not self._file.closed:
+            self.checkpoint()
+            self._file.close()
+
+def build_pretty_json(ndjson_path, json_path):
+    """
+    Write the NDJSON stream as the same indented JSON array json.dump(..., indent=2)
+    would produce, one record at a time. Returns the number of records.
+    ndjson_path may also be a list of streams, concatenated in order.
+    """
+    paths = [ndjson_path] if isinstance(ndjson_path, (str, os.PathLike)) else ndjson_path
+    count = 0
+    tmp_path = f"{json_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as out:
+        out.write('[')
+        for question in (question for path in paths for question in read_ndjson(path)):
+            body = json.dumps(question, indent=2, ensure_ascii=False)
+            out.write((',\n' if count else '\n') + '\n'.join('  ' + line for line in body.split('\n')))
+            count += 1
+        out.write('\n]' if count else ']')
+    os.replace(tmp_path, json_path)
+    return count
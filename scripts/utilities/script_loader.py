@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Import the hyphenated extractor scripts as modules
+
+Tools that drive the extractors in-process (bench-extractors.py,
+extract-watch-daemon.py) load extract-moems-complete-ocr.py and friends
+with load_script(), since a file name with dashes can't be imported.
+
+Usage:
+    from script_loader import load_script
+    moems = load_script('extract-moems-complete-ocr.py', 'extract_moems_complete_ocr')
+"""
+
+import importlib.util
+import sys
+
+def load_script(path, name):
+    """
+    Import the script at path as module `name`
+    It is registered in sys.modules, so jobs pickled from it resolve in
+    worker processes that load it under the same name
+    """
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
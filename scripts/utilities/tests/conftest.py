@@ -0,0 +1,12 @@
+"""
+pytest setup for the extraction helper modules
+
+Run from the repository root:
+    python -m pytest scripts/utilities/tests
+"""
+
+import os
+import sys
+
+# The helpers import each other as top-level modules, as the scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,39 @@
+"""Blank-page pre-filter and the pdf2image page range around it"""
+
+import os
+
+import fitz
+import pytest
+
+from page_ocr import blank_page_reason
+from script_loader import load_script
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def test_new_page_is_blank_unseen():
+    doc = fitz.open()
+    assert blank_page_reason(doc.new_page()) == 'empty content stream'
+
+def test_page_with_text_is_not_blank():
+    page = fitz.open().new_page()
+    page.insert_text((72, 72), "1A  Time: 3 minutes\nWhat is the sum of 12 and 30?" * 4, fontsize=14)
+    assert blank_page_reason(page) is None
+
+def test_page_with_only_a_drawing_is_judged_by_its_ink():
+    page = fitz.open().new_page()
+    page.draw_rect(fitz.Rect(72, 72, 540, 720), color=(0, 0, 0), fill=(0, 0, 0))
+    assert blank_page_reason(page) is None
+
+def test_pdf2image_page_range_clamps_to_last_page(tmp_path):
+    pytest.importorskip('pdf2image')
+    pytest.importorskip('pytesseract')
+    pdf2image = load_script(os.path.join(SCRIPTS_DIR, 'extract-with-pdf2image.py'), 'extract_with_pdf2image')
+    path = str(tmp_path / 'three-pages.pdf')
+    doc = fitz.open()
+    for _ in range(3):
+        doc.new_page()
+    doc.save(path)
+
+    assert pdf2image.page_range(path, 2, 10) == (2, 3)
+    assert pdf2image.page_range(path) == (1, 3)
+    assert pdf2image.page_range(path, 1, 2) == (1, 2)
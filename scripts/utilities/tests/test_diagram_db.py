@@ -0,0 +1,107 @@
+"""
+Bulk diagram loader
+
+The database test runs against the PostgreSQL in DATABASE_URL (e.g. a
+throwaway docker run --rm -e POSTGRES_PASSWORD=postgres -p 5433:5432 postgres:16)
+and is skipped without it or without psycopg2. It works in a schema of its
+own that is dropped afterwards, so no existing table is touched.
+"""
+
+import os
+import uuid
+
+import pytest
+
+from diagram_db import apply_diagrams, copy_buffer, diagram_rows, libpq_url
+
+def diagram(question, year, path, filename='moems-2007-2A.png'):
+    return {'question': question, 'year': year, 'path': path, 'filename': filename}
+
+def test_last_record_of_a_question_wins():
+    rows = diagram_rows([
+        diagram('2A', '2007', '/images/questions/old.png'),
+        diagram('3C', '2007', '/images/questions/moems-2007-3C.png'),
+        diagram('2A', '2007', '/images/questions/new.png'),
+        diagram('5', '2019', '/images/questions/k.png', filename='kangaroo-2019-p3-q5.png'),
+    ])
+
+    assert rows == [
+        ('MOEMS Division E', 2007, '3C', '/images/questions/moems-2007-3C.png'),
+        ('MOEMS Division E', 2007, '2A', '/images/questions/new.png'),
+        ('Math Kangaroo', 2019, '5', '/images/questions/k.png'),
+    ]
+
+def test_copy_buffer_escapes_text_format():
+    buffer = copy_buffer([('a\tb', 1, 'c\\d\ne')])
+    assert buffer.read() == 'a\\tb\t1\tc\\\\d\\ne\n'
+
+def test_prisma_schema_parameter_becomes_search_path():
+    url, schema = libpq_url('postgresql://u:p@localhost:5432/db?schema=public&sslmode=disable')
+    assert url == 'postgresql://u:p@localhost:5432/db?sslmode=disable'
+    assert schema == 'public'
+
+@pytest.fixture
+def questions_schema():
+    """DATABASE_URL pointed at a new schema holding an empty questions table"""
+    psycopg2 = pytest.importorskip('psycopg2')
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        pytest.skip("DATABASE_URL is not set")
+
+    url, _ = libpq_url(database_url)
+    schema = f"diagram_db_test_{uuid.uuid4().hex[:8]}"
+    conn = psycopg2.connect(url)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f'CREATE SCHEMA "{schema}"')
+            cur.execute(f'''
+                CREATE TABLE "{schema}".questions (
+                    id               text PRIMARY KEY,
+                    "examName"       varchar(50),
+                    "examYear"       integer,
+                    "questionNumber" varchar(50),
+                    "hasImage"       boolean NOT NULL DEFAULT false,
+                    "imageUrl"       text,
+                    UNIQUE ("examName", "examYear", "questionNumber")
+                )
+            ''')
+            cur.execute(f'''
+                INSERT INTO "{schema}".questions (id, "examName", "examYear", "questionNumber") VALUES
+                    ('q1', 'MOEMS Division E', 2007, '2A'),
+                    ('q2', 'MOEMS Division E', 2007, '3C'),
+                    ('q3', 'MOEMS Division E', 2008, '2A')
+            ''')
+        separator = '&' if '?' in url else '?'
+        yield conn, schema, f"{url}{separator}schema={schema}"
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f'DROP SCHEMA "{schema}" CASCADE')
+        conn.close()
+
+def select_questions(conn, schema):
+    with conn.cursor() as cur:
+        cur.execute(f'SELECT id, "hasImage", "imageUrl" FROM "{schema}".questions ORDER BY id')
+        return cur.fetchall()
+
+def test_apply_diagrams_updates_matching_questions(questions_schema):
+    conn, schema, database_url = questions_schema
+    diagrams = [
+        diagram('2A', '2007', "/images/questions/moems-2007-2A.png"),
+        diagram('3C', '2007', "/images/questions/it's-quoted.png"),
+        diagram('4B', '2007', '/images/questions/moems-2007-4B.png'),   # No such question
+    ]
+
+    assert apply_diagrams(diagrams, database_url) == (2, 1)
+    assert select_questions(conn, schema) == [
+        ('q1', True, '/images/questions/moems-2007-2A.png'),
+        ('q2', True, "/images/questions/it's-quoted.png"),
+        ('q3', False, None),
+    ]
+
+def test_dry_run_changes_nothing(questions_schema):
+    conn, schema, database_url = questions_schema
+
+    assert apply_diagrams([diagram('2A', '2008', '/images/questions/moems-2008-2A.png')], database_url,
+                          dry_run=True) == (1, 0)
+    assert select_questions(conn, schema) == [('q1', False, None), ('q2', False, None), ('q3', False, None)]
@@ -0,0 +1,44 @@
+"""Diagram detection with text-layer masking"""
+
+import fitz
+import numpy as np
+
+from diagram_detect import detect_diagram_bbox, find_diagram_bbox
+
+def test_text_rect_above_raster_keeps_diagram_ink():
+    # Band raster starting at page (50, 200); the header block ends above it
+    gray = np.full((200, 400), 255, dtype=np.uint8)
+    gray[40:160, 40:360] = 0
+    header = fitz.Rect(60, 40, 500, 80)
+
+    bbox = find_diagram_bbox(gray, (50, 200), 1.0, [header])
+
+    assert bbox == fitz.Rect(90, 240, 410, 360)
+
+def test_text_rect_left_of_raster_keeps_diagram_ink():
+    gray = np.full((200, 400), 255, dtype=np.uint8)
+    gray[40:160, 40:360] = 0
+    margin_note = fitz.Rect(0, 150, 30, 450)
+
+    bbox = find_diagram_bbox(gray, (50, 200), 1.0, [margin_note])
+
+    assert bbox == fitz.Rect(90, 240, 410, 360)
+
+def test_text_inside_band_is_masked():
+    gray = np.full((200, 400), 255, dtype=np.uint8)
+    gray[40:160, 40:360] = 0
+
+    assert find_diagram_bbox(gray, (50, 200), 1.0, [fitz.Rect(60, 220, 420, 380)]) is None
+
+def test_page_with_header_text_finds_vector_diagram():
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    page.insert_text((72, 60), "Mathematical Olympiads for Elementary and Middle Schools", fontsize=10)
+    page.insert_text((72, 200), "1A  Time: 4 minutes", fontsize=12)
+    diagram = fitz.Rect(120, 260, 320, 380)
+    page.draw_rect(diagram, color=(0, 0, 0), width=1)
+    page.draw_circle(fitz.Point(220, 320), 40, color=(0, 0, 0), width=1)
+
+    bbox = detect_diagram_bbox(page)
+
+    assert bbox is not None and bbox.contains(diagram)
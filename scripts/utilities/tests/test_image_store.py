@@ -0,0 +1,76 @@
+"""Duplicate-image store: exact-copy aliasing and detaching aliases of a rewritten diagram"""
+
+import json
+import os
+
+from PIL import Image, ImageDraw
+
+from diagram_images import encode_diagram_images, write_diagram_images
+from extraction_manifest import ExtractionManifest
+from image_store import STORE_INDEX, STORE_VERSION, ImageStore
+
+def drawing(mark=None):
+    image = Image.new('L', (300, 200), 255)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([40, 30, 260, 170], outline=0, width=3)
+    draw.line([40, 30, 260, 170], fill=0, width=2)
+    if mark is not None:
+        draw.rectangle([mark[0], mark[1], mark[0] + 4, mark[1] + 4], fill=0)
+    return image
+
+def write(directory, image, name, store, manifest=None):
+    files, meta = encode_diagram_images(image, os.path.join(directory, f"{name}.png"))
+    image_meta = write_diagram_images(files, meta, manifest, name, store)
+    if manifest is not None:
+        manifest.record_artifact(name, 'page-hash', {'image': image_meta})
+    return image_meta
+
+def test_identical_crop_is_aliased(tmp_path):
+    store = ImageStore(str(tmp_path))
+    first = write(tmp_path, drawing(), 'moems-2007-2A', store)
+    second = write(tmp_path, drawing(), 'moems-2008-2A', store)
+
+    assert second['url'] == first['url']
+    assert not os.path.exists(tmp_path / 'moems-2008-2A.png')
+    assert store.entries['moems-2007-2A.png']['aliases'] == {'moems-2008-2A.png': 'moems-2008-2A'}
+
+def test_near_duplicate_is_not_aliased(tmp_path):
+    store = ImageStore(str(tmp_path))
+    first = write(tmp_path, drawing(), 'moems-2007-2A', store)
+    second = write(tmp_path, drawing(mark=(150, 60)), 'moems-2008-2A', store)
+
+    assert second['url'] != first['url']
+    assert os.path.exists(tmp_path / 'moems-2008-2A.png')
+    assert store.entries['moems-2007-2A.png']['aliases'] == {}
+
+def test_rewritten_diagram_detaches_its_aliases(tmp_path):
+    store = ImageStore(str(tmp_path))
+    manifest = ExtractionManifest(str(tmp_path / 'manifest.json'))
+    write(tmp_path, drawing(), 'moems-2007-2A', store, manifest)
+    write(tmp_path, drawing(), 'moems-2008-2A', store, manifest)
+
+    # The 2007 page changed: its diagram is rewritten with other pixels
+    write(tmp_path, drawing(mark=(150, 60)), 'moems-2007-2A', store, manifest)
+
+    assert store.entries['moems-2007-2A.png']['aliases'] == {}
+    assert manifest.record('moems-2008-2A') is None
+    # Extracted again, the 2008 question gets its own copy of the old picture
+    again = write(tmp_path, drawing(), 'moems-2008-2A', store, manifest)
+    assert again['url'].endswith('/moems-2008-2A.png')
+
+def test_index_with_listed_aliases_loads(tmp_path):
+    store = ImageStore(str(tmp_path))
+    write(tmp_path, drawing(), 'moems-2007-2A', store)
+    write(tmp_path, drawing(), 'moems-2008-2A', store)
+    store.save()
+    with open(tmp_path / STORE_INDEX, encoding='utf-8') as f:
+        data = json.load(f)
+    for entry in data['images'].values():
+        entry['aliases'] = list(entry['aliases'])
+    with open(tmp_path / STORE_INDEX, 'w', encoding='utf-8') as f:
+        json.dump({'version': STORE_VERSION, 'images': data['images']}, f)
+
+    reloaded = ImageStore(str(tmp_path))
+
+    assert reloaded.entries['moems-2007-2A.png']['aliases'] == {'moems-2008-2A.png': None}
+    assert not reloaded.release('moems-2007-2A.png')
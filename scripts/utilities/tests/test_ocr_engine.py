@@ -0,0 +1,29 @@
+"""Tesseract command-line config as applied by the tesserocr engine"""
+
+import pytest
+
+from ocr_engine import parse_config
+
+def test_psm_oem_and_variables():
+    parsed = parse_config('--oem 1 --psm 6 -c preserve_interword_spaces=1 -c tessedit_char_whitelist=0123456789')
+
+    assert parsed['psm'] == 6
+    assert parsed['oem'] == 1
+    assert parsed['variables'] == {'preserve_interword_spaces': '1', 'tessedit_char_whitelist': '0123456789'}
+    assert parsed['configs'] == []
+
+def test_dpi_tessdata_dir_and_config_files():
+    parsed = parse_config('--dpi 300 --tessdata-dir "/opt/tess data" digits')
+
+    assert parsed['variables'] == {'user_defined_dpi': '300'}
+    assert parsed['path'] == '/opt/tess data'
+    assert parsed['configs'] == ['digits']
+    assert parsed['psm'] is None
+
+def test_empty_config():
+    assert parse_config('') == {'psm': None, 'oem': None, 'path': None, 'variables': {}, 'configs': []}
+
+@pytest.mark.parametrize('config', ['--loglevel DEBUG', '-c whitelist', '--psm'])
+def test_unsupported_or_malformed_option_raises(config):
+    with pytest.raises(ValueError):
+        parse_config(config)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Text band layout for region-restricted OCR
+
+Finds the horizontal strips of a page that hold text so only those are
+rendered at OCR resolution - not the diagram (cropped separately) or the
+empty answer space. Bands come from:
+    - the PDF text layer's block geometry when the page has one (positions
+      are right even when a broken font encoding makes the text unusable)
+    - otherwise a low-resolution ink projection profile
+Diagram regions are excluded in both cases, which also keeps diagram
+labels out of the question text.
+
+Requirements:
+    pip install pymupdf numpy
+"""
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from diagram_detect import INK_THRESHOLD, detect_diagram_bbox, pixmap_gray_array, text_block_rects
+from extraction_metrics import metrics
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+BAND_ZOOM = 1.0           # Resolution of the projection profile
+BAND_GAP = 10             # Points of blank space that separate two bands
+MIN_BAND_HEIGHT = 4       # Points; shorter ink runs are rules or specks
+BAND_PADDING = 4          # Points added around each band before OCR
+DIAGRAM_OVERLAP = 0.5     # Text blocks this much inside a diagram are labels
+
+# ============================================================================
+# BANDS
+# ============================================================================
+
+def merge_bands(rects, gap=BAND_GAP):
+    """Union rects whose vertical extents are within `gap` points, top to bottom"""
+    bands = []
+    for rect in sorted(rects, key=lambda r: r.y0):
+        if bands and rect.y0 - bands[-1].y1 < gap:
+            bands[-1] |= rect
+        else:
+            bands.append(fitz.Rect(rect))
+    return bands
+
+def layer_bands(page, diagram=None):
+    """Bands from the text layer's block rects, or [] for a page without one"""
+    blocks = text_block_rects(page)
+    if diagram is not None:
+        blocks = [
+            block for block in blocks
+            if (block & diagram).get_area() <= DIAGRAM_OVERLAP * block.get_area()
+        ]
+    return merge_bands(blocks)
+
+def projection_bands(page, diagram=None):
+    """Bands from rows of ink in a low-resolution grayscale render"""
+    with metrics.span('render'):
+        pix = page.get_pixmap(matrix=fitz.Matrix(BAND_ZOOM, BAND_ZOOM), colorspace=fitz.csGRAY)
+    ink = pixmap_gray_array(pix) < INK_THRESHOLD
+    if diagram is not None:
+        x0, y0, x1, y1 = (int(round(v * BAND_ZOOM)) for v in diagram)
+        ink[max(0, y0):max(0, y1), max(0, x0):max(0, x1)] = False
+
+    # Start/end rows of each run of inked rows
+    rows = np.concatenate(([0], ink.any(axis=1).astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(rows))
+    runs = edges.reshape(-1, 2)
+
+    rects = []
+    for top, bottom in runs:
+        if (bottom - top) / BAND_ZOOM < MIN_BAND_HEIGHT:
+            continue
+        cols = np.flatnonzero(ink[top:bottom].any(axis=0))
+        rects.append(fitz.Rect(cols[0], top, cols[-1] + 1, bottom) / BAND_ZOOM)
+    return merge_bands(rects)
+
+def text_bands(page):
+    """
+    Text bands of a page, top to bottom, padded and clipped to the page
+    Returns (bands, source) where source is 'layer' or 'projection'
+    """
+    diagram = detect_diagram_bbox(page)
+
+    bands, source = layer_bands(page, diagram), 'layer'
+    if not bands:
+        bands, source = projection_bands(page, diagram), 'projection'
+
+    padded = [
+        fitz.Rect(b.x0 - BAND_PADDING, b.y0 - BAND_PADDING, b.x1 + BAND_PADDING, b.y1 + BAND_PADDING) & page.rect
+        for b in bands
+    ]
+    return [band for band in padded if not band.is_empty], source